@@ -0,0 +1,160 @@
+import threading
+
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+MODEL_NAMES = {
+    "v3": "deepseek-chat",
+    "r1": "deepseek-reasoner",
+}
+
+
+def preload_sdk():
+    # Importing openai pulls in httpx, pydantic and friends; it is done
+    # lazily so startup doesn't pay for it before the window is up.
+    import httpx
+    import openai
+    return openai
+
+
+def usage_details(usage):
+    if usage is None:
+        return {}
+    details = {
+        'prompt_tokens': usage.prompt_tokens or 0,
+        'completion_tokens': usage.completion_tokens or 0,
+        'total_tokens': usage.total_tokens or 0
+    }
+    completion_details = getattr(usage, 'completion_tokens_details', None)
+    reasoning = getattr(completion_details, 'reasoning_tokens', None) if completion_details else None
+    if reasoning:
+        details['reasoning_tokens'] = reasoning
+    # DeepSeek reports context-cache hits as extra usage fields
+    hit = getattr(usage, 'prompt_cache_hit_tokens', None)
+    miss = getattr(usage, 'prompt_cache_miss_tokens', None)
+    if hit is None:
+        prompt_details = getattr(usage, 'prompt_tokens_details', None)
+        hit = getattr(prompt_details, 'cached_tokens', None) if prompt_details else None
+    if hit is not None:
+        details['prompt_cache_hit_tokens'] = hit
+        details['prompt_cache_miss_tokens'] = miss if miss is not None else details['prompt_tokens'] - hit
+    return details
+
+
+def parse_completion(response):
+    if not response.choices or not response.choices[0].message:
+        return None
+    message = response.choices[0].message
+    return {
+        'content': message.content or "",
+        'reasoning_content': getattr(message, 'reasoning_content', None) or "",
+        'usage': response.usage.total_tokens if response.usage else 0,
+        'usage_details': usage_details(response.usage)
+    }
+
+
+class ClientManager:
+    def __init__(self, timeout=600.0, connect_timeout=10.0, pool_size=10, keepalive_expiry=120.0):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.clients = {}
+        # Clients replaced by configure(), closed once nothing uses them
+        self.retired = []
+        self.lock = threading.Lock()
+
+    def configure(self, **options):
+        changed = False
+        for key, value in options.items():
+            if not hasattr(self, key):
+                raise AttributeError(f"Unknown client option: {key}")
+            if getattr(self, key) != value:
+                setattr(self, key, value)
+                changed = True
+        if changed:
+            # In-flight requests keep their client; new sends get a fresh one
+            with self.lock:
+                self.retired.extend(self.clients.values())
+                self.clients = {}
+        return changed
+
+    def close_retired(self, in_use=()):
+        in_use = {id(client) for client in in_use}
+        with self.lock:
+            idle = [client for client in self.retired if id(client) not in in_use]
+            self.retired = [client for client in self.retired if id(client) in in_use]
+        for client in idle:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def get_client(self, api_key, base_url=None):
+        if not api_key:
+            return None
+        key = (api_key, (base_url or DEFAULT_BASE_URL).rstrip("/"))
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = self._build_client(*key)
+                self.clients[key] = client
+            return client
+
+    def _build_client(self, api_key, base_url):
+        import httpx
+        from openai import OpenAI
+        # One httpx pool per client keeps TLS connections alive between sends.
+        # The SDK's own retries are off: RequestEngine and BatchRunner retry
+        # through rate_limit, so waits show up and count against the limits.
+        http_client = httpx.Client(
+            timeout=self._timeout(),
+            limits=self._limits(),
+            follow_redirects=True
+        )
+        return OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=self._timeout(),
+            max_retries=0,
+            http_client=http_client
+        )
+
+    def build_async_client(self, api_key, base_url=None):
+        # Async clients are bound to the event loop that uses them, so they
+        # are not cached here; the caller owns and closes them.
+        import httpx
+        from openai import AsyncOpenAI
+        http_client = httpx.AsyncClient(
+            timeout=self._timeout(),
+            limits=self._limits(),
+            follow_redirects=True
+        )
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=(base_url or DEFAULT_BASE_URL).rstrip("/"),
+            timeout=self._timeout(),
+            max_retries=0,
+            http_client=http_client
+        )
+
+    def _timeout(self):
+        import httpx
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def close(self):
+        with self.lock:
+            clients = list(self.clients.values()) + self.retired
+            self.clients = {}
+            self.retired = []
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
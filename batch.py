@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import asyncio
+from api_client import ClientManager, MODEL_NAMES, parse_completion
+from config_store import ConfigManager
+from log_setup import setup_logging
+from context_builder import ContextBuilder, compose_prompt
+from conversation_store import read_log, read_log_entries, LOG_ENCODING
+from sqlite_store import SqliteConversationStore
+from response_cache import ResponseCache, cache_key
+from usage_ledger import UsageLedger, entry_cost, merge_prices
+from rate_limit import RequestGate, RetryPolicy, classify_error, estimate_tokens
+
+
+def load_prompts(path):
+    prompts = []
+    with open(path, 'r', encoding=LOG_ENCODING) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_no}: {e}")
+            if isinstance(item, str):
+                item = {'prompt': item}
+            if 'prompt' not in item:
+                raise ValueError(f"{path}:{line_no}: missing 'prompt'")
+            prompts.append(item)
+    return prompts
+
+
+def load_done_indices(output_path):
+    if not os.path.exists(output_path):
+        return set()
+    return {entry['batch_index'] for entry in read_log_entries(output_path) if 'batch_index' in entry}
+
+
+class BatchRunner:
+    def __init__(self, client, output_path, context_builder, history=None, model="v3", temperature=0.7,
+                 prefix="", suffix="", concurrency=4, gate=None, retry_policy=None, cache=None, ledger=None,
+                 prices=None, fallback_price=0.0, log=sys.stderr):
+        self.client = client
+        self.output_path = output_path
+        self.errors_path = output_path + ".errors.jsonl"
+        self.context_builder = context_builder
+        self.history = history or []
+        self.model = model
+        self.temperature = temperature
+        self.prefix = prefix
+        self.suffix = suffix
+        self.concurrency = max(1, concurrency)
+        self.gate = gate or RequestGate()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.cache = cache
+        self.ledger = ledger
+        self.prices = prices
+        self.fallback_price = fallback_price
+        self.ledger_key = "batch:" + os.path.basename(output_path)
+        self.log = log
+        self.stats = {'completed': 0, 'failed': 0, 'skipped': 0, 'tokens': 0, 'cache_hits': 0, 'cost': 0.0,
+                      'retries': 0}
+
+    def build_request(self, item):
+        prefix = item.get('prefix', self.prefix)
+        leading_messages = []
+        if self.context_builder.stable_prefix:
+            if prefix:
+                leading_messages.append({"role": "system", "content": prefix})
+            prefix = ""
+        full_prompt = compose_prompt(prefix, item['prompt'], item.get('suffix', self.suffix))
+        model_key = item.get('model', self.model)
+        model = MODEL_NAMES.get(model_key, model_key)
+        temperature = item.get('temperature', self.temperature)
+        messages = self.context_builder.build(self.history, full_prompt, leading_messages)
+        return full_prompt, model, temperature, messages
+
+    async def run_one(self, index, item, semaphore):
+        full_prompt, model, temperature, messages = self.build_request(item)
+        key = None
+        result = None
+        if self.cache is not None and not item.get('bypass_cache'):
+            key = cache_key(model, temperature, messages)
+            result = self.cache.get(key)
+        cache_hit = result is not None
+        if not cache_hit:
+            async with semaphore:
+                result, error = await self.call_api(model, messages, temperature)
+            if error is not None:
+                return index, None, error
+            if key is not None:
+                self.cache.put(key, result)
+        entry = {
+            'prompt': full_prompt,
+            'response': result['content'],
+            'usage': 0 if cache_hit else result['usage'],
+            'timestamp': time.time(),
+            'model': model,
+            'batch_index': index
+        }
+        if result['reasoning_content']:
+            entry['reasoning_content'] = result['reasoning_content']
+        if cache_hit:
+            entry['cache_hit'] = True
+        elif result.get('usage_details'):
+            entry['usage_details'] = result['usage_details']
+        return index, entry, None
+
+    async def call_api(self, model, messages, temperature):
+        # (result, error); 429/5xx and connection errors back off and retry
+        tokens = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            await self.wait_for_gate(tokens)
+            self.gate.acquire(tokens)
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=False,
+                    temperature=temperature
+                )
+            except Exception as e:
+                retryable, retry_after = classify_error(e)
+                if not retryable:
+                    self.gate.responded(tokens)
+                    return None, f"API Error: {str(e)}"
+                self.gate.throttled(retry_after)
+                if attempt >= self.retry_policy.max_retries:
+                    return None, f"API Error: {str(e)}"
+                delay = self.retry_policy.delay(attempt, retry_after)
+                attempt += 1
+                self.stats['retries'] += 1
+                await asyncio.sleep(delay)
+                continue
+            result = parse_completion(response)
+            self.gate.responded(tokens, result['usage'] if result else None)
+            if result is None:
+                return None, "API Error: Invalid API response"
+            return result, None
+
+    async def wait_for_gate(self, tokens):
+        # One event loop, so nothing else takes the room between the last
+        # check and the caller's acquire
+        while True:
+            seconds = self.gate.wait_time(tokens)[0]
+            if seconds <= 0:
+                return
+            await asyncio.sleep(seconds)
+
+    async def run(self, prompts, resume=True):
+        done = load_done_indices(self.output_path) if resume else set()
+        pending = [i for i in range(len(prompts)) if i not in done]
+        self.stats['skipped'] = len(prompts) - len(pending)
+        if not pending:
+            return self.stats
+
+        directory = os.path.dirname(self.output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self.run_one(i, prompts[i], semaphore)) for i in pending]
+
+        # Results are written in input order: a finished item waits here
+        # until everything before it has been written.
+        finished = {}
+        next_pos = 0
+        reported = 0
+        start = time.monotonic()
+        with open(self.output_path, 'a', encoding=LOG_ENCODING) as out, \
+                open(self.errors_path, 'a', encoding="utf-8") as errors:
+            for future in asyncio.as_completed(tasks):
+                index, entry, error = await future
+                finished[index] = (entry, error)
+                while next_pos < len(pending) and pending[next_pos] in finished:
+                    entry, error = finished.pop(pending[next_pos])
+                    if entry is not None:
+                        out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                        self.stats['completed'] += 1
+                        self.stats['tokens'] += entry['usage']
+                        self.record_cost(entry)
+                        if entry.get('cache_hit'):
+                            self.stats['cache_hits'] += 1
+                    else:
+                        errors.write(json.dumps({'batch_index': pending[next_pos], 'error': error}, ensure_ascii=False) + "\n")
+                        self.stats['failed'] += 1
+                    next_pos += 1
+                out.flush()
+                errors.flush()
+                if next_pos // 10 > reported // 10 or next_pos == len(pending):
+                    self.report_progress(next_pos, len(pending), time.monotonic() - start)
+                    reported = next_pos
+        self.stats['elapsed'] = time.monotonic() - start
+        return self.stats
+
+    def record_cost(self, entry):
+        cost = entry_cost(entry, self.prices, self.fallback_price)
+        self.stats['cost'] += cost
+        if self.ledger is not None:
+            try:
+                self.ledger.record(self.ledger_key, entry, cost)
+            except Exception as e:
+                if self.log is not None:
+                    self.log.write(f"Usage ledger update failed: {e}\n")
+
+    def report_progress(self, done, total, elapsed):
+        if self.log is None:
+            return
+        rate = done / elapsed if elapsed > 0 else 0.0
+        self.log.write(f"[{done}/{total}] {rate:.2f} req/s\n")
+        self.log.flush()
+
+
+def print_summary(stats, out=sys.stdout):
+    elapsed = stats.get('elapsed', 0.0)
+    handled = stats['completed'] + stats['failed']
+    req_rate = handled / elapsed if elapsed > 0 else 0.0
+    token_rate = stats['tokens'] / elapsed if elapsed > 0 else 0.0
+    out.write(f"Completed: {stats['completed']}  Failed: {stats['failed']}  Skipped (resumed): {stats['skipped']}"
+              f"  Cache hits: {stats['cache_hits']}  Retries: {stats.get('retries', 0)}"
+              f"  Cost: ${stats.get('cost', 0.0):.6f}\n")
+    out.write(f"Elapsed: {elapsed:.2f}s  Throughput: {req_rate:.2f} requests/sec, {token_rate:.1f} tokens/sec\n")
+
+
+def find_conversation(config, name_or_id):
+    for conv in config.get('conversations', []):
+        if conv.get('id') == name_or_id or conv.get('name') == name_or_id:
+            return conv
+    return None
+
+
+def load_history(args, config):
+    if args.history:
+        return read_log(args.history)[0]
+    if not args.conversation:
+        return []
+    if config.get('conversation_storage') == "sqlite":
+        store = SqliteConversationStore()
+        try:
+            conv = next((conv for conv in store.list_conversations()
+                         if args.conversation in (conv['id'], conv['name'])), None)
+            if conv is None:
+                raise ValueError(f"Unknown conversation: {args.conversation}")
+            return list(store.iter_entries(conv))
+        finally:
+            store.close()
+    conv = find_conversation(config, args.conversation)
+    if conv is None:
+        raise ValueError(f"Unknown conversation: {args.conversation}")
+    # Older configs don't record the file; the GUI assumes the same default
+    return read_log(conv.get('file') or f"log/{conv['id']}.txt")[0]
+
+
+async def run_batch(args, config):
+    api_key = args.api_key or os.environ.get("DEEPSEEK_API_KEY") or config.get('api_key')
+    if not api_key:
+        raise ValueError("No API key: pass --api-key, set DEEPSEEK_API_KEY or save one in config.json")
+
+    history = load_history(args, config)
+
+    context_builder = ContextBuilder(
+        token_budget=config.get('context_token_budget', 32000),
+        max_turns=config.get('history_limit', 10),
+        keep_first_turn=config.get('context_keep_first', False),
+        truncate_oversized=config.get('context_truncate_oversized', True),
+        summary_placeholder=config.get('context_placeholder', True),
+        stable_prefix=config.get('stable_prefix_layout', False)
+    )
+    manager = ClientManager(
+        timeout=config.get('request_timeout', 600.0),
+        pool_size=max(args.concurrency, config.get('pool_size', 10))
+    )
+    client = manager.build_async_client(api_key, args.base_url or config.get('base_url'))
+    output = args.output or os.path.join("log", os.path.splitext(os.path.basename(args.batch))[0] + ".txt")
+    cache = None
+    if config.get('response_cache_enabled') and not args.no_cache:
+        cache = ResponseCache(
+            max_bytes=config.get('response_cache_mb', 100) * 1024 * 1024,
+            ttl=config.get('response_cache_ttl_hours', 168) * 3600
+        )
+    ledger = UsageLedger()
+    runner = BatchRunner(
+        client, output, context_builder,
+        history=history,
+        model=args.model,
+        temperature=args.temperature,
+        prefix=args.prefix,
+        suffix=args.suffix,
+        concurrency=args.concurrency,
+        # The flags override the GUI's limits from config.json
+        gate=RequestGate(
+            requests_per_minute=args.rate_limit or config.get('requests_per_minute', 0),
+            tokens_per_minute=args.token_limit or config.get('tokens_per_minute', 0),
+            breaker_threshold=config.get('circuit_breaker_failures', 5),
+            breaker_cooldown=config.get('circuit_breaker_cooldown', 30.0)
+        ),
+        retry_policy=RetryPolicy(max_retries=config.get('max_retries', 2)),
+        cache=cache,
+        ledger=ledger,
+        prices=merge_prices(config.get('model_prices')),
+        fallback_price=config.get('price_per_token', 0.0)
+    )
+    try:
+        stats = await runner.run(load_prompts(args.batch), resume=not args.no_resume)
+    finally:
+        await client.close()
+        if cache is not None:
+            cache.close()
+        ledger.close()
+    stats['output'] = output
+    return stats
+
+
+def run_batch_cli(args):
+    config_manager = ConfigManager()
+    config = config_manager.load_config()
+    setup_logging(getattr(args, 'log_level', None) or config.get('log_level', "INFO"))
+    if config_manager.load_error:
+        sys.stderr.write(f"Can't Read Config: {config_manager.load_error}\n")
+    try:
+        stats = asyncio.run(run_batch(args, config))
+    except KeyboardInterrupt:
+        sys.stderr.write("Interrupted; re-run the same command to resume.\n")
+        return 130
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+    print_summary(stats)
+    print(f"Output: {stats['output']}")
+    return 1 if stats['failed'] else 0
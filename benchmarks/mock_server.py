@@ -0,0 +1,130 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockDeepSeekHandler(BaseHTTPRequestHandler):
+    # OpenAI-compatible /chat/completions that echoes the last user message.
+    # Latency is shaped by the server's first_token_delay, chunk_delay and
+    # chunk_count; reasoner models also stream reasoning_content.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+        self.server.request_count += 1
+        model = body.get('model', 'deepseek-chat')
+        reply = self.server.reply_text(body)
+        usage = {
+            "prompt_tokens": 100,
+            "completion_tokens": self.server.chunk_count,
+            "total_tokens": 100 + self.server.chunk_count,
+            "prompt_cache_hit_tokens": 64,
+            "prompt_cache_miss_tokens": 36
+        }
+        if body.get('stream'):
+            self.stream_reply(model, reply, usage)
+        else:
+            time.sleep(self.server.first_token_delay + self.server.chunk_delay * self.server.chunk_count)
+            message = {"role": "assistant", "content": reply}
+            if model == "deepseek-reasoner":
+                message["reasoning_content"] = "thinking"
+            self.send_json({
+                "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+    def send_json(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_chunk(self, payload):
+        data = b"data: " + (payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")) + b"\n\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def stream_reply(self, model, reply, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        count = max(1, self.server.chunk_count)
+        step = max(1, -(-len(reply) // count))
+        pieces = [reply[i:i + step] for i in range(0, len(reply), step)] or [""]
+        try:
+            time.sleep(self.server.first_token_delay)
+            for piece in pieces:
+                delta = {"content": piece}
+                if model == "deepseek-reasoner":
+                    delta["reasoning_content"] = "."
+                self.send_chunk({"id": "mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                                 "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+                if self.server.chunk_delay:
+                    time.sleep(self.server.chunk_delay)
+            self.send_chunk({"id": "mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                             "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage})
+            self.send_chunk(b"[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled mid-stream
+            pass
+
+
+class MockDeepSeekServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, first_token_delay=0.0, chunk_delay=0.0, chunk_count=20, reply_size=None):
+        super().__init__(("127.0.0.1", port), MockDeepSeekHandler)
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.chunk_count = chunk_count
+        self.reply_size = reply_size
+        self.request_count = 0
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def reply_text(self, body):
+        if self.reply_size:
+            return ("mock " * (self.reply_size // 5 + 1))[:self.reply_size]
+        messages = body.get('messages') or [{}]
+        return "echo: " + str(messages[-1].get('content', ''))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Mock DeepSeek (OpenAI-compatible) server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--chunk-delay", type=float, default=0.02)
+    parser.add_argument("--chunks", type=int, default=20)
+    args = parser.parse_args()
+    server = MockDeepSeekServer(args.port, args.first_token_delay, args.chunk_delay, args.chunks)
+    print(f"Mock DeepSeek server on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
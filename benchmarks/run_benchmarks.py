@@ -0,0 +1,348 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from mock_server import MockDeepSeekServer
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SUITES = ("tokens", "load_history", "build_history", "history_list", "send_prompt")
+
+SIZES = {
+    'full': {
+        'tokens': [1000, 10000, 50000, 200000],
+        'log_entries': [1000, 10000, 50000],
+        'context_entries': 10000,
+        'list_entries': [1000, 5000, 20000],
+        'sends': 10
+    },
+    'quick': {
+        'tokens': [1000, 10000],
+        'log_entries': [1000, 5000],
+        'context_entries': 2000,
+        'list_entries': [1000, 5000],
+        'sends': 3
+    }
+}
+
+
+def timings(samples):
+    ms = [s * 1000 for s in samples]
+    return {
+        'runs': len(ms),
+        'min_ms': round(min(ms), 3),
+        'median_ms': round(statistics.median(ms), 3),
+        'mean_ms': round(statistics.mean(ms), 3),
+        'max_ms': round(max(ms), 3)
+    }
+
+
+def measure(fn, repeat=5, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return timings(samples)
+
+
+def make_text(approx_tokens, seed=0):
+    # ~1 token per short word; mixed with CJK lines like real conversations
+    words = ["alpha", "beta", "gamma", "delta", "token", "context", "stream", "queue", "中文", "測試"]
+    lines = []
+    count = 0
+    line_no = seed
+    while count < approx_tokens:
+        line = " ".join(words[(line_no + i) % len(words)] for i in range(12))
+        lines.append(f"{line_no}: {line}")
+        count += 14
+        line_no += 1
+    return "\n".join(lines)
+
+
+def make_entries(count, prompt_tokens=40, response_tokens=200):
+    now = time.time() - count
+    return [{
+        'prompt': make_text(prompt_tokens, i),
+        'response': make_text(response_tokens, i + 7),
+        'usage': prompt_tokens + response_tokens,
+        'timestamp': now + i,
+        'model': "deepseek-chat"
+    } for i in range(count)]
+
+
+def write_log(path, entries):
+    with open(path, 'w', encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class BenchmarkRun:
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.workdir = tempfile.mkdtemp(prefix="deepseek-bench-")
+        self.old_cwd = os.getcwd()
+        self.app = None
+        self.window = None
+
+    def __enter__(self):
+        # Everything the app writes (config, logs, caches) stays in a temp dir
+        os.chdir(self.workdir)
+        os.makedirs("log", exist_ok=True)
+        cache_dir = os.path.join(ROOT, "cache", "tiktoken")
+        if "TIKTOKEN_CACHE_DIR" not in os.environ and os.path.isdir(cache_dir):
+            os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+        return self
+
+    def __exit__(self, *exc):
+        if self.window is not None:
+            self.window.close()
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def gui(self):
+        if self.window is None:
+            from PyQt5.QtWidgets import QApplication
+            import deepseek_ui
+            self.app = QApplication.instance() or QApplication([])
+            self.window = deepseek_ui.DeepSeekUI()
+            self.window.show()
+            self.app.processEvents()
+        return self.window
+
+    def add_conversation(self, conv_id, entries):
+        window = self.gui()
+        conv = {'id': conv_id, 'name': conv_id, 'file': os.path.join("log", f"{conv_id}.txt")}
+        write_log(conv['file'], entries)
+        window.store.refresh_metadata(conv)
+        window.conversations[conv_id] = conv
+        return conv
+
+    def spin_until(self, predicate, timeout=30.0):
+        end = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > end:
+                raise TimeoutError("benchmark step timed out")
+            self.app.processEvents()
+            time.sleep(0.0005)
+
+    def bench_tokens(self):
+        from token_counter import IncrementalTokenCounter, get_encoding
+        window = self.gui()
+        results = {'encoding': "tiktoken" if get_encoding() is not None else "fallback (len/4)"}
+        for n in self.sizes['tokens']:
+            text = make_text(n)
+            repeat = 3 if n >= 50000 else 5
+            counter = IncrementalTokenCounter()
+            results[f"calculate_tokens_{n}"] = measure(lambda: window.calculate_tokens(text), repeat)
+            results[f"incremental_cold_{n}"] = measure(lambda: counter.count(text), 1, setup=counter.clear)
+            counter.count(text)
+            edited = text + " x"
+            results[f"incremental_edit_{n}"] = measure(lambda: counter.count(edited), repeat)
+        return results
+
+    def bench_load_history(self):
+        window = self.gui()
+        results = {}
+        for n in self.sizes['log_entries']:
+            conv = self.add_conversation(f"load_{n}", make_entries(n))
+            results[f"file_mb_{n}"] = round(os.path.getsize(conv['file']) / 1024 / 1024, 2)
+            results[f"load_conversation_history_{n}"] = measure(
+                lambda: window.load_conversation_history(conv['id']), 3)
+            results[f"store_get_history_cold_{n}"] = measure(
+                lambda: window.store.get_history(conv), 3, setup=lambda: window.store.forget(conv['id']))
+            from log_migration import migrate_conversation
+            migrate_conversation(conv, compact=True)
+            results[f"compact_file_mb_{n}"] = round(os.path.getsize(conv['file']) / 1024 / 1024, 2)
+            results[f"compact_get_history_cold_{n}"] = measure(
+                lambda: window.store.get_history(conv), 3, setup=lambda: window.store.forget(conv['id']))
+        return results
+
+    def bench_build_history(self):
+        window = self.gui()
+        n = self.sizes['context_entries']
+        conv = self.add_conversation("context", make_entries(n))
+        window.store.get_history(conv)
+        prompt = make_text(200)
+        results = {'entries': n}
+        results['build_history_messages_cold'] = measure(
+            lambda: window.build_history_messages(prompt, conv, ""), 3,
+            setup=window.context_builder.invalidate)
+        results['build_history_messages_warm'] = measure(
+            lambda: window.build_history_messages(prompt, conv, ""), 20)
+        window.context_builder.stable_prefix = True
+        results['build_history_messages_stable_prefix'] = measure(
+            lambda: window.build_history_messages(prompt, conv, "system prefix"), 20)
+        window.context_builder.stable_prefix = False
+        results['last_stats'] = dict(window.context_builder.last_stats)
+        return results
+
+    def bench_history_list(self):
+        window = self.gui()
+        results = {}
+        for n in self.sizes['list_entries']:
+            conv = self.add_conversation(f"list_{n}", make_entries(n, 20, 120))
+            history = window.store.get_history(conv)
+
+            def show():
+                window.history_model.set_history([])
+                window.current_conversation = conv
+                window.update_history_list()
+                window.history_list.doItemsLayout()
+                self.app.processEvents()
+
+            results[f"update_history_list_{n}"] = measure(show, 3)
+
+            def append_one():
+                history.append(make_entries(1, 20, 120)[0])
+                window.update_history_list()
+                window.history_list.doItemsLayout()
+                self.app.processEvents()
+
+            results[f"append_entry_{n}"] = measure(append_one, 5)
+            window.history_list.resize(window.history_list.width() + 40, window.history_list.height())
+            results[f"relayout_after_resize_{n}"] = measure(
+                lambda: (window.history_list.doItemsLayout(), self.app.processEvents()), 3)
+        window.current_conversation = None
+        return results
+
+    def bench_send_prompt(self):
+        window = self.gui()
+        results = {}
+        profiles = {
+            'stream_fast': dict(stream=True, first_token_delay=0.0, chunk_delay=0.0, chunk_count=50),
+            'stream_slow': dict(stream=True, first_token_delay=0.2, chunk_delay=0.01, chunk_count=50),
+            'blocking': dict(stream=False, first_token_delay=0.05, chunk_delay=0.0, chunk_count=50)
+        }
+        for name, profile in profiles.items():
+            server = MockDeepSeekServer(first_token_delay=profile['first_token_delay'],
+                                        chunk_delay=profile['chunk_delay'],
+                                        chunk_count=profile['chunk_count'], reply_size=2000).start()
+            try:
+                window.api_key_input.setText("bench-key")
+                window.base_url_input.setText(server.base_url)
+                window.stream_response = profile['stream']
+                window.response_cache_enabled = False
+                window.new_conversation()
+                conv = window.current_conversation
+                first_chunk = []
+                completed = []
+                on_chunk = lambda *args: first_chunk.append(time.perf_counter()) if not first_chunk else None
+                on_done = lambda *args: completed.append(time.perf_counter())
+                window.request_engine.request_chunk.connect(on_chunk)
+                window.request_engine.request_completed.connect(on_done)
+                ttfc = []
+                total = []
+                send_call = []
+                try:
+                    for i in range(self.sizes['sends']):
+                        first_chunk.clear()
+                        completed.clear()
+                        before = len(window.get_history(conv))
+                        window.prompt_input.setPlainText(f"benchmark prompt {i}")
+                        start = time.perf_counter()
+                        window.send_prompt()
+                        send_call.append(time.perf_counter() - start)
+                        self.spin_until(lambda: len(window.get_history(conv)) > before)
+                        total.append(time.perf_counter() - start)
+                        if first_chunk:
+                            ttfc.append(first_chunk[0] - start)
+                finally:
+                    window.request_engine.request_chunk.disconnect(on_chunk)
+                    window.request_engine.request_completed.disconnect(on_done)
+                results[name] = {
+                    'server': profile,
+                    'send_prompt_call': timings(send_call),
+                    'end_to_end': timings(total)
+                }
+                if ttfc:
+                    results[name]['time_to_first_chunk'] = timings(ttfc)
+            finally:
+                server.stop()
+        return results
+
+
+def environment():
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'qt_platform': os.environ.get("QT_QPA_PLATFORM")
+    }
+    try:
+        import subprocess
+        info['git_commit'] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                            capture_output=True, text=True).stdout.strip()
+    except Exception:
+        pass
+    return info
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and 'median_ms' in value:
+            flat[name] = value['median_ms']
+        elif isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+    return flat
+
+
+def compare(baseline_path, results, out=sys.stdout):
+    with open(baseline_path, 'r', encoding="utf-8") as f:
+        baseline = flatten(json.load(f)['results'])
+    current = flatten(results)
+    out.write(f"{'benchmark':<60} {'base ms':>10} {'now ms':>10} {'ratio':>7}\n")
+    for name in sorted(current):
+        if name not in baseline:
+            continue
+        ratio = current[name] / baseline[name] if baseline[name] else float('inf')
+        flag = "  <-- slower" if ratio > 1.2 else ""
+        out.write(f"{name:<60} {baseline[name]:>10.2f} {current[name]:>10.2f} {ratio:>7.2f}{flag}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the client's hot paths")
+    parser.add_argument("--only", nargs="+", choices=SUITES, help="run only these suites")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs, for a fast sanity run")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/bench-<time>.json)")
+    parser.add_argument("--compare", metavar="FILE", help="print median ratios against an earlier result file")
+    args = parser.parse_args(argv)
+
+    sizes = SIZES['quick' if args.quick else 'full']
+    results = {}
+    with BenchmarkRun(sizes) as run:
+        for suite in args.only or SUITES:
+            sys.stderr.write(f"running {suite}...\n")
+            start = time.perf_counter()
+            results[suite] = getattr(run, "bench_" + suite)()
+            sys.stderr.write(f"  done in {time.perf_counter() - start:.1f}s\n")
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("bench-%Y%m%d-%H%M%S.json"))
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, 'w', encoding="utf-8") as f:
+        json.dump({'created': time.time(), 'sizes': 'quick' if args.quick else 'full',
+                   'environment': environment(), 'results': results}, f, indent=2, ensure_ascii=False)
+    print(f"Results: {output}")
+    if args.compare:
+        compare(args.compare, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
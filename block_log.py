@@ -0,0 +1,322 @@
+import os
+import zlib
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from log_index import parse_entry
+
+BLOCK_LOG_SUFFIX = ".gz"
+GZIP_MAGIC = b"\x1f\x8b"
+GZIP_DEFLATE = 8
+GZIP_FEXTRA = 4
+# A block is one gzip member holding JSONL lines, so `zcat` reads the whole
+# log. Like BGZF, each member header carries an extra field ("DS": member
+# size, entry lines, tombstone lines), and the headers alone form the block
+# index: entries are found without decompressing anything else.
+MEMBER_HEADER = struct.Struct("<2sBBIBBH2sHIHH")
+MEMBER_TRAILER = struct.Struct("<II")
+EXTRA_ID = b"DS"
+EXTRA_LENGTH = 8
+MAX_BLOCK_BYTES = 256 * 1024
+MAX_BLOCK_LINES = 0xFFFF
+# Blocks holding less than this (uncompressed) are worth compacting
+SMALL_BLOCK_BYTES = 16 * 1024
+COMPRESS_LEVEL = 6
+TOMBSTONE_MARKER = b'"_tombstone"'
+# Decompressed blocks kept per open log
+BLOCK_CACHE_SIZE = 8
+# Rough decompressed size per compressed byte, used for memory budgets
+BLOCK_LOG_EXPANSION = 4
+
+
+def is_block_log(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            magic = f.read(2)
+    except OSError:
+        magic = b""
+    if magic:
+        return magic == GZIP_MAGIC
+    # Not written yet: the name decides
+    return file_path.endswith(BLOCK_LOG_SUFFIX)
+
+
+def encode_block(lines):
+    raw = b"".join(lines)
+    tombstones = sum(1 for line in lines if TOMBSTONE_MARKER in line)
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = compressor.compress(raw) + compressor.flush()
+    size = MEMBER_HEADER.size + len(body) + MEMBER_TRAILER.size
+    header = MEMBER_HEADER.pack(GZIP_MAGIC, GZIP_DEFLATE, GZIP_FEXTRA, 0, 0, 255, 4 + EXTRA_LENGTH,
+                                EXTRA_ID, EXTRA_LENGTH, size, len(lines) - tombstones, tombstones)
+    return header + body + MEMBER_TRAILER.pack(zlib.crc32(raw), len(raw) & 0xFFFFFFFF)
+
+
+def decode_block(data):
+    raw = zlib.decompress(data[MEMBER_HEADER.size:-MEMBER_TRAILER.size], -zlib.MAX_WBITS)
+    crc, _ = MEMBER_TRAILER.unpack(data[-MEMBER_TRAILER.size:])
+    if zlib.crc32(raw) != crc:
+        raise ValueError("corrupt log block (crc mismatch)")
+    return raw.splitlines(keepends=True)
+
+
+def split_blocks(lines):
+    # Groups encoded lines into blocks of up to MAX_BLOCK_BYTES
+    block = []
+    size = 0
+    for line in lines:
+        if block and (size + len(line) > MAX_BLOCK_BYTES or len(block) >= MAX_BLOCK_LINES):
+            yield block
+            block = []
+            size = 0
+        block.append(line)
+        size += len(line)
+    if block:
+        yield block
+
+
+def parse_header(data, offset, file_size):
+    if len(data) < MEMBER_HEADER.size:
+        return None
+    magic, method, flags, _, _, _, xlen, extra_id, extra_length, size, entries, tombstones = \
+        MEMBER_HEADER.unpack(data[:MEMBER_HEADER.size])
+    if (magic != GZIP_MAGIC or method != GZIP_DEFLATE or flags != GZIP_FEXTRA or extra_id != EXTRA_ID
+            or extra_length != EXTRA_LENGTH or size < MEMBER_HEADER.size + MEMBER_TRAILER.size
+            or offset + size > file_size):
+        return None
+    return size, entries, tombstones
+
+
+def scan_blocks(f, start=0, file_size=None):
+    # (offset, size, entry lines, tombstone lines) of each complete block
+    # from `start`, and where the last one ends. A torn block (a crash mid
+    # append) is skipped by searching for the next block header.
+    if file_size is None:
+        file_size = os.fstat(f.fileno()).st_size
+    blocks = []
+    offset = start
+    end = start
+    while offset < file_size:
+        f.seek(offset)
+        header = parse_header(f.read(MEMBER_HEADER.size), offset, file_size)
+        if header is None:
+            if offset == 0:
+                raise ValueError("not a block-compressed log")
+            offset = resync(f, offset + 1, file_size)
+            continue
+        size, entries, tombstones = header
+        if offset + size < file_size:
+            f.seek(offset + size)
+            if parse_header(f.read(MEMBER_HEADER.size), offset + size, file_size) is None:
+                # A torn block that later appends ran past: it claims bytes
+                # of the block after it
+                next_block = resync(f, offset + 1, file_size)
+                if next_block < offset + size:
+                    offset = next_block
+                    continue
+        blocks.append((offset, size, entries, tombstones))
+        offset += size
+        end = offset
+    return blocks, end
+
+
+def resync(f, offset, file_size):
+    pattern = GZIP_MAGIC + bytes([GZIP_DEFLATE, GZIP_FEXTRA])
+    f.seek(offset)
+    data = f.read()
+    position = 0
+    while True:
+        position = data.find(pattern, position)
+        if position < 0:
+            return file_size
+        candidate = offset + position
+        if parse_header(data[position:position + MEMBER_HEADER.size], candidate, file_size) is not None:
+            return candidate
+        position += 1
+
+
+def read_block(f, block):
+    f.seek(block[0])
+    return decode_block(f.read(block[1]))
+
+
+def iter_block_lines(file_path, tombstone_blocks_only=False):
+    with open(file_path, 'rb') as f:
+        blocks, _ = scan_blocks(f)
+        for block in blocks:
+            if tombstone_blocks_only and not block[3]:
+                continue
+            yield from read_block(f, block)
+
+
+def scan_block_log(file_path):
+    # Entry and tombstone counts from the headers, plus the last entry line
+    with open(file_path, 'rb') as f:
+        blocks, _ = scan_blocks(f)
+        records = sum(block[2] for block in blocks)
+        tombstones = sum(block[3] for block in blocks)
+        last_line = b""
+        for block in reversed(blocks):
+            if block[2]:
+                lines = [line for line in read_block(f, block) if TOMBSTONE_MARKER not in line]
+                last_line = lines[-1]
+                break
+    return records, tombstones, last_line
+
+
+def block_raw_size(f, block):
+    # ISIZE from the member trailer
+    f.seek(block[0] + block[1] - MEMBER_TRAILER.size)
+    return MEMBER_TRAILER.unpack(f.read(MEMBER_TRAILER.size))[1]
+
+
+def count_small_blocks(file_path):
+    with open(file_path, 'rb') as f:
+        blocks, _ = scan_blocks(f)
+        return sum(1 for block in blocks if block_raw_size(f, block) < SMALL_BLOCK_BYTES)
+
+
+def write_block_log(file_path, lines):
+    # lines: encoded JSONL lines, each ending in a newline
+    with open(file_path, 'wb') as f:
+        for block in split_blocks(lines):
+            f.write(encode_block(block))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def append_block(file_path, lines):
+    # A new block at the end; blocks already written are never touched, so
+    # a crash can only tear this one. Returns True if it is a small block,
+    # left for compaction to merge.
+    block = encode_block(lines)
+    with open(file_path, 'ab') as f:
+        f.write(block)
+    return sum(len(line) for line in lines) < SMALL_BLOCK_BYTES
+
+
+class BlockLog:
+    # A block-compressed log read on demand, for logs too large to load:
+    # only block headers are read on open, and a few decompressed blocks
+    # are cached. Same sequence interface and refresh/compact contract as
+    # IndexedLog.
+
+    def __init__(self, file_path, cache_size=BLOCK_CACHE_SIZE):
+        self.file_path = file_path
+        self.cache_size = cache_size
+        self.lock = threading.RLock()
+        self.cache = OrderedDict()
+        self.log_file = None
+        self.reset()
+        self.refresh()
+
+    def reset(self):
+        self.blocks = []
+        # Record number of the first entry of each block
+        self.starts = array('Q')
+        self.records = 0
+        self.tombstones = 0
+        self.deleted = set()
+        self.live = None
+        self.scanned_size = 0
+        self.cache.clear()
+
+    def __len__(self):
+        return self.records if self.live is None else len(self.live)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.entry(i) for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("log entry index out of range")
+        return self.entry(item)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.entry(i)
+
+    def record_number(self, i):
+        return i if self.live is None else self.live[i]
+
+    def entry(self, i):
+        with self.lock:
+            if self.log_file is None:
+                self.refresh()
+            return parse_entry(self.entry_line(i))
+
+    def entry_line(self, i):
+        record_no = self.record_number(i)
+        block_no = bisect_right(self.starts, record_no) - 1
+        return self.block_entries(block_no)[record_no - self.starts[block_no]]
+
+    def block_entries(self, block_no):
+        lines = self.cache.get(block_no)
+        if lines is not None:
+            self.cache.move_to_end(block_no)
+            return lines
+        lines = [line for line in read_block(self.log_file, self.blocks[block_no])
+                 if TOMBSTONE_MARKER not in line]
+        self.cache[block_no] = lines
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return lines
+
+    def close(self):
+        with self.lock:
+            if self.log_file is not None:
+                self.log_file.close()
+            self.log_file = None
+            self.cache.clear()
+
+    def refresh(self):
+        # Picks up blocks appended since the last scan; rescans if the file
+        # was replaced or shrank
+        with self.lock:
+            try:
+                stat = os.stat(self.file_path)
+            except OSError:
+                self.close()
+                self.reset()
+                return
+            if self.log_file is not None and (os.fstat(self.log_file.fileno()).st_ino != stat.st_ino
+                                              or stat.st_size < self.scanned_size):
+                self.close()
+                self.reset()
+            if self.log_file is None:
+                self.log_file = open(self.file_path, 'rb')
+            if stat.st_size <= self.scanned_size:
+                return
+            blocks, end = scan_blocks(self.log_file, self.scanned_size, stat.st_size)
+            first_new = self.records
+            deleted = []
+            for block in blocks:
+                self.starts.append(self.records)
+                self.blocks.append(block)
+                self.records += block[2]
+                self.tombstones += block[3]
+                if block[3]:
+                    for line in read_block(self.log_file, block):
+                        if TOMBSTONE_MARKER in line:
+                            deleted.append(parse_entry(line)['_tombstone'])
+            self.scanned_size = end
+            if deleted:
+                self.deleted.update(deleted)
+                self.live = array('Q', (n for n in range(self.records) if n not in self.deleted))
+            elif self.live is not None:
+                self.live.extend(range(first_new, self.records))
+
+    def compact(self):
+        # Rewrite the live entries into full-size blocks
+        with self.lock:
+            self.refresh()
+            temp_path = self.file_path + ".tmp"
+            write_block_log(temp_path, (self.entry_line(i) for i in range(len(self))))
+            self.close()
+            os.replace(temp_path, self.file_path)
+            self.reset()
+            self.refresh()
+            return len(self)
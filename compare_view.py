@@ -0,0 +1,126 @@
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QTextEdit, QPushButton
+from api_client import MODEL_NAMES
+
+MAX_VARIANTS = 4
+
+
+def parse_variants(text, default_temperature):
+    # "v3, r1" or "v3@0.2, v3@1.0": a model alias with an optional temperature
+    variants = []
+    for part in text.replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        alias, _, temperature = part.partition("@")
+        alias = alias.strip().lower()
+        if alias not in MODEL_NAMES:
+            raise ValueError(f"Unknown model '{alias}' (use {', '.join(MODEL_NAMES)})")
+        try:
+            temperature = float(temperature) if temperature.strip() else default_temperature
+        except ValueError:
+            raise ValueError(f"Invalid temperature in '{part}'")
+        if not 0.0 <= temperature <= 2.0:
+            raise ValueError(f"Temperature must be between 0 and 2 in '{part}'")
+        variants.append((alias, temperature))
+    if not 2 <= len(variants) <= MAX_VARIANTS:
+        raise ValueError(f"Compare mode needs 2 to {MAX_VARIANTS} variants, e.g. 'v3, r1' or 'v3@0.2, v3@1.0'")
+    return variants
+
+
+class VariantColumn(QWidget):
+    def __init__(self, title, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(QLabel(title))
+        self.reasoning_display = QTextEdit()
+        self.reasoning_display.setReadOnly(True)
+        self.reasoning_display.setMaximumHeight(120)
+        self.reasoning_display.hide()
+        layout.addWidget(self.reasoning_display)
+        self.result_display = QTextEdit()
+        self.result_display.setReadOnly(True)
+        self.result_display.setPlaceholderText("Waiting for response...")
+        layout.addWidget(self.result_display, stretch=1)
+        self.stats_label = QLabel("")
+        self.stats_label.setWordWrap(True)
+        layout.addWidget(self.stats_label)
+        self.choose_btn = QPushButton("Use this")
+        self.choose_btn.setEnabled(False)
+        layout.addWidget(self.choose_btn)
+        self.setLayout(layout)
+
+    def append(self, display, text):
+        if display is self.reasoning_display:
+            display.show()
+        cursor = display.textCursor()
+        cursor.movePosition(cursor.End)
+        cursor.insertText(text)
+
+
+class CompareView(QWidget):
+    # Side-by-side replies for one prompt sent to several (model, temperature)
+    # variants. Chunks are buffered and flushed on a timer like the main
+    # result display.
+    chosen = pyqtSignal(int)
+    discarded = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.columns_layout = QHBoxLayout()
+        layout.addLayout(self.columns_layout, stretch=1)
+        self.discard_btn = QPushButton("Discard all")
+        self.discard_btn.clicked.connect(self.discarded.emit)
+        layout.addWidget(self.discard_btn)
+        self.setLayout(layout)
+        self.columns = []
+        self.buffers = {}
+        self.render_timer = QTimer(self)
+        self.render_timer.setInterval(50)
+        self.render_timer.timeout.connect(self.flush)
+
+    def set_variants(self, titles):
+        self.buffers = {}
+        for column in self.columns:
+            self.columns_layout.removeWidget(column)
+            column.deleteLater()
+        self.columns = []
+        for index, title in enumerate(titles):
+            column = VariantColumn(title, self)
+            column.choose_btn.clicked.connect(lambda checked=False, i=index: self.chosen.emit(i))
+            self.columns_layout.addWidget(column)
+            self.columns.append(column)
+
+    def append(self, index, content, reasoning):
+        content_parts, reasoning_parts = self.buffers.setdefault(index, ([], []))
+        if content:
+            content_parts.append(content)
+        if reasoning:
+            reasoning_parts.append(reasoning)
+        if not self.render_timer.isActive():
+            self.render_timer.start()
+
+    def flush(self):
+        for index, (content_parts, reasoning_parts) in self.buffers.items():
+            column = self.columns[index]
+            if reasoning_parts:
+                column.append(column.reasoning_display, "".join(reasoning_parts))
+            if content_parts:
+                column.append(column.result_display, "".join(content_parts))
+        self.buffers = {}
+        self.render_timer.stop()
+
+    def set_text(self, index, content, reasoning):
+        column = self.columns[index]
+        column.result_display.setPlainText(content)
+        column.reasoning_display.setPlainText(reasoning)
+        column.reasoning_display.setVisible(bool(reasoning))
+
+    def set_status(self, index, text, can_choose=False):
+        self.flush()
+        column = self.columns[index]
+        column.stats_label.setText(text)
+        column.choose_btn.setEnabled(can_choose)
@@ -0,0 +1,101 @@
+import os
+import json
+from api_client import DEFAULT_BASE_URL
+
+CONFIG_FILE = "config.json"
+
+
+class ConfigManager:
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self.load_error = None
+        self.dirty = False
+        self.last_written = None
+
+    def load_config(self):
+        self.load_error = None
+        try:
+            with open(self.path, 'r') as f:
+                text = f.read()
+            config = json.loads(text)
+            if 'conversations' in config and config['conversations']:
+                if isinstance(config['conversations'][0], str):
+                    new_conv_list = []
+                    for conv_id in config['conversations']:
+                        new_conv_list.append({
+                            'id': conv_id,
+                            'name': f"Conversation {conv_id}",
+                            'file': f"log/{conv_id}.txt"
+                        })
+                    config['conversations'] = new_conv_list
+            else:
+                config['conversations'] = []
+            for key, value in self.load_default_config().items():
+                config.setdefault(key, value)
+            self.last_written = text
+            return config
+        except FileNotFoundError:
+            return self.load_default_config()
+        except Exception as e:
+            self.load_error = str(e)
+            return self.load_default_config()
+
+    def mark_dirty(self, *args):
+        self.dirty = True
+
+    def save_config(self, config):
+        text = json.dumps(config, indent=2)
+        if text == self.last_written:
+            self.dirty = False
+            return False
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.last_written = text
+        # Only now; a failed write stays dirty so autosave tries again
+        self.dirty = False
+        return True
+
+    @staticmethod
+    def load_default_config():
+        return {
+            'api_key': '',
+            'price_per_token': 0.02,
+            'conversations': [],
+            'history_limit': 10,
+            'use_timestamp': True,
+            'stream_response': True,
+            'base_url': DEFAULT_BASE_URL,
+            'request_timeout': 600.0,
+            'max_retries': 2,
+            'requests_per_minute': 0,
+            'tokens_per_minute': 0,
+            'circuit_breaker_failures': 5,
+            'circuit_breaker_cooldown': 30.0,
+            'pool_size': 10,
+            'max_concurrent_requests': 4,
+            'metrics_export': False,
+            'log_level': "INFO",
+            'history_cache_mb': 64,
+            'indexed_log_threshold_mb': 32,
+            'log_format': "jsonl",
+            'conversation_storage': "files",
+            'context_token_budget': 32000,
+            'context_keep_first': False,
+            'context_truncate_oversized': True,
+            'context_placeholder': True,
+            'response_cache_enabled': False,
+            'response_cache_mb': 100,
+            'response_cache_ttl_hours': 168,
+            'stable_prefix_layout': False,
+            'cache_hit_price_ratio': 0.25,
+            'model_prices': {},
+            'compare_variants': "v3, r1",
+            'summarize_history': False,
+            'summary_model': "v3",
+            'summary_batch_turns': 4,
+            'summary_max_tokens': 600
+        }
@@ -0,0 +1 @@
+# The app is a set of top-level modules; this puts them on the path for tests
@@ -0,0 +1,171 @@
+from token_counter import count_tokens, truncate_to_tokens
+
+# Rough per-message framing cost (role markers etc.)
+MESSAGE_OVERHEAD = 4
+TRUNCATION_MARK = "\n...[truncated]"
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+# When a stable window has to move, it re-anchors with this share of the
+# budget and turn limit so the following turns fit without moving it again
+ANCHOR_SLACK = 0.75
+
+
+def compose_prompt(prefix, prompt, suffix):
+    return f"{prefix}{prompt}{suffix}"
+
+
+class ContextBuilder:
+    def __init__(self, token_budget=32000, max_turns=None, keep_first_turn=False,
+                 truncate_oversized=True, summary_placeholder=True, oversized_ratio=0.25, stable_prefix=False):
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.keep_first_turn = keep_first_turn
+        self.truncate_oversized = truncate_oversized
+        self.summary_placeholder = summary_placeholder
+        self.oversized_ratio = oversized_ratio
+        self.stable_prefix = stable_prefix
+        # anchor key -> index of the oldest turn sent, kept fixed across sends
+        # so the request prefix stays byte-identical for the provider's cache
+        self.anchors = {}
+        # id(entry) -> (entry, prompt tokens, response tokens); the entry is
+        # kept so the id can't be reused while the count is cached
+        self.token_cache = {}
+        self.last_stats = {'turns': 0, 'dropped': 0, 'tokens': 0}
+
+    def entry_tokens(self, entry):
+        cached = self.token_cache.get(id(entry))
+        if cached is not None and cached[0] is entry:
+            return cached[1], cached[2]
+        prompt_tokens = count_tokens(entry.get('prompt', ''))
+        response_tokens = count_tokens(entry.get('response', ''))
+        self.token_cache[id(entry)] = (entry, prompt_tokens, response_tokens)
+        return prompt_tokens, response_tokens
+
+    def invalidate(self, entry=None):
+        if entry is None:
+            self.token_cache = {}
+        else:
+            self.token_cache.pop(id(entry), None)
+
+    def tokens_at(self, history, index):
+        # Indexed logs know each entry's token counts without parsing it
+        token_counts = getattr(history, 'token_counts', None)
+        if token_counts is not None:
+            return token_counts(index)
+        return self.entry_tokens(history[index])
+
+    def turn_cost(self, prompt_tokens, response_tokens, max_response_tokens=None):
+        if max_response_tokens is not None and response_tokens > max_response_tokens:
+            response_tokens = max_response_tokens + MESSAGE_OVERHEAD
+        return prompt_tokens + response_tokens + 2 * MESSAGE_OVERHEAD
+
+    def turn_messages(self, entry, max_response_tokens=None, token_counts=None):
+        prompt_tokens, response_tokens = token_counts or self.entry_tokens(entry)
+        response = entry.get('response', '')
+        if max_response_tokens is not None and response_tokens > max_response_tokens:
+            response = truncate_to_tokens(response, max_response_tokens) + TRUNCATION_MARK
+        messages = [
+            {"role": "user", "content": entry.get('prompt', '')},
+            {"role": "assistant", "content": response}
+        ]
+        return messages, self.turn_cost(prompt_tokens, response_tokens, max_response_tokens)
+
+    def select_recent(self, history, start, max_turns, available, max_response_tokens):
+        # Newest turns first, stopping at the first one that doesn't fit so
+        # the kept context stays contiguous. Only the last max_turns entries
+        # are looked at, so long histories cost nothing extra.
+        first = max(start, len(history) - max_turns) if max_turns > 0 else len(history)
+        used = 0
+        keep = len(history)
+        for i in range(len(history) - 1, first - 1, -1):
+            tokens = self.turn_cost(*self.tokens_at(history, i), max_response_tokens)
+            if used + tokens > available:
+                break
+            used += tokens
+            keep = i
+        return self.turns_from(history, keep, max_response_tokens), used
+
+    def turns_from(self, history, first, max_response_tokens):
+        token_counts = getattr(history, 'token_counts', None)
+        return [self.turn_messages(history[i], max_response_tokens,
+                                   token_counts(i) if token_counts is not None else None)[0]
+                for i in range(first, len(history))]
+
+    def select_anchored(self, anchor_key, history, start, max_turns, available, max_response_tokens):
+        anchor = self.anchors.get(anchor_key)
+        if anchor is not None and start <= anchor <= len(history) and len(history) - anchor <= max_turns:
+            used = sum(self.turn_cost(*self.tokens_at(history, i), max_response_tokens)
+                       for i in range(anchor, len(history)))
+            if used <= available:
+                return self.turns_from(history, anchor, max_response_tokens), used
+        selected, used = self.select_recent(history, start, max(1, int(max_turns * ANCHOR_SLACK)) if max_turns else 0,
+                                            int(available * ANCHOR_SLACK), max_response_tokens)
+        if not selected:
+            # The newest turn alone is over the slack; don't send nothing for it
+            selected, used = self.select_recent(history, start, max_turns, available, max_response_tokens)
+        self.anchors[anchor_key] = len(history) - len(selected)
+        return selected, used
+
+    def build(self, history, new_prompt, leading_messages=(), anchor_key=None, summary=None):
+        leading_messages = list(leading_messages)
+        remaining = self.token_budget - count_tokens(new_prompt) - MESSAGE_OVERHEAD
+        for message in leading_messages:
+            remaining -= count_tokens(message['content']) + MESSAGE_OVERHEAD
+        max_response_tokens = None
+        if self.truncate_oversized:
+            max_response_tokens = max(1, int(self.token_budget * self.oversized_ratio))
+        placeholder_tokens = 16 if self.summary_placeholder else 0
+
+        max_turns = len(history) if self.max_turns is None else min(self.max_turns, len(history))
+        summary_messages = []
+        first_messages = []
+        start = 0
+        if summary is not None:
+            # (covered, text): the first `covered` entries are replaced by
+            # their rolling summary, which includes the first turn
+            covered, text = summary
+            summary_messages = [{"role": "system", "content": SUMMARY_HEADER + text}]
+            remaining -= count_tokens(summary_messages[0]['content']) + MESSAGE_OVERHEAD
+            start = min(covered, len(history))
+            max_turns = min(max_turns, len(history) - start)
+        elif self.keep_first_turn and max_turns > 0:
+            messages, tokens = self.turn_messages(history[0], max_response_tokens, self.tokens_at(history, 0))
+            if tokens <= remaining - placeholder_tokens:
+                first_messages = messages
+                remaining -= tokens
+                start = 1
+                max_turns -= 1
+
+        if self.stable_prefix and anchor_key is not None:
+            selected, used = self.select_anchored(anchor_key, history, start, max_turns,
+                                                  remaining - placeholder_tokens, max_response_tokens)
+        else:
+            selected, used = self.select_recent(history, start, max_turns,
+                                                remaining - placeholder_tokens, max_response_tokens)
+        remaining -= used
+
+        dropped = len(history) - start - len(selected)
+        result = leading_messages + summary_messages + first_messages
+        if dropped and self.summary_placeholder:
+            result.append({"role": "system", "content": f"[{dropped} earlier turns omitted]"})
+            remaining -= placeholder_tokens
+        for messages in selected:
+            result.extend(messages)
+        result.append({"role": "user", "content": new_prompt})
+
+        self.last_stats = {
+            'turns': len(selected) + (1 if first_messages else 0),
+            'dropped': dropped,
+            'summarized': start if summary_messages else 0,
+            'tokens': self.token_budget - remaining
+        }
+        self.prune_cache(history, start, max_turns)
+        return result
+
+    def prune_cache(self, history, start, max_turns):
+        # Only entries that can still be selected are worth keeping counts for
+        window = history[max(start, len(history) - max_turns):] if max_turns > 0 else []
+        if len(self.token_cache) > 4 * len(window) + 1000:
+            live = {id(entry) for entry in window}
+            if start and len(history):
+                live.add(id(history[0]))
+            self.token_cache = {k: v for k, v in self.token_cache.items() if k in live}
@@ -0,0 +1,491 @@
+import os
+import json
+import threading
+import logging
+from collections import OrderedDict
+from log_index import IndexedLog
+from block_log import (BLOCK_LOG_SUFFIX, BLOCK_LOG_EXPANSION, BlockLog, is_block_log, iter_block_lines,
+                       scan_block_log, write_block_log, append_block, count_small_blocks)
+
+logger = logging.getLogger(__name__)
+
+LOG_ENCODING = "utf-8-sig"
+DEFAULT_ROLES = {'user': 'user', 'assistant': 'assistant'}
+# Log lines are either entries or tombstones {"_tombstone": n}, where n is the
+# 0-based position of the deleted entry among the entry lines of the file.
+TOMBSTONE_KEY = "_tombstone"
+COMPACT_GARBAGE_RATIO = 0.3
+# Compact logs get a block per append and are rewritten once this many
+# undersized blocks piled up, or this share of the entries for long logs,
+# so the cost of the rewrite is spread over as many appends as it copies
+COMPACT_SMALL_BLOCKS = 32
+COMPACT_SMALL_BLOCK_RATIO = 0.1
+# Logs at least this large are read through a sidecar index instead of
+# being loaded into memory
+LAZY_LOG_THRESHOLD = 32 * 1024 * 1024
+# What an indexed log is charged against the cache budget
+LAZY_LOG_COST = 1024 * 1024
+LOG_SUFFIX = ".txt"
+
+
+def log_file_path(name, compact=False):
+    # Compact logs are named like gzip output, since zcat reads them
+    return os.path.join("log", name + LOG_SUFFIX + (BLOCK_LOG_SUFFIX if compact else ""))
+
+
+def unused_log_path(name, compact=False, taken=(), current=None):
+    # current: the conversation's own log, which a rename may keep
+    file_path = log_file_path(name, compact)
+    n = 2
+    while file_path != current and (file_path in taken or os.path.exists(file_path)):
+        file_path = log_file_path(f"{name} ({n})", compact)
+        n += 1
+    return file_path
+
+
+def log_lines(file_path):
+    # Text lines of a log in either format
+    if is_block_log(file_path):
+        for line in iter_block_lines(file_path):
+            yield line.decode(LOG_ENCODING)
+        return
+    # A torn last line can end mid-character
+    with open(file_path, 'r', encoding=LOG_ENCODING, errors="replace") as f:
+        yield from f
+
+
+def raw_lines(file_path):
+    with open(file_path, 'rb') as f:
+        yield from f
+
+
+def parse_log_line(line):
+    # None for a blank line, and for an unterminated last line that doesn't
+    # parse: an append cut short by a crash (see repair_tail)
+    stripped = line.strip()
+    if not stripped:
+        return None
+    try:
+        return json.loads(stripped)
+    except ValueError:
+        if line.endswith("\n"):
+            raise
+        return None
+
+
+def repair_tail(file_path):
+    # Before appending to a plain log, complete a torn last line that still
+    # parses, or cut off one that doesn't, so it can't run into the new line
+    try:
+        f = open(file_path, 'r+b')
+    except OSError:
+        return
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        if not size:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        start = size
+        tail = b""
+        while start > 0 and b"\n" not in tail:
+            start = max(0, start - 4096)
+            f.seek(start)
+            tail = f.read(size - start)
+        line_start = start + tail.rfind(b"\n") + 1 if b"\n" in tail else 0
+        f.seek(line_start)
+        if parse_log_line(f.read().decode(LOG_ENCODING, errors="replace")) is not None:
+            f.write(b"\n")
+        else:
+            f.truncate(line_start)
+
+
+def read_log(file_path):
+    history = []
+    ordinals = []
+    records = 0
+    tombstones = 0
+    for line in log_lines(file_path):
+        entry = parse_log_line(line)
+        if entry is None:
+            continue
+        if TOMBSTONE_KEY in entry:
+            tombstones += 1
+            ordinal = entry[TOMBSTONE_KEY]
+            # Deletions are almost always of the newest entry
+            for i in range(len(ordinals) - 1, -1, -1):
+                if ordinals[i] == ordinal:
+                    del ordinals[i]
+                    del history[i]
+                    break
+            continue
+        if 'roles' not in entry:
+            entry['roles'] = dict(DEFAULT_ROLES)
+        history.append(entry)
+        ordinals.append(records)
+        records += 1
+    return history, ordinals, records, tombstones
+
+
+def read_log_entries(file_path):
+    return read_log(file_path)[0]
+
+
+def iter_log_entries(file_path):
+    # Like read_log_entries, without holding the whole history in memory:
+    # one pass collects deleted ordinals, a second yields the live entries
+    marker = b'"' + TOMBSTONE_KEY.encode() + b'"'
+    deleted = set()
+    if is_block_log(file_path):
+        # Block headers count tombstones, so only those blocks are inflated
+        tombstone_lines = iter_block_lines(file_path, tombstone_blocks_only=True)
+    else:
+        tombstone_lines = raw_lines(file_path)
+    for line in tombstone_lines:
+        if marker in line:
+            tombstone = parse_log_line(line.decode(LOG_ENCODING, errors="replace"))
+            if tombstone is not None:
+                deleted.add(tombstone[TOMBSTONE_KEY])
+    ordinal = 0
+    for line in log_lines(file_path):
+        entry = parse_log_line(line)
+        if entry is None:
+            continue
+        if TOMBSTONE_KEY in entry:
+            continue
+        if ordinal not in deleted:
+            if 'roles' not in entry:
+                entry['roles'] = dict(DEFAULT_ROLES)
+            yield entry
+        ordinal += 1
+
+
+def find_entry_index(history, timestamp):
+    find_timestamp = getattr(history, 'find_timestamp', None)
+    if find_timestamp is not None:
+        return find_timestamp(timestamp)
+    for i in range(len(history) - 1, -1, -1):
+        if history[i].get('timestamp') == timestamp:
+            return i
+    return -1
+
+
+def scan_log_file(file_path):
+    records = 0
+    tombstones = 0
+    last_line = b""
+    marker = b'"' + TOMBSTONE_KEY.encode() + b'"'
+    if is_block_log(file_path):
+        # Counts come from the block headers; only the last block is inflated
+        records, tombstones, last_line = scan_block_log(file_path)
+    else:
+        with open(file_path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                if not line.endswith(b"\n") and parse_log_line(line.decode(LOG_ENCODING, errors="replace")) is None:
+                    continue
+                if marker in line:
+                    tombstones += 1
+                else:
+                    records += 1
+                    last_line = line
+    if tombstones:
+        # The last entry line may be deleted; replay the log to find out
+        history, _, records, tombstones = read_log(file_path)
+        last_timestamp = history[-1].get('timestamp') if history else None
+        return len(history), last_timestamp, records, tombstones
+    last_timestamp = None
+    if last_line:
+        try:
+            last_timestamp = json.loads(last_line.decode(LOG_ENCODING)).get('timestamp')
+        except ValueError:
+            pass
+    return records, last_timestamp, records, 0
+
+
+def write_log_atomic(file_path, history, compact=None):
+    # compact=None keeps the file's current format
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = file_path + ".tmp"
+    if compact is None:
+        compact = is_block_log(file_path)
+    if compact:
+        write_block_log(temp_path, ((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+                                    for entry in history))
+    else:
+        with open(temp_path, 'w', encoding=LOG_ENCODING) as f:
+            for entry in history:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+
+
+class CachedLog:
+    __slots__ = ('history', 'ordinals', 'size')
+
+    def __init__(self, history, ordinals, size):
+        self.history = history
+        # None for an IndexedLog or BlockLog, which track ordinals themselves
+        self.ordinals = ordinals
+        self.size = size
+
+    @property
+    def indexed(self):
+        return self.ordinals is None
+
+
+class HistoryCache:
+    # Loaded histories within a byte budget, least recently used evicted
+    # first; the pinned (current) conversation is never evicted. Shared by
+    # the file and SQLite stores.
+
+    def __init__(self, cache_budget_bytes=64 * 1024 * 1024):
+        self.cache_budget_bytes = cache_budget_bytes
+        # conv_id -> CachedLog, least recently used first
+        self.cache = OrderedDict()
+        self.cached_bytes = 0
+        self.pinned = None
+
+    def is_loaded(self, conv_id):
+        return conv_id in self.cache
+
+    def cached_history(self, conv_id):
+        cached = self.cache.get(conv_id)
+        if cached is None:
+            return None
+        self.cache.move_to_end(conv_id)
+        return cached.history
+
+    def _cache(self, conv_id, history, ordinals, size):
+        self.cache[conv_id] = CachedLog(history, ordinals, size)
+        self.cached_bytes += size
+        self.evict()
+        return history
+
+    def pin(self, conv_id):
+        self.pinned = conv_id
+        self.evict()
+
+    def evict(self):
+        for conv_id in list(self.cache):
+            if self.cached_bytes <= self.cache_budget_bytes:
+                break
+            if conv_id == self.pinned:
+                continue
+            self.forget(conv_id)
+
+    def forget(self, conv_id):
+        cached = self.cache.pop(conv_id, None)
+        if cached is not None:
+            self.cached_bytes -= cached.size
+            if cached.indexed:
+                cached.history.close()
+
+    def close(self):
+        # Releases the handles of indexed logs
+        for conv_id in list(self.cache):
+            self.forget(conv_id)
+
+    def _resize(self, conv_id, delta):
+        cached = self.cache.get(conv_id)
+        if cached is not None and not cached.indexed:
+            cached.size += delta
+            self.cached_bytes += delta
+
+
+class ConversationStore(HistoryCache):
+    def __init__(self, cache_budget_bytes=64 * 1024 * 1024, compact_ratio=COMPACT_GARBAGE_RATIO,
+                 lazy_threshold_bytes=LAZY_LOG_THRESHOLD):
+        super().__init__(cache_budget_bytes)
+        self.compact_ratio = compact_ratio
+        self.lazy_threshold_bytes = lazy_threshold_bytes
+        self.file_locks = {}
+        self.locks_lock = threading.Lock()
+        self.compacting = set()
+
+    def file_lock(self, file_path):
+        with self.locks_lock:
+            lock = self.file_locks.get(file_path)
+            if lock is None:
+                lock = self.file_locks[file_path] = threading.Lock()
+            return lock
+
+    def refresh_metadata(self, conv):
+        file_path = conv['file']
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        # Rescan only when the file changed since the metadata was recorded
+        if conv.get('size') != stat.st_size or conv.get('mtime') != stat.st_mtime:
+            entry_count, last_timestamp, records, tombstones = scan_log_file(file_path)
+            conv['entry_count'] = entry_count
+            conv['last_timestamp'] = last_timestamp
+            conv['records'] = records
+            conv['tombstones'] = tombstones
+            conv['size'] = stat.st_size
+            conv['mtime'] = stat.st_mtime
+            conv.pop('small_blocks', None)
+        if 'small_blocks' not in conv and is_block_log(file_path):
+            conv['small_blocks'] = count_small_blocks(file_path)
+        return True
+
+    def location(self, conv):
+        return conv['file']
+
+    def source_state(self, conv):
+        try:
+            stat = os.stat(conv['file'])
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def iter_entries(self, conv):
+        return iter_log_entries(conv['file'])
+
+    def get_history(self, conv):
+        conv_id = conv['id']
+        history = self.cached_history(conv_id)
+        if history is not None:
+            return history
+        with self.file_lock(conv['file']):
+            size = os.path.getsize(conv['file']) if os.path.exists(conv['file']) else 0
+            compressed = size and is_block_log(conv['file'])
+            if compressed:
+                # Budgets are about memory, i.e. the decompressed size
+                size *= BLOCK_LOG_EXPANSION
+            if size >= self.lazy_threshold_bytes:
+                # Block logs index themselves from their block headers
+                history = BlockLog(conv['file']) if compressed else IndexedLog(conv['file'])
+                ordinals = None
+                records, tombstones = history.records, history.tombstones
+                size = LAZY_LOG_COST
+            elif size:
+                history, ordinals, records, tombstones = read_log(conv['file'])
+            else:
+                history, ordinals, records, tombstones = [], [], 0, 0
+        conv['records'] = records
+        conv['tombstones'] = tombstones
+        return self._cache(conv_id, history, ordinals, size)
+
+    def put_history(self, conv_id, history, size=0):
+        self.forget(conv_id)
+        return self._cache(conv_id, history, list(range(len(history))), size)
+
+    def _stat_into(self, conv):
+        try:
+            stat = os.stat(conv['file'])
+        except OSError:
+            return
+        conv['size'] = stat.st_size
+        conv['mtime'] = stat.st_mtime
+
+    def _append_line(self, conv, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        directory = os.path.dirname(conv['file'])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if is_block_log(conv['file']):
+            if append_block(conv['file'], [line.encode("utf-8")]):
+                conv['small_blocks'] = conv.get('small_blocks', 0) + 1
+        else:
+            repair_tail(conv['file'])
+            with open(conv['file'], 'a', encoding=LOG_ENCODING) as f:
+                f.write(line)
+        self._resize(conv['id'], len(line.encode("utf-8")))
+
+    def append_entry(self, conv, entry):
+        with self.file_lock(conv['file']):
+            self._append_line(conv, entry)
+            records = conv.get('records', conv.get('entry_count', 0))
+            cached = self.cache.get(conv['id'])
+            if cached is not None and cached.indexed:
+                cached.history.refresh()
+            elif cached is not None:
+                cached.history.append(entry)
+                cached.ordinals.append(records)
+            conv['records'] = records + 1
+            conv['entry_count'] = conv.get('entry_count', 0) + 1
+            conv['last_timestamp'] = entry.get('timestamp')
+            self._stat_into(conv)
+        self.evict()
+        self.compact_in_background(conv)
+
+    def drop_last(self, conv):
+        history = self.get_history(conv)
+        if not history:
+            return None
+        with self.file_lock(conv['file']):
+            cached = self.cache[conv['id']]
+            if cached.indexed:
+                entry = history[-1]
+                self._append_line(conv, {TOMBSTONE_KEY: history.record_number(len(history) - 1)})
+                history.refresh()
+            else:
+                entry = cached.history.pop()
+                ordinal = cached.ordinals.pop()
+                self._append_line(conv, {TOMBSTONE_KEY: ordinal})
+            conv['tombstones'] = conv.get('tombstones', 0) + 1
+            conv['entry_count'] = len(cached.history)
+            conv['last_timestamp'] = cached.history[-1].get('timestamp') if len(cached.history) else None
+            self._stat_into(conv)
+        self.compact_in_background(conv)
+        return entry
+
+    def garbage_ratio(self, conv):
+        tombstones = conv.get('tombstones', 0)
+        lines = conv.get('records', 0) + tombstones
+        # Every tombstone also makes one entry line dead
+        return (2 * tombstones) / lines if lines else 0.0
+
+    def compact_in_background(self, conv):
+        # One at a time per conversation; appends keep checking meanwhile
+        if not self.needs_compaction(conv) or conv['id'] in self.compacting:
+            return
+        self.compacting.add(conv['id'])
+        threading.Thread(target=self._compact_and_release, args=(conv,), daemon=True).start()
+
+    def _compact_and_release(self, conv):
+        try:
+            self.compact(conv)
+        finally:
+            self.compacting.discard(conv['id'])
+
+    def needs_compaction(self, conv):
+        small_blocks = conv.get('small_blocks', 0)
+        if small_blocks >= max(COMPACT_SMALL_BLOCKS, conv.get('records', 0) * COMPACT_SMALL_BLOCK_RATIO):
+            return True
+        return conv.get('tombstones', 0) > 0 and self.garbage_ratio(conv) >= self.compact_ratio
+
+    def compact(self, conv):
+        file_path = conv['file']
+        try:
+            with self.file_lock(file_path):
+                if conv['file'] != file_path or not os.path.exists(file_path):
+                    # Renamed or deleted while waiting for the lock
+                    return
+                cached = self.cache.get(conv['id'])
+                if cached is not None and cached.indexed:
+                    # Copies raw lines via the index; nothing is loaded
+                    conv['records'] = cached.history.compact()
+                    conv['tombstones'] = 0
+                    conv.pop('small_blocks', None)
+                    self._stat_into(conv)
+                    return
+                history = read_log(conv['file'])[0]
+                write_log_atomic(conv['file'], history)
+                conv['records'] = len(history)
+                conv['tombstones'] = 0
+                conv.pop('small_blocks', None)
+                self._stat_into(conv)
+                if cached is not None:
+                    cached.ordinals = list(range(len(cached.history)))
+                    self._resize(conv['id'], conv.get('size', cached.size) - cached.size)
+        except Exception as e:
+            # The original file is untouched if the rewrite didn't complete
+            logger.warning("Log compaction failed for %s: %s", conv['file'], e)
@@ -0,0 +1,1745 @@
+import os
+import time
+import logging
+import threading
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QSplitter, QHBoxLayout, QVBoxLayout,
+                             QLineEdit, QTextEdit, QPushButton, QLabel, QListWidget, QListWidgetItem,
+                             QGroupBox, QMessageBox, QDialog, QSpinBox, QDoubleSpinBox,
+                             QRadioButton, QButtonGroup, QMenu, QInputDialog, QCheckBox, QListView,
+                             QTabWidget, QTableWidget, QTableWidgetItem, QHeaderView, QDockWidget)
+from PyQt5.QtCore import Qt, QTimer, QObject, QRunnable, QThreadPool, pyqtSignal
+from api_client import ClientManager, DEFAULT_BASE_URL, MODEL_NAMES, preload_sdk
+from request_engine import RequestEngine
+from rate_limit import RequestGate, RetryPolicy
+from request_scheduler import ConversationScheduler
+from token_counter import IncrementalTokenCounter, count_tokens, get_encoding
+from context_builder import ContextBuilder, compose_prompt
+from detail_view import ConversationDetailView
+from compare_view import CompareView, parse_variants
+from summarizer import ConversationSummarizer, summary_path
+from history_view import HistoryListModel, HistoryItemDelegate, FIXED_PREVIEW_LINES
+from conversation_store import ConversationStore, find_entry_index, unused_log_path
+from sqlite_store import SqliteConversationStore
+from log_index import sidecar_path
+from block_log import is_block_log
+from config_store import ConfigManager
+from search_index import SearchIndex
+from response_cache import ResponseCache, cache_key
+from startup_profile import StartupProfile
+from metrics import METRICS, METRICS_FILE
+from log_setup import setup_logging
+from usage_ledger import UsageLedger, entry_cost, merge_prices, usage_breakdown
+
+logger = logging.getLogger(__name__)
+
+class TokenCountSignals(QObject):
+    counted = pyqtSignal(int, int)
+
+
+class TokenCountTask(QRunnable):
+    def __init__(self, counter, generation, text, signals):
+        super().__init__()
+        self.counter = counter
+        self.generation = generation
+        self.text = text
+        self.signals = signals
+
+    def run(self):
+        with METRICS.span("calculate_tokens"):
+            count = self.counter.count(self.text)
+        self.signals.counted.emit(self.generation, count)
+
+
+class TokenCountService(QObject):
+    token_count_changed = pyqtSignal(int)
+
+    def __init__(self, parent=None, delay_ms=250):
+        super().__init__(parent)
+        self.counter = IncrementalTokenCounter()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.signals = TokenCountSignals()
+        self.signals.counted.connect(self._on_counted)
+        self.generation = 0
+        self.pending_text = ""
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(delay_ms)
+        self.debounce_timer.timeout.connect(self._start_count)
+
+    def request_count(self, text):
+        self.pending_text = text
+        self.debounce_timer.start()
+
+    def _start_count(self):
+        self.generation += 1
+        # Only the newest queued count matters
+        self.pool.clear()
+        self.pool.start(TokenCountTask(self.counter, self.generation, self.pending_text, self.signals))
+
+    def _on_counted(self, generation, count):
+        if generation == self.generation:
+            self.token_count_changed.emit(count)
+
+
+class DeepSeekUI(QMainWindow):
+    def __init__(self, profile=None, log_level=None):
+        super().__init__()
+        self.profile = profile or StartupProfile()
+        self.client = None
+        self.current_conversation = None
+        self.conversations = {}
+        self.config_manager = ConfigManager()
+        self.config = self.config_manager.load_config()
+        setup_logging(log_level or self.config.get('log_level', "INFO"))
+        if self.config_manager.load_error:
+            QMessageBox.warning(None, "Error", f"Can't Read Config: {self.config_manager.load_error}")
+        self.profile.mark("config load")
+        # 'sqlite' keeps conversations in log/conversations.db instead of
+        # config.json plus a log file each; --import-sqlite moves them over
+        self.sqlite_storage = self.config.get('conversation_storage') == "sqlite"
+        store_class = SqliteConversationStore if self.sqlite_storage else ConversationStore
+        self.store = store_class(cache_budget_bytes=self.config.get('history_cache_mb', 64) * 1024 * 1024,
+                                 lazy_threshold_bytes=self.config.get('indexed_log_threshold_mb', 32) * 1024 * 1024)
+        try:
+            self.search_index = SearchIndex()
+        except Exception as e:
+            logger.warning("Search index unavailable: %s", e)
+            self.search_index = None
+        self.current_model = "v3"
+        self.history_limit = self.config.get('history_limit', 10)
+        self.use_timestamp = self.config.get('use_timestamp', True)
+        self.context_builder = ContextBuilder(
+            token_budget=self.config.get('context_token_budget', 32000),
+            max_turns=self.history_limit,
+            keep_first_turn=self.config.get('context_keep_first', False),
+            truncate_oversized=self.config.get('context_truncate_oversized', True),
+            summary_placeholder=self.config.get('context_placeholder', True),
+            stable_prefix=self.config.get('stable_prefix_layout', False)
+        )
+        self.cache_hit_price_ratio = self.config.get('cache_hit_price_ratio', 0.25)
+        self.model_prices = merge_prices(self.config.get('model_prices'))
+        self.usage_ledger = UsageLedger()
+        self.stream_response = self.config.get('stream_response', True)
+        self.metrics_export = self.config.get('metrics_export', False)
+        self.response_cache_enabled = self.config.get('response_cache_enabled', False)
+        self.response_cache = ResponseCache(
+            max_bytes=self.config.get('response_cache_mb', 100) * 1024 * 1024,
+            ttl=self.config.get('response_cache_ttl_hours', 168) * 3600
+        )
+        self.client_manager = ClientManager(
+            timeout=self.config.get('request_timeout', 600.0),
+            pool_size=self.config.get('pool_size', 10)
+        )
+        max_concurrent = self.config.get('max_concurrent_requests', 4)
+        # Shared by every conversation: the provider limits the account
+        self.request_gate = RequestGate(
+            requests_per_minute=self.config.get('requests_per_minute', 0),
+            tokens_per_minute=self.config.get('tokens_per_minute', 0),
+            breaker_threshold=self.config.get('circuit_breaker_failures', 5),
+            breaker_cooldown=self.config.get('circuit_breaker_cooldown', 30.0)
+        )
+        self.retry_policy = RetryPolicy(max_retries=self.config.get('max_retries', 2))
+        self.request_engine = RequestEngine(self, max_workers=max_concurrent, gate=self.request_gate,
+                                            retry_policy=self.retry_policy)
+        self.request_engine.request_chunk.connect(self.on_request_chunk)
+        self.request_engine.request_completed.connect(self.on_request_completed)
+        self.request_engine.request_failed.connect(self.on_request_failed)
+        self.request_engine.request_cancelled.connect(self.on_request_cancelled)
+        self.request_engine.request_waiting.connect(self.on_request_waiting)
+        # Counts down the waits shown for held requests
+        self.wait_display_timer = QTimer(self)
+        self.wait_display_timer.setInterval(1000)
+        self.wait_display_timer.timeout.connect(self.refresh_request_waits)
+        self.pending_requests = {}
+        self.compare_groups = {}
+        self.next_compare_id = 1
+        self.conversation_errors = {}
+        self.display_conv_id = None
+        self.scheduler = ConversationScheduler(self.start_request, self, max_concurrent)
+        self.scheduler.status_changed.connect(self.on_scheduler_status)
+        # Runs on the cheap model once no requests are in flight, through
+        # the same rate limits
+        self.summarizer = ConversationSummarizer(
+            lambda: self.client, self.get_history, lambda: self.request_engine.in_flight() > 0, self,
+            model=MODEL_NAMES.get(self.config.get('summary_model', "v3"), MODEL_NAMES['v3']),
+            enabled=self.config.get('summarize_history', False),
+            keep_turns=self.history_limit,
+            batch_turns=self.config.get('summary_batch_turns', 4),
+            max_tokens=self.config.get('summary_max_tokens', 600),
+            # The database keeps summaries itself; log files use sidecars
+            load_summary=self.store.load_summary if self.sqlite_storage else None,
+            save_summary=self.store.save_summary if self.sqlite_storage else None,
+            gate=self.request_gate
+        )
+        self.summarizer.summary_updated.connect(self.on_summary_updated)
+        self.stream_buffer = []
+        self.reasoning_buffer = []
+        self.token_service = TokenCountService(self)
+        self.token_service.token_count_changed.connect(
+            lambda count: self.token_label.setText(f"Tokens: {count}"))
+        self.profile.mark("stores and caches")
+        self.initUI()
+        self.setup_stream_render()
+        self.profile.mark("UI construction")
+        self.load_conversations()
+        self.profile.mark("conversation load")
+        if self.search_index:
+            self.search_index.sync_in_background(
+                [(conv['id'], self.store.location(conv), self.store.source_state(conv), self.store.iter_entries(conv))
+                 for conv in self.conversations.values()])
+        try:
+            self.usage_ledger.backfill_in_background(
+                [(conv['id'], self.store.iter_entries(conv)) for conv in self.conversations.values()], self.entry_cost)
+        except Exception as e:
+            logger.warning("Usage ledger unavailable: %s", e)
+        self.setStyleSheet(self.get_stylesheet())
+        self.prefix_input.setStyleSheet("background-color: #f8f8f8;")
+        self.suffix_input.setStyleSheet("background-color: #f8f8f8;")
+        self.drop_last_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #ff6666;
+            }
+            QPushButton:hover {
+                background-color: #ff4444;
+            }
+        """)
+        self.setStyleSheet("""
+            QTextEdit, QDoubleSpinBox {
+                border: 1px solid #cccccc;
+                border-radius: 4px;
+                padding: 3px;
+            }
+            QPushButton#danger_btn {
+                background-color: #ff4444;
+                color: white;
+                min-width: 120px;
+            }
+            QPushButton#danger_btn:hover {
+                background-color: #cc0000;
+            }
+            QLabel[paramLabel="true"] {
+                font-weight: bold;
+            }
+        """)
+        self.drop_last_btn.setObjectName("danger_btn")
+        for label in [self.findChild(QLabel, "prefixLabel"), 
+                    self.findChild(QLabel, "suffixLabel"),
+                    self.findChild(QLabel, "tempLabel")]:
+            label.setProperty("paramLabel", "true")
+        self.setup_autosave()
+        self.profile.mark("search index, ledger and styles")
+
+    def start_warm_up(self):
+        # tiktoken (BPE load) and the OpenAI SDK are only needed once the user
+        # types or sends; load them off the GUI thread after the first paint.
+        thread = threading.Thread(target=self._warm_up, daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self):
+        profile = StartupProfile(self.profile.enabled, self.profile.out)
+        get_encoding()
+        profile.mark("tiktoken encoding")
+        try:
+            preload_sdk()
+        except Exception as e:
+            logger.warning("OpenAI SDK unavailable: %s", e)
+        profile.mark("openai/httpx import")
+        profile.report("Background warm-up")
+
+    def initUI(self):
+        self.setWindowTitle('DeepSeek Client')
+        self.setGeometry(100, 100, 1200, 800)
+
+        main_splitter = QSplitter(Qt.Horizontal)
+        left_panel = self.create_left_panel()
+        center_panel = self.create_center_panel()
+        right_panel = self.create_right_panel()
+
+        main_splitter.addWidget(left_panel)
+        main_splitter.addWidget(center_panel)
+        main_splitter.addWidget(right_panel)
+        main_splitter.setSizes([200, 600, 300])
+
+        self.setCentralWidget(main_splitter)
+        self.create_metrics_panel()
+
+        self.api_key_input.setText(self.config.get('api_key', ''))
+        self.price_input.setText(str(self.config.get('price_per_token', 0.02)))
+        self.base_url_input.setText(self.config.get('base_url', DEFAULT_BASE_URL))
+
+    def create_metrics_panel(self):
+        self.metrics_table = QTableWidget(0, 7)
+        self.metrics_table.setHorizontalHeaderLabels(["Span", "Count", "Last ms", "p50 ms", "p90 ms", "p99 ms", "Max ms"])
+        self.metrics_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.metrics_table.verticalHeader().hide()
+        self.metrics_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.metrics_dock = QDockWidget("Metrics", self)
+        self.metrics_dock.setWidget(self.metrics_table)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.metrics_dock)
+        self.metrics_dock.hide()
+        self.metrics_dock.visibilityChanged.connect(self.on_metrics_visibility)
+        # Refreshed only while visible; exported on its own slower timer
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(1000)
+        self.metrics_timer.timeout.connect(self.refresh_metrics)
+        self.metrics_export_timer = QTimer(self)
+        self.metrics_export_timer.setInterval(60000)
+        self.metrics_export_timer.timeout.connect(self.export_metrics)
+        if self.metrics_export:
+            self.metrics_export_timer.start()
+
+    def on_metrics_visibility(self, visible):
+        self.metrics_btn.setChecked(visible)
+        if visible:
+            self.refresh_metrics()
+            self.metrics_timer.start()
+        else:
+            self.metrics_timer.stop()
+
+    def refresh_metrics(self):
+        snapshot = METRICS.snapshot()
+        self.metrics_table.setRowCount(len(snapshot))
+        for row, (name, summary) in enumerate(snapshot.items()):
+            cells = [name, str(summary['count'])] + [
+                f"{summary[key]:.1f}" for key in ('last_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')]
+            for column, text in enumerate(cells):
+                self.metrics_table.setItem(row, column, QTableWidgetItem(text))
+
+    def set_metrics_export(self, enabled):
+        self.metrics_export = enabled
+        if enabled:
+            self.metrics_export_timer.start()
+        else:
+            self.metrics_export_timer.stop()
+
+    def export_metrics(self):
+        try:
+            METRICS.export(METRICS_FILE)
+        except OSError as e:
+            logger.warning("Metrics export failed: %s", e)
+
+    def setup_autosave(self):
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.timeout.connect(self.autosave)
+        self.autosave_timer.start(30000)
+        # Bursts of changes (rename, delete, settings) are written once
+        self.save_coalesce_timer = QTimer(self)
+        self.save_coalesce_timer.setSingleShot(True)
+        self.save_coalesce_timer.setInterval(1000)
+        self.save_coalesce_timer.timeout.connect(self.save_state)
+        for line_edit in (self.api_key_input, self.price_input, self.base_url_input):
+            line_edit.textChanged.connect(self.config_manager.mark_dirty)
+
+    def autosave(self):
+        if self.config_manager.dirty:
+            self.save_state()
+
+    def schedule_save(self):
+        self.config_manager.mark_dirty()
+        self.save_coalesce_timer.start()
+
+    def save_state(self):
+        config = {
+            'api_key': self.api_key_input.text(),
+            'price_per_token': float(self.price_input.text() or 0),
+            'conversations': list(self.config.get('conversations', [])),
+            'history_limit': self.history_limit,
+            'use_timestamp': self.use_timestamp,
+            'stream_response': self.stream_response,
+            'base_url': self.base_url_input.text().strip() or DEFAULT_BASE_URL,
+            'request_timeout': self.client_manager.timeout,
+            'max_retries': self.retry_policy.max_retries,
+            'requests_per_minute': self.request_gate.requests.per_minute,
+            'tokens_per_minute': self.request_gate.tokens.per_minute,
+            'circuit_breaker_failures': self.request_gate.breaker.threshold,
+            'circuit_breaker_cooldown': self.request_gate.breaker.cooldown,
+            'pool_size': self.client_manager.pool_size,
+            'max_concurrent_requests': self.scheduler.max_concurrent,
+            'metrics_export': self.metrics_export,
+            'history_cache_mb': self.store.cache_budget_bytes // (1024 * 1024),
+            'indexed_log_threshold_mb': self.store.lazy_threshold_bytes // (1024 * 1024),
+            'log_format': self.config.get('log_format', "jsonl"),
+            'conversation_storage': self.config.get('conversation_storage', "files"),
+            'context_token_budget': self.context_builder.token_budget,
+            'context_keep_first': self.context_builder.keep_first_turn,
+            'context_truncate_oversized': self.context_builder.truncate_oversized,
+            'context_placeholder': self.context_builder.summary_placeholder,
+            'response_cache_enabled': self.response_cache_enabled,
+            'response_cache_mb': self.response_cache.max_bytes // (1024 * 1024),
+            'response_cache_ttl_hours': self.response_cache.ttl / 3600,
+            'stable_prefix_layout': self.context_builder.stable_prefix,
+            'cache_hit_price_ratio': self.cache_hit_price_ratio,
+            'model_prices': self.config.get('model_prices', {}),
+            'compare_variants': self.compare_variants_input.text(),
+            'summarize_history': self.summarizer.enabled,
+            'summary_model': self.config.get('summary_model', "v3"),
+            'summary_batch_turns': self.summarizer.batch_turns,
+            'summary_max_tokens': self.summarizer.max_tokens,
+            'log_level': self.config.get('log_level', "INFO")
+        }
+        try:
+            self.config_manager.save_config(config)
+        except Exception as e:
+            QMessageBox.warning(None, "Error", f"Can't Save Config: {str(e)}")
+
+    def closeEvent(self, event):
+        self.summarizer.shutdown()
+        self.request_engine.shutdown()
+        self.store.close()
+        self.client_manager.close()
+        if self.search_index:
+            self.search_index.close()
+        self.response_cache.close()
+        self.usage_ledger.close()
+        if self.metrics_export:
+            self.export_metrics()
+        self.save_coalesce_timer.stop()
+        self.save_state()
+        super().closeEvent(event)
+
+    def initialize_client(self):
+        api_key = self.api_key_input.text()
+        base_url = self.base_url_input.text().strip() or DEFAULT_BASE_URL
+        self.client = self.client_manager.get_client(api_key, base_url)
+
+    def create_left_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout()
+        
+        settings_btn = QPushButton("Settings")
+        settings_btn.clicked.connect(self.show_settings)
+
+        ledger_btn = QPushButton("Usage Ledger")
+        ledger_btn.clicked.connect(self.show_usage_ledger)
+
+        self.metrics_btn = QPushButton("Metrics")
+        self.metrics_btn.setCheckable(True)
+        self.metrics_btn.toggled.connect(lambda checked: self.metrics_dock.setVisible(checked))
+        
+        self.conversation_list = QListWidget()
+        self.conversation_list.itemClicked.connect(self.load_conversation)
+        self.conversation_list.itemDoubleClicked.connect(self.show_conversation_details)
+        
+        self.conversation_list.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.conversation_list.customContextMenuRequested.connect(self.show_conversation_context_menu)
+        
+        new_btn = QPushButton("New Conversation")
+        new_btn.clicked.connect(self.new_conversation)
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search history...")
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_input.textChanged.connect(self.search_timer.start)
+
+        self.search_results = QListWidget()
+        self.search_results.itemClicked.connect(self.open_search_result)
+        self.search_results.hide()
+        
+        layout.addWidget(new_btn)
+        layout.addWidget(settings_btn)
+        layout.addWidget(ledger_btn)
+        layout.addWidget(self.metrics_btn)
+        layout.addWidget(self.search_input)
+        layout.addWidget(self.search_results)
+        layout.addWidget(self.conversation_list)
+        panel.setLayout(layout)
+        return panel
+
+    def show_conversation_context_menu(self, pos):
+        item = self.conversation_list.itemAt(pos)
+        if item is None:
+            return
+        menu = QMenu()
+        rename_action = menu.addAction("Rename")
+        delete_action = menu.addAction("Delete")
+        action = menu.exec_(self.conversation_list.mapToGlobal(pos))
+        conv_id = item.data(Qt.UserRole)
+        if action == rename_action:
+            self.rename_conversation(conv_id)
+        elif action == delete_action:
+            self.delete_conversation(conv_id)
+
+    def rename_conversation(self, conv_id):
+        conv = self.conversations.get(conv_id)
+        if not conv:
+            return
+        new_name, ok = QInputDialog.getText(self, "Rename Conversation", "Enter new name:", text=conv.get('name', conv_id))
+        if ok and new_name.strip():
+            new_name = new_name.strip()
+            if self.sqlite_storage:
+                try:
+                    self.store.rename_conversation(conv, new_name)
+                except Exception as e:
+                    QMessageBox.warning(self, "Error", f"無法重新命名對話: {str(e)}")
+                    return
+                self.update_conversation_list()
+                QMessageBox.information(self, "Success", "Conversation renamed successfully.")
+                return
+            old_file = conv['file']
+            # Keeps the log's format; --migrate-logs converts between them
+            new_file = unused_log_path(new_name, compact=is_block_log(old_file), current=old_file,
+                                       taken={c['file'] for c in self.conversations.values() if c is not conv})
+            # Drops the open indexed reader, which would keep the file busy;
+            # the history list lets go of it first
+            self.history_model.set_history([])
+            # Held so a background compaction can't put the old log back
+            with self.store.file_lock(old_file):
+                self.store.forget(conv_id)
+                try:
+                    if os.path.exists(old_file):
+                        os.rename(old_file, new_file)
+                    for sidecar in (sidecar_path, summary_path):
+                        if os.path.exists(sidecar(old_file)):
+                            os.replace(sidecar(old_file), sidecar(new_file))
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+                    conv['file'] = new_file
+            if error is not None:
+                self.update_history_list()
+                QMessageBox.warning(self, "Error", f"無法重新命名檔案: {str(error)}")
+                return
+            conv['name'] = new_name
+            self.update_history_list()
+            self.update_conversation_list()
+            self.schedule_save()
+            QMessageBox.information(self, "Success", "Conversation renamed successfully.")
+
+    def delete_conversation(self, conv_id):
+        conv = self.conversations.get(conv_id)
+        if not conv:
+            return
+        reply = QMessageBox.question(self, "Delete Conversation", f"Are you sure you want to delete conversation '{conv['name']}'?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            self.cancel_conversation(conv_id)
+            self.discard_compare(conv_id)
+            if self.current_conversation and self.current_conversation['id'] == conv_id:
+                self.current_conversation = None
+                # Don't leave the log about to be closed in the history list
+                self.update_history_list()
+            self.summarizer.forget(conv_id)
+            try:
+                if self.sqlite_storage:
+                    self.store.delete_conversation(conv_id)
+                else:
+                    # Held so a background compaction can't put the log back
+                    with self.store.file_lock(conv['file']):
+                        self.store.forget(conv_id)
+                        for path in (conv['file'], sidecar_path(conv['file']), summary_path(conv['file'])):
+                            if os.path.exists(path):
+                                os.remove(path)
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"Failed to delete log file: {str(e)}")
+            self.conversations.pop(conv_id, None)
+            self.update_search_index('remove_conversation', conv_id)
+            new_conv_list = [item for item in self.config.get('conversations', []) if item['id'] != conv_id]
+            self.config['conversations'] = new_conv_list
+            self.update_conversation_list()
+            self.schedule_save()
+            QMessageBox.information(self, "Deleted", "Conversation deleted successfully.")
+
+    def create_center_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout()
+
+        self.api_group = QGroupBox("API Settings")
+        api_layout = QVBoxLayout()
+        self.api_key_input = QLineEdit()
+        self.api_key_input.setPlaceholderText("Enter API Key")
+        self.api_key_input.setEchoMode(QLineEdit.Password)
+        api_layout.addWidget(self.api_key_input)
+        
+        self.price_input = QLineEdit()
+        self.price_input.setPlaceholderText("Fallback price per 1k tokens (models without a price table)")
+        api_layout.addWidget(self.price_input)
+
+        self.base_url_input = QLineEdit()
+        self.base_url_input.setPlaceholderText(f"Base URL ({DEFAULT_BASE_URL})")
+        api_layout.addWidget(self.base_url_input)
+        self.api_group.setLayout(api_layout)
+        self.api_group.setCheckable(True)
+        self.api_group.setChecked(False)
+        layout.addWidget(self.api_group)
+        
+        control_group = QWidget()
+        ctrl_layout = QVBoxLayout()
+
+        # ========== prefix / postfix area ==========
+        prefix_layout = QHBoxLayout()
+        prefix_label = QLabel("前缀:")
+        prefix_label.setObjectName("prefixLabel")
+        prefix_layout.addWidget(prefix_label)
+        self.prefix_input = QTextEdit()
+        self.prefix_input.setMaximumHeight(60)
+        self.prefix_input.textChanged.connect(self.update_token_count)
+        prefix_layout.addWidget(self.prefix_input)
+        ctrl_layout.addLayout(prefix_layout)
+
+        suffix_layout = QHBoxLayout()
+        suffix_label = QLabel("後綴:")
+        suffix_label.setObjectName("suffixLabel")
+        suffix_layout.addWidget(suffix_label)
+        self.suffix_input = QTextEdit()
+        self.suffix_input.setMaximumHeight(60)
+        self.suffix_input.textChanged.connect(self.update_token_count)
+        suffix_layout.addWidget(self.suffix_input)
+        ctrl_layout.addLayout(suffix_layout)
+
+        param_layout = QHBoxLayout()
+        
+        temp_layout = QHBoxLayout()
+        temp_label = QLabel("Temperature:")
+        temp_label.setObjectName("tempLabel")
+        temp_layout.addWidget(temp_label)
+        self.temperature_input = QDoubleSpinBox()
+        self.temperature_input.setRange(0.0, 2.0)
+        self.temperature_input.setSingleStep(0.1)
+        self.temperature_input.setValue(0.7)
+        temp_layout.addWidget(self.temperature_input)
+        param_layout.addLayout(temp_layout)
+
+        param_layout.addStretch()
+        
+        self.drop_last_btn = QPushButton("刪除最近一次對話")
+        self.drop_last_btn.clicked.connect(self.drop_last_conversation)
+        param_layout.addWidget(self.drop_last_btn)
+
+        ctrl_layout.addLayout(param_layout)
+
+        ctrl_layout.addStretch(0)
+
+        control_group.setLayout(ctrl_layout)
+        layout.addWidget(control_group)
+        
+        # ========== Prompt Input / Output Area ==========
+        input_output_splitter = QSplitter(Qt.Vertical)
+
+        self.prompt_input = QTextEdit()
+        self.prompt_input.setPlaceholderText("Enter your prompt here...")
+        self.prompt_input.textChanged.connect(self.update_token_count)
+        
+        self.token_label = QLabel("Tokens: 0")
+        
+        send_row = QWidget()
+        send_layout = QHBoxLayout()
+        send_layout.setContentsMargins(0, 0, 0, 0)
+        self.send_btn = QPushButton("Send")
+        self.send_btn.clicked.connect(self.send_prompt)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_request)
+        self.bypass_cache_checkbox = QCheckBox("Bypass Cache")
+        self.compare_checkbox = QCheckBox("Compare")
+        self.compare_checkbox.setToolTip("Send the prompt to several models / temperatures at once")
+        self.compare_variants_input = QLineEdit(self.config.get('compare_variants', "v3, r1"))
+        self.compare_variants_input.setPlaceholderText("v3, r1 or v3@0.2, v3@1.0")
+        self.compare_variants_input.setEnabled(False)
+        self.compare_checkbox.toggled.connect(self.compare_variants_input.setEnabled)
+        send_layout.addWidget(self.send_btn, stretch=1)
+        send_layout.addWidget(self.cancel_btn)
+        send_layout.addWidget(self.bypass_cache_checkbox)
+        send_layout.addWidget(self.compare_checkbox)
+        send_layout.addWidget(self.compare_variants_input)
+        send_row.setLayout(send_layout)
+        
+        self.reasoning_group = QGroupBox("Reasoning")
+        reasoning_layout = QVBoxLayout()
+        self.reasoning_display = QTextEdit()
+        self.reasoning_display.setReadOnly(True)
+        reasoning_layout.addWidget(self.reasoning_display)
+        self.reasoning_group.setLayout(reasoning_layout)
+        self.reasoning_group.setCheckable(True)
+        self.reasoning_group.setChecked(True)
+        self.reasoning_group.toggled.connect(self.reasoning_display.setVisible)
+        self.reasoning_group.hide()
+
+        self.result_display = QTextEdit()
+        self.result_display.setReadOnly(True)
+
+        self.compare_view = CompareView()
+        self.compare_view.chosen.connect(self.choose_compare_variant)
+        self.compare_view.discarded.connect(self.discard_compare)
+        self.compare_view.hide()
+        
+        self.usage_label = QLabel("Usage: 0 tokens | Cost: $0.00")
+        self.conv_usage_label = QLabel("")
+        
+        input_output_splitter.addWidget(self.prompt_input)
+        input_output_splitter.addWidget(self.token_label)
+        input_output_splitter.addWidget(send_row)
+        input_output_splitter.addWidget(self.reasoning_group)
+        input_output_splitter.addWidget(self.result_display)
+        input_output_splitter.addWidget(self.compare_view)
+        input_output_splitter.addWidget(self.usage_label)
+        input_output_splitter.addWidget(self.conv_usage_label)
+        layout.addWidget(input_output_splitter, stretch=1)
+        panel.setLayout(layout)
+        return panel
+
+    def create_right_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout()
+        
+        self.history_model = HistoryListModel(self)
+        self.history_list = QListView()
+        self.history_list.setModel(self.history_model)
+        self.history_list.setItemDelegate(HistoryItemDelegate(self.history_list))
+        self.history_list.setMinimumWidth(250)
+        # Rows are measured lazily in batches and re-laid out on resize
+        self.history_list.setLayoutMode(QListView.Batched)
+        self.history_list.setBatchSize(200)
+        self.history_list.setResizeMode(QListView.Adjust)
+        
+        layout.addWidget(QLabel("History Log"))
+        self.history_list.setWordWrap(True)
+        self.history_list.setSpacing(5)
+        self.history_list.setStyleSheet("""
+            QListView::item {
+                padding: 5px;
+                border-bottom: 1px solid #ddd;
+                white-space: normal;
+            }
+            QListView::item:hover {
+                background-color: #f0f0f0;
+            }
+        """)
+        layout.addWidget(self.history_list)
+        panel.setLayout(layout)
+        return panel
+        
+
+    def calculate_tokens(self, text):
+        with METRICS.span("calculate_tokens"):
+            return count_tokens(text)
+
+    def update_token_count(self):
+        # Count what will actually be sent: prefix + prompt + suffix
+        text = f"{self.prefix_input.toPlainText()}{self.prompt_input.toPlainText()}{self.suffix_input.toPlainText()}"
+        self.token_service.request_count(text)
+
+    def actual_api_call(self, prompt, variants=None):
+        if not self.client:
+            self.result_display.setText("Error: API Client Uninitialized!!")
+            return False
+
+        using_model = MODEL_NAMES.get(self.current_model)
+        if using_model is None:
+            self.result_display.setText("Error: Model Should Be V3 or R1!!!")
+            return False
+
+        # Settings are captured now; history is read when the job starts,
+        # after any earlier prompts queued in this conversation have finished.
+        job = {
+            'prompt': prompt,
+            'client': self.client,
+            'model': using_model,
+            'temperature': self.temperature_input.value(),
+            'stream': self.stream_response,
+            'prefix': self.prefix_input.toPlainText(),
+            'variants': variants,
+            # Compared variants are meant to be fresh samples
+            'use_cache': self.response_cache_enabled and not self.bypass_cache_checkbox.isChecked() and not variants
+        }
+        conv_id = self.current_conversation_id()
+        self.conversation_errors.pop(conv_id, None)
+        self.scheduler.enqueue(conv_id, job)
+        return True
+
+    def start_request(self, conv_id, job):
+        conv = self.conversations.get(conv_id)
+        if conv_id is not None and conv is None:
+            # Deleted while the prompt was waiting
+            return None
+        messages = self.build_history_messages(job['prompt'], conv, job['prefix'])
+        # Counted while building, so the rate limiter needn't count again
+        tokens = self.context_builder.last_stats['tokens']
+        logger.debug("Request conv=%s model=%s messages=%d chars=%d", conv_id, job['model'],
+                     len(messages), sum(len(m['content']) for m in messages))
+        pending = {
+            'conv_id': conv_id,
+            'prompt': job['prompt'],
+            'model': job['model'],
+            'stream': job['stream'],
+            'cache_key': None,
+            'content': [],
+            'reasoning': [],
+            'started': time.perf_counter(),
+            'first_chunk': None
+        }
+        if job['variants']:
+            return self.start_compare(job, messages, pending, tokens)
+        if job['use_cache']:
+            pending['cache_key'] = cache_key(job['model'], job['temperature'], messages)
+            try:
+                cached = self.response_cache.get(pending['cache_key'])
+            except Exception as e:
+                logger.warning("Response cache lookup failed: %s", e)
+                cached = None
+            if cached is not None:
+                # Nothing to wait for: deliver the stored answer right away
+                self.finish_response(pending, cached, cache_hit=True)
+                return None
+        request_id = self.request_engine.submit(job['client'], job['model'], messages, job['temperature'],
+                                                stream=job['stream'], tokens=tokens)
+        self.pending_requests[request_id] = pending
+        return request_id
+
+    def start_compare(self, job, messages, pending, tokens):
+        # Every variant gets the same messages and they run side by side as
+        # far as the concurrency cap allows; the engine pool holds that cap,
+        # so the rest wait for a free worker. The group holds the
+        # conversation's scheduler slot until a reply is chosen or discarded.
+        group_id = f"compare-{self.next_compare_id}"
+        self.next_compare_id += 1
+        group = {'conv_id': pending['conv_id'], 'variants': []}
+        for index, (alias, temperature) in enumerate(job['variants']):
+            model = MODEL_NAMES[alias]
+            variant_pending = dict(pending, model=model, content=[], reasoning=[], compare=group_id, variant=index)
+            request_id = self.request_engine.submit(job['client'], model, messages, temperature,
+                                                    stream=job['stream'], tokens=tokens)
+            self.pending_requests[request_id] = variant_pending
+            group['variants'].append({
+                'title': f"{alias.upper()} @ {temperature:g}",
+                'request_id': request_id,
+                'pending': variant_pending,
+                'result': None,
+                'status': "Running..."
+            })
+        self.compare_groups[group_id] = group
+        if self.is_current(pending['conv_id']):
+            self.show_compare(group)
+        return group_id
+
+    def show_compare(self, group):
+        self.result_display.hide()
+        self.reasoning_group.hide()
+        self.compare_view.set_variants([variant['title'] for variant in group['variants']])
+        for index, variant in enumerate(group['variants']):
+            self.compare_view.set_text(index, "".join(variant['pending']['content']),
+                                       "".join(variant['pending']['reasoning']))
+            self.compare_view.set_status(index, variant['status'], variant['result'] is not None)
+        self.compare_view.show()
+
+    def hide_compare(self):
+        self.compare_view.hide()
+        self.result_display.show()
+
+    def compare_variant_finished(self, pending, result=None, status=""):
+        group = self.compare_groups.get(pending['compare'])
+        if group is None:
+            return
+        index = pending['variant']
+        variant = group['variants'][index]
+        if result is not None:
+            variant['result'] = result
+            entry = {'model': pending['model'], 'usage': result['usage'],
+                     'usage_details': result.get('usage_details', {})}
+            usage = usage_breakdown(entry)
+            status = f"{time.perf_counter() - pending['started']:.2f}s"
+            if pending['first_chunk'] is not None:
+                status += f" (first token {pending['first_chunk'] - pending['started']:.2f}s)"
+            status += (f" | {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens"
+                       f" | ${self.entry_cost(entry):.6f}")
+        variant['status'] = status
+        if self.is_current(group['conv_id']):
+            if result is not None and not pending['stream']:
+                self.compare_view.set_text(index, result['content'], result['reasoning_content'])
+            self.compare_view.set_status(index, status, result is not None)
+
+    def choose_compare_variant(self, index):
+        group_id = self.scheduler.active_request(self.current_conversation_id())
+        group = self.compare_groups.get(group_id)
+        if group is None or group['variants'][index]['result'] is None:
+            return
+        variant = group['variants'][index]
+        # Saved like any other reply, before the conversation's next prompt
+        # is released
+        self.finish_response(dict(variant['pending'], stream=False), variant['result'])
+        self.end_compare(group_id, index)
+
+    def discard_compare(self, conv_id=None):
+        if conv_id is None:
+            conv_id = self.current_conversation_id()
+        self.end_compare(self.scheduler.active_request(conv_id))
+
+    def end_compare(self, group_id, chosen=None):
+        group = self.compare_groups.pop(group_id, None)
+        if group is None:
+            return
+        for index, variant in enumerate(group['variants']):
+            if self.pending_requests.pop(variant['request_id'], None) is not None:
+                self.request_engine.cancel(variant['request_id'])
+            elif variant['result'] is not None and index != chosen:
+                # Replies that weren't kept were still paid for
+                self.record_extra_usage(group['conv_id'], variant['pending']['model'], variant['result'])
+        if self.is_current(group['conv_id']):
+            self.hide_compare()
+        self.scheduler.finished(group_id)
+
+    def record_extra_usage(self, conv_id, model, result):
+        # Billed calls that add no log entry
+        if conv_id not in self.conversations:
+            return
+        entry = {'model': model, 'usage': result['usage'],
+                 'usage_details': result.get('usage_details', {}), 'timestamp': time.time()}
+        try:
+            self.usage_ledger.record(conv_id, entry, self.entry_cost(entry))
+        except Exception as e:
+            logger.warning("Usage ledger update failed: %s", e)
+
+    def on_summary_updated(self, conv_id, result):
+        self.record_extra_usage(conv_id, result['model'], result)
+        if self.is_current(conv_id):
+            self.update_conversation_usage()
+
+    def build_history_messages(self, new_prompt, conv, prefix):
+        history = self.get_history(conv) if conv else []
+        self.context_builder.max_turns = self.history_limit
+        leading_messages = []
+        anchor_key = None
+        if self.context_builder.stable_prefix:
+            # The prefix becomes a fixed system message instead of being
+            # prepended to each user turn, so every request starts with the
+            # same bytes and DeepSeek can serve them from its context cache.
+            if prefix:
+                leading_messages.append({"role": "system", "content": prefix})
+            anchor_key = conv['id'] if conv else None
+        self.summarizer.keep_turns = self.history_limit
+        summary = self.summarizer.summary_for(conv, history) if conv else None
+        return self.context_builder.build(history, new_prompt, leading_messages, anchor_key, summary)
+
+    def drop_last_conversation(self):
+        if not self.current_conversation or len(self.get_history(self.current_conversation)) == 0:
+            QMessageBox.warning(self, "Failed", "No history to delete")
+            return
+
+        conv = self.current_conversation
+        if self.scheduler.is_busy(conv['id']):
+            QMessageBox.warning(self, "Failed", "此對話仍有請求進行中，請稍後再刪除")
+            return
+        old_state = (conv.get('size'), conv.get('mtime'))
+        try:
+            entry = self.store.drop_last(conv)
+        except Exception as e:
+            QMessageBox.warning(self, "Failed", f"無法更新對話紀錄文件: {str(e)}")
+            return
+        self.config_manager.mark_dirty()
+        self.update_search_index('remove_entry', conv['id'], entry)
+        self.update_search_index('note_file_state', conv['id'], self.store.location(conv), old_state,
+                                 (conv.get('size'), conv.get('mtime')))
+        self.update_history_list()
+        self.update_conversation_tooltip(self.current_conversation)
+        self.update_conversation_usage()
+        # A summary covering the dropped turn rolls back to an older checkpoint
+        self.summarizer.schedule(conv)
+        QMessageBox.information(self, "Success", "已刪除最近一次對話紀錄")
+
+    def update_history_list(self):
+        with METRICS.span("update_history_list"):
+            history = self.get_history(self.current_conversation) if self.current_conversation else []
+            if history is self.history_model.history:
+                self.history_model.sync()
+            else:
+                # Laying out variable-height rows would parse every entry;
+                # with one row height a single pass is only arithmetic
+                lazy = not isinstance(history, list)
+                self.history_list.itemDelegate().fixed_lines = FIXED_PREVIEW_LINES if lazy else 0
+                self.history_list.setUniformItemSizes(lazy)
+                self.history_list.setLayoutMode(QListView.SinglePass if lazy else QListView.Batched)
+                self.history_model.set_history(history)
+
+    def send_prompt(self):
+        self.initialize_client()
+        
+        if not self.client or not self.client.api_key:
+            self.result_display.setText("Error: Please enter valid API Key")
+            return
+
+        variants = None
+        if self.compare_checkbox.isChecked():
+            try:
+                variants = parse_variants(self.compare_variants_input.text(), self.temperature_input.value())
+            except ValueError as e:
+                self.result_display.setText(f"Error: {e}")
+                return
+
+        prompt = self.prompt_input.toPlainText()
+        prefix = self.prefix_input.toPlainText()
+        suffix = self.suffix_input.toPlainText()
+        if self.context_builder.stable_prefix:
+            prefix = ""
+        full_prompt = compose_prompt(prefix, prompt, suffix)
+        if not full_prompt:
+            self.result_display.setText("Error: Prompt Can't be empty")
+            return
+
+        if not self.scheduler.is_busy(self.current_conversation_id()):
+            # A busy conversation keeps showing its running reply; the new
+            # prompt waits in its queue.
+            self.stream_buffer = []
+            self.reasoning_buffer = []
+            self.result_display.clear()
+            self.result_display.setPlaceholderText("Waiting for response...")
+            self.reasoning_display.clear()
+            self.reasoning_group.setVisible(self.current_model == "r1")
+            self.display_conv_id = self.current_conversation_id()
+        self.actual_api_call(full_prompt, variants)
+
+    def setup_stream_render(self):
+        # Chunks are buffered and flushed on a timer so the QTextEdit
+        # re-lays out a few times per second instead of once per token.
+        self.stream_render_timer = QTimer(self)
+        self.stream_render_timer.setInterval(50)
+        self.stream_render_timer.timeout.connect(self.flush_stream_buffer)
+
+    def on_request_chunk(self, request_id, content, reasoning):
+        pending = self.pending_requests.get(request_id)
+        if pending is None:
+            return
+        if pending['first_chunk'] is None:
+            pending['first_chunk'] = time.perf_counter()
+            METRICS.record("api_call.ttft", pending['first_chunk'] - pending['started'])
+        pending['content'].append(content)
+        pending['reasoning'].append(reasoning)
+        if not self.is_current(pending['conv_id']):
+            return
+        if 'compare' in pending:
+            self.compare_view.append(pending['variant'], content, reasoning)
+            return
+        if content:
+            self.stream_buffer.append(content)
+        if reasoning:
+            self.reasoning_buffer.append(reasoning)
+        if not self.stream_render_timer.isActive():
+            self.stream_render_timer.start()
+
+    def flush_stream_buffer(self):
+        if self.reasoning_buffer:
+            self.append_to_display(self.reasoning_display, "".join(self.reasoning_buffer))
+            self.reasoning_buffer = []
+        if self.stream_buffer:
+            self.append_to_display(self.result_display, "".join(self.stream_buffer))
+            self.stream_buffer = []
+        self.stream_render_timer.stop()
+
+    def append_to_display(self, display, text):
+        scrollbar = display.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 4
+        cursor = display.textCursor()
+        cursor.movePosition(cursor.End)
+        cursor.insertText(text)
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def current_conversation_id(self):
+        return self.current_conversation['id'] if self.current_conversation else None
+
+    def is_current(self, conv_id):
+        return conv_id == self.current_conversation_id()
+
+    def cancel_request(self):
+        self.cancel_conversation(self.current_conversation_id())
+
+    def cancel_conversation(self, conv_id):
+        self.scheduler.clear_queue(conv_id)
+        request_id = self.scheduler.active_request(conv_id)
+        group = self.compare_groups.get(request_id)
+        if group is not None:
+            # Running variants stop; finished ones can still be chosen
+            for variant in group['variants']:
+                self.request_engine.cancel(variant['request_id'])
+        elif request_id is not None:
+            self.request_engine.cancel(request_id)
+
+    def update_request_buttons(self):
+        self.cancel_btn.setEnabled(self.scheduler.is_busy(self.current_conversation_id()))
+
+    def on_scheduler_status(self, conv_id):
+        self.close_retired_clients()
+        self.update_conversation_badge(conv_id)
+        if self.is_current(conv_id):
+            self.update_request_buttons()
+
+    def on_request_completed(self, request_id, result):
+        pending = self.pending_requests.pop(request_id, None)
+        if pending is None:
+            return
+        METRICS.record("api_call.total", time.perf_counter() - pending['started'])
+        if pending['cache_key']:
+            try:
+                self.response_cache.put(pending['cache_key'], result)
+            except Exception as e:
+                logger.warning("Response cache store failed: %s", e)
+        if 'compare' in pending:
+            self.compare_variant_finished(pending, result=result)
+            return
+        self.finish_response(pending, result)
+        # Only now may the conversation's next prompt start: it needs this
+        # reply in its history.
+        self.scheduler.finished(request_id)
+
+    def finish_response(self, pending, result, cache_hit=False):
+        response = result['content']
+        reasoning = result['reasoning_content']
+        usage = 0 if cache_hit else result['usage']
+        logger.debug("Response conv=%s chars=%d reasoning_chars=%d cache_hit=%s", pending['conv_id'],
+                     len(response), len(reasoning), cache_hit)
+        details = {} if cache_hit else result.get('usage_details', {})
+        if self.is_current(pending['conv_id']):
+            if pending['stream'] and not cache_hit:
+                self.flush_stream_buffer()
+            else:
+                self.result_display.setText(response)
+                self.reasoning_display.setText(reasoning)
+            self.reasoning_group.setVisible(bool(reasoning))
+            self.update_usage({'model': pending['model'], 'usage': usage, 'usage_details': details,
+                               'cache_hit': cache_hit})
+
+        conv = self.conversations.get(pending['conv_id'])
+        if conv:
+            self.save_conversation(pending['prompt'], response, usage, conv, reasoning, cache_hit, details,
+                                   pending['model'])
+            if conv is self.current_conversation:
+                self.update_history_list()
+                self.update_conversation_usage()
+            self.update_conversation_tooltip(conv)
+            self.summarizer.schedule(conv)
+
+    def on_request_failed(self, request_id, message):
+        pending = self.pending_requests.pop(request_id, None)
+        if pending is None:
+            return
+        if 'compare' in pending:
+            self.compare_variant_finished(pending, status=message)
+            return
+        if self.is_current(pending['conv_id']):
+            self.flush_stream_buffer()
+            self.result_display.setText(message)
+        else:
+            self.conversation_errors[pending['conv_id']] = message
+        self.scheduler.finished(request_id)
+
+    def on_request_cancelled(self, request_id):
+        pending = self.pending_requests.pop(request_id, None)
+        if pending is None:
+            return
+        if 'compare' in pending:
+            self.compare_variant_finished(pending, status="[Request cancelled]")
+            return
+        if self.is_current(pending['conv_id']):
+            self.flush_stream_buffer()
+            self.append_to_display(self.result_display, "\n\n[Request cancelled]")
+        self.scheduler.finished(request_id)
+
+    def on_request_waiting(self, request_id, seconds, reason):
+        pending = self.pending_requests.get(request_id)
+        if pending is None:
+            return
+        if seconds > 0:
+            pending['wait'] = (time.monotonic() + seconds, reason)
+            if not self.wait_display_timer.isActive():
+                self.wait_display_timer.start()
+        elif pending.pop('wait', None) is not None:
+            # Latency is measured from when the request actually went out
+            pending['started'] = time.perf_counter()
+        self.show_request_wait(pending)
+
+    def wait_seconds(self, pending):
+        return max(0, int(pending['wait'][0] - time.monotonic() + 0.999))
+
+    def wait_text(self, pending):
+        if 'wait' not in pending:
+            return ""
+        return f"Waiting {self.wait_seconds(pending)}s ({pending['wait'][1]})..."
+
+    def show_request_wait(self, pending):
+        if 'compare' in pending:
+            group = self.compare_groups.get(pending['compare'])
+            if group is None:
+                return
+            variant = group['variants'][pending['variant']]
+            if variant['result'] is None:
+                variant['status'] = self.wait_text(pending) or "Running..."
+                if self.is_current(group['conv_id']):
+                    self.compare_view.set_status(pending['variant'], variant['status'], False)
+            return
+        if self.is_current(pending['conv_id']):
+            self.result_display.setPlaceholderText(self.wait_text(pending) or "Waiting for response...")
+        self.update_conversation_badge(pending['conv_id'])
+
+    def refresh_request_waits(self):
+        waiting = [pending for pending in self.pending_requests.values() if 'wait' in pending]
+        for pending in waiting:
+            self.show_request_wait(pending)
+        if not waiting:
+            self.wait_display_timer.stop()
+
+    def current_price(self):
+        try:
+            return float(self.price_input.text()) if self.price_input.text() else 0.0
+        except ValueError:
+            return 0.0
+
+    def entry_cost(self, entry):
+        return entry_cost(entry, self.model_prices, self.current_price(), self.cache_hit_price_ratio)
+
+    def update_usage(self, entry):
+        cost = self.entry_cost(entry)
+        if entry['usage_details']:
+            usage = usage_breakdown(entry)
+            text = (f"Usage: {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion"
+                    f" ({usage['reasoning_tokens']} reasoning) tokens | Cost: ${cost:.6f}")
+        else:
+            text = f"Usage: {entry['usage']} tokens | Cost: ${cost:.6f}"
+        if entry['cache_hit']:
+            text += " (cache hit)"
+        if self.response_cache_enabled:
+            stats = self.response_cache.stats()
+            text += f" | Cache: {stats['hits']} hits / {stats['misses']} misses"
+        self.usage_label.setText(text)
+
+    def update_conversation_usage(self):
+        if not self.current_conversation:
+            self.conv_usage_label.setText("")
+            return
+        # The ledger has the totals, including replies that weren't kept
+        try:
+            summary = self.usage_ledger.conversation_totals(self.current_conversation['id'])
+        except Exception as e:
+            logger.warning("Usage ledger read failed: %s", e)
+            return
+        self.conv_usage_label.setText(
+            f"Conversation: context cache hit {summary['hit_ratio']:.0%} "
+            f"({summary['hit_tokens']} / {summary['hit_tokens'] + summary['miss_tokens']} prompt tokens)"
+            f" | Effective cost: ${summary['cost']:.6f}")
+
+    def new_conversation(self):
+        conv_id = str(int(time.time()))
+        while conv_id in self.conversations:
+            conv_id = str(int(conv_id) + 1)
+        if self.use_timestamp:
+            new_name = f"Conversation {conv_id}"
+        else:
+            new_name, ok = QInputDialog.getText(self, "New Conversation Name", "Enter conversation name:")
+            if not ok or not new_name.strip():
+                return
+            new_name = new_name.strip()
+        conv_data = {
+            'id': conv_id,
+            'name': new_name,
+            'entry_count': 0,
+            'last_timestamp': None
+        }
+        if self.sqlite_storage:
+            try:
+                self.store.create_conversation(conv_data)
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"無法建立對話: {str(e)}")
+                return
+            conv_id = conv_data['id']
+        else:
+            # Two conversations with the same name get separate logs
+            conv_data['file'] = unused_log_path(new_name, compact=self.config.get('log_format') == "compact",
+                                                taken={conv['file'] for conv in self.conversations.values()})
+            self.config.setdefault('conversations', []).append(conv_data)
+        self.current_conversation = conv_data
+        self.conversations[conv_id] = conv_data
+        self.store.pin(conv_id)
+        self.hide_compare()
+        self.update_conversation_list()
+        self.schedule_save()
+
+    def save_conversation(self, prompt, response, usage, conv=None, reasoning="", cache_hit=False, usage_details=None,
+                          model=None):
+        with METRICS.span("save_conversation"):
+            conv = conv or self.current_conversation
+            entry = {
+                'prompt': prompt,
+                'response': response,
+                'usage': usage,
+                'timestamp': time.time()
+            }
+            if model:
+                entry['model'] = model
+            if reasoning:
+                entry['reasoning_content'] = reasoning
+            if cache_hit:
+                entry['cache_hit'] = True
+            if usage_details:
+                entry['usage_details'] = usage_details
+            old_state = (conv.get('size'), conv.get('mtime'))
+            self.store.append_entry(conv, entry)
+            # Metadata changed in memory; the autosave timer persists it
+            self.config_manager.mark_dirty()
+            self.update_search_index('add_entry', conv['id'], entry)
+            self.update_search_index('note_file_state', conv['id'], self.store.location(conv), old_state,
+                                     (conv.get('size'), conv.get('mtime')))
+            try:
+                self.usage_ledger.record(conv['id'], entry, self.entry_cost(entry))
+            except Exception as e:
+                logger.warning("Usage ledger update failed: %s", e)
+
+    def update_search_index(self, method, *args):
+        if not self.search_index:
+            return
+        try:
+            getattr(self.search_index, method)(*args)
+        except Exception as e:
+            # A stale index is rebuilt by the next sync; never fail a save over it
+            logger.warning("Search index update failed: %s", e)
+
+    def run_search(self):
+        query = self.search_input.text()
+        self.search_results.clear()
+        if not query.strip() or not self.search_index:
+            self.search_results.hide()
+            return
+        try:
+            rows = self.search_index.search(query)
+        except Exception as e:
+            logger.warning("Search failed: %s", e)
+            rows = []
+        for conv_id, timestamp, snippet in rows:
+            conv = self.conversations.get(conv_id)
+            if not conv:
+                continue
+            item = QListWidgetItem(f"{conv.get('name', conv_id)}: {' '.join(snippet.split())}")
+            item.setData(Qt.UserRole, (conv_id, timestamp))
+            self.search_results.addItem(item)
+        if not self.search_results.count():
+            self.search_results.addItem(QListWidgetItem("No results"))
+        self.search_results.show()
+
+    def open_search_result(self, item):
+        target = item.data(Qt.UserRole)
+        if not target:
+            return
+        conv_id, timestamp = target
+        if conv_id not in self.conversations:
+            return
+        self.select_conversation(conv_id)
+        for i in range(self.conversation_list.count()):
+            if self.conversation_list.item(i).data(Qt.UserRole) == conv_id:
+                self.conversation_list.setCurrentRow(i)
+                break
+        idx = find_entry_index(self.get_history(self.current_conversation), timestamp)
+        if idx >= 0:
+            index = self.history_model.index(self.history_model.row_for_entry(idx))
+            self.history_list.setCurrentIndex(index)
+            self.history_list.scrollTo(index, QListView.PositionAtCenter)
+
+    def load_conversations(self):
+        # Only metadata is read here; histories load on demand in get_history
+        if self.sqlite_storage:
+            try:
+                for conv_item in self.store.list_conversations():
+                    self.conversations[conv_item['id']] = conv_item
+            except Exception as e:
+                QMessageBox.warning(self, "載入錯誤", f"無法讀取對話資料庫: {str(e)}")
+            self.update_conversation_list()
+            return
+        conv_list = []
+        for conv_item in self.config.get('conversations', []):
+            conv_id = conv_item['id']
+            conv_item.setdefault('name', f"Conversation {conv_id}")
+            conv_item.setdefault('file', f"log/{conv_id}.txt")
+            try:
+                exists = self.store.refresh_metadata(conv_item)
+            except Exception as e:
+                logger.warning("Can't scan %s: %s", conv_item['file'], e)
+                exists = os.path.exists(conv_item['file'])
+            if exists:
+                self.conversations[conv_id] = conv_item
+                conv_list.append(conv_item)
+        self.config['conversations'] = conv_list
+        self.update_conversation_list()
+
+    def update_conversation_list(self):
+        self.conversation_list.clear()
+        for conv in self.conversations.values():
+            item = QListWidgetItem(self.conversation_label(conv))
+            item.setData(Qt.UserRole, conv['id'])
+            item.setToolTip(self.conversation_tooltip(conv))
+            self.conversation_list.addItem(item)
+
+    def conversation_label(self, conv):
+        label = conv.get('name', conv['id'])
+        request_id = self.scheduler.active_request(conv['id'])
+        if request_id in self.compare_groups:
+            label += "  [比較中]"
+        elif request_id is not None:
+            pending = self.pending_requests.get(request_id)
+            if pending is not None and 'wait' in pending:
+                label += f"  [等待 {self.wait_seconds(pending)}s]"
+            else:
+                label += "  [回應中]"
+        queued = self.scheduler.queued(conv['id'])
+        if queued:
+            label += f"  [+{queued} 排隊]"
+        if conv['id'] in self.conversation_errors:
+            label += "  [錯誤]"
+        return label
+
+    def update_conversation_badge(self, conv_id):
+        conv = self.conversations.get(conv_id)
+        if conv is None:
+            return
+        for i in range(self.conversation_list.count()):
+            item = self.conversation_list.item(i)
+            if item.data(Qt.UserRole) == conv_id:
+                item.setText(self.conversation_label(conv))
+                break
+
+    def conversation_tooltip(self, conv):
+        tooltip = f"{conv.get('entry_count', 0)} entries"
+        if conv.get('last_timestamp'):
+            tooltip += f" | last: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(conv['last_timestamp']))}"
+        return tooltip
+
+    def update_conversation_tooltip(self, conv):
+        for i in range(self.conversation_list.count()):
+            item = self.conversation_list.item(i)
+            if item.data(Qt.UserRole) == conv['id']:
+                item.setToolTip(self.conversation_tooltip(conv))
+                break
+
+    def load_conversation(self, item):
+        self.select_conversation(item.data(Qt.UserRole))
+
+    def select_conversation(self, conv_id):
+        self.current_conversation = self.conversations[conv_id]
+        if self.current_conversation:
+            self.store.pin(conv_id)
+            self.update_history_list()
+            self.update_conversation_usage()
+            self.show_conversation_progress(conv_id)
+            self.update_request_buttons()
+            self.summarizer.schedule(self.current_conversation)
+
+    def show_conversation_progress(self, conv_id):
+        # Switching to a conversation with a reply in flight shows what has
+        # streamed so far; later chunks append as usual.
+        self.stream_buffer = []
+        self.reasoning_buffer = []
+        request_id = self.scheduler.active_request(conv_id)
+        pending = self.pending_requests.get(request_id) if request_id is not None else None
+        group = self.compare_groups.get(request_id)
+        if group is not None:
+            self.show_compare(group)
+            self.display_conv_id = conv_id
+            return
+        self.hide_compare()
+        if pending is not None:
+            reasoning = "".join(pending['reasoning'])
+            self.result_display.setText("".join(pending['content']))
+            self.result_display.setPlaceholderText(self.wait_text(pending) or "Waiting for response...")
+            self.reasoning_display.setText(reasoning)
+            self.reasoning_group.setVisible(bool(reasoning) or pending['model'] == MODEL_NAMES['r1'])
+        elif conv_id in self.conversation_errors:
+            self.result_display.setText(self.conversation_errors.pop(conv_id))
+            self.update_conversation_badge(conv_id)
+        elif self.display_conv_id != conv_id:
+            # Don't leave another conversation's reply on screen
+            self.result_display.clear()
+            self.reasoning_display.clear()
+            self.reasoning_group.hide()
+        self.display_conv_id = conv_id
+
+    def get_history(self, conv):
+        try:
+            if self.store.is_loaded(conv['id']):
+                return self.store.get_history(conv)
+            with METRICS.span("load_conversation_history"):
+                return self.store.get_history(conv)
+        except Exception as e:
+            QMessageBox.warning(self, "載入錯誤", f"無法載入對話紀錄: {str(e)}")
+            # Not cached, so the next access tries the log again
+            return []
+
+    def load_conversation_history(self, conv_id):
+        conv = self.conversations.get(conv_id) or {'id': conv_id, 'file': f"log/{conv_id}.txt"}
+        try:
+            with METRICS.span("load_conversation_history"):
+                return list(self.store.iter_entries(conv))
+        except Exception as e:
+            QMessageBox.warning(self, "載入錯誤", f"無法載入對話紀錄: {str(e)}")
+            return []
+        
+    def show_settings(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Settings")
+        layout = QVBoxLayout()
+        
+        history_limit_spin = QSpinBox()
+        history_limit_spin.setRange(1, 1000)
+        history_limit_spin.setValue(self.history_limit)
+        history_limit_spin.valueChanged.connect(lambda v: setattr(self, 'history_limit', v))
+        
+        layout.addWidget(QLabel("最大歷史紀錄輪數:"))
+        layout.addWidget(history_limit_spin)
+
+        budget_spin = QSpinBox()
+        budget_spin.setRange(1000, 1000000)
+        budget_spin.setSingleStep(1000)
+        budget_spin.setValue(self.context_builder.token_budget)
+        budget_spin.valueChanged.connect(lambda v: setattr(self.context_builder, 'token_budget', v))
+        layout.addWidget(QLabel("上下文 Token 預算:"))
+        layout.addWidget(budget_spin)
+
+        keep_first_checkbox = QCheckBox("Keep First Turn")
+        keep_first_checkbox.setChecked(self.context_builder.keep_first_turn)
+        keep_first_checkbox.stateChanged.connect(
+            lambda state: setattr(self.context_builder, 'keep_first_turn', state == Qt.Checked))
+        layout.addWidget(keep_first_checkbox)
+
+        truncate_checkbox = QCheckBox("Truncate Oversized Responses")
+        truncate_checkbox.setChecked(self.context_builder.truncate_oversized)
+        truncate_checkbox.stateChanged.connect(
+            lambda state: setattr(self.context_builder, 'truncate_oversized', state == Qt.Checked))
+        layout.addWidget(truncate_checkbox)
+
+        placeholder_checkbox = QCheckBox("Mark Omitted Turns")
+        placeholder_checkbox.setChecked(self.context_builder.summary_placeholder)
+        placeholder_checkbox.stateChanged.connect(
+            lambda state: setattr(self.context_builder, 'summary_placeholder', state == Qt.Checked))
+        layout.addWidget(placeholder_checkbox)
+        
+        layout.addWidget(QLabel("使用模型:"))
+
+        # 新增水平布局放置 RadioButton
+        model_layout = QHBoxLayout()
+        self.v3_radio = QRadioButton("V3")
+        self.r1_radio = QRadioButton("R1")
+        
+        # 设置互斥组
+        radio_group = QButtonGroup(dialog)
+        radio_group.addButton(self.v3_radio)
+        radio_group.addButton(self.r1_radio)
+        
+        # 设置默认选中
+        if self.current_model == "v3":
+            self.v3_radio.setChecked(True)
+        else:
+            self.r1_radio.setChecked(True)
+        
+        # 连接信号
+        self.v3_radio.toggled.connect(lambda: setattr(self, 'current_model', 'v3'))
+        self.r1_radio.toggled.connect(lambda: setattr(self, 'current_model', 'r1'))
+        model_layout.addWidget(self.v3_radio)
+        model_layout.addWidget(self.r1_radio)
+        layout.addLayout(model_layout)
+        
+        # 新增 Use Timestamp 的 Checkbox
+        timestamp_checkbox = QCheckBox("Use Timestamp")
+        timestamp_checkbox.setChecked(self.use_timestamp)
+        timestamp_checkbox.stateChanged.connect(lambda state: setattr(self, 'use_timestamp', state == Qt.Checked))
+        layout.addWidget(timestamp_checkbox)
+
+        stream_checkbox = QCheckBox("Stream Responses")
+        stream_checkbox.setChecked(self.stream_response)
+        stream_checkbox.stateChanged.connect(lambda state: setattr(self, 'stream_response', state == Qt.Checked))
+        layout.addWidget(stream_checkbox)
+
+        stable_checkbox = QCheckBox("Stable Prefix (prefix as system message, for DeepSeek context caching)")
+        stable_checkbox.setChecked(self.context_builder.stable_prefix)
+        stable_checkbox.stateChanged.connect(
+            lambda state: setattr(self.context_builder, 'stable_prefix', state == Qt.Checked))
+        layout.addWidget(stable_checkbox)
+
+        summary_checkbox = QCheckBox("Summarize Older Turns (in the background, with V3)")
+        summary_checkbox.setChecked(self.summarizer.enabled)
+        summary_checkbox.stateChanged.connect(lambda state: self.set_summarize_history(state == Qt.Checked))
+        layout.addWidget(summary_checkbox)
+
+        metrics_checkbox = QCheckBox(f"Export Metrics (every minute to {METRICS_FILE})")
+        metrics_checkbox.setChecked(self.metrics_export)
+        metrics_checkbox.stateChanged.connect(lambda state: self.set_metrics_export(state == Qt.Checked))
+        layout.addWidget(metrics_checkbox)
+
+        cache_checkbox = QCheckBox("Response Cache (reuse answers to identical requests)")
+        cache_checkbox.setChecked(self.response_cache_enabled)
+        cache_checkbox.stateChanged.connect(lambda state: setattr(self, 'response_cache_enabled', state == Qt.Checked))
+        layout.addWidget(cache_checkbox)
+
+        timeout_spin = QDoubleSpinBox()
+        timeout_spin.setRange(5.0, 3600.0)
+        timeout_spin.setValue(self.client_manager.timeout)
+        layout.addWidget(QLabel("Request Timeout (s):"))
+        layout.addWidget(timeout_spin)
+
+        retries_spin = QSpinBox()
+        retries_spin.setRange(0, 10)
+        retries_spin.setValue(self.retry_policy.max_retries)
+        retries_spin.valueChanged.connect(lambda v: setattr(self.retry_policy, 'max_retries', v))
+        layout.addWidget(QLabel("Max Retries (429/5xx, with backoff):"))
+        layout.addWidget(retries_spin)
+
+        rpm_spin = QSpinBox()
+        rpm_spin.setRange(0, 100000)
+        rpm_spin.setSpecialValueText("Unlimited")
+        rpm_spin.setValue(self.request_gate.requests.per_minute)
+        rpm_spin.valueChanged.connect(self.request_gate.requests.set_rate)
+        layout.addWidget(QLabel("Requests per Minute:"))
+        layout.addWidget(rpm_spin)
+
+        tpm_spin = QSpinBox()
+        tpm_spin.setRange(0, 100000000)
+        tpm_spin.setSingleStep(1000)
+        tpm_spin.setSpecialValueText("Unlimited")
+        tpm_spin.setValue(self.request_gate.tokens.per_minute)
+        tpm_spin.valueChanged.connect(self.request_gate.tokens.set_rate)
+        layout.addWidget(QLabel("Tokens per Minute:"))
+        layout.addWidget(tpm_spin)
+
+        pool_spin = QSpinBox()
+        pool_spin.setRange(1, 100)
+        pool_spin.setValue(self.client_manager.pool_size)
+        layout.addWidget(QLabel("Connection Pool Size:"))
+        layout.addWidget(pool_spin)
+
+        concurrent_spin = QSpinBox()
+        concurrent_spin.setRange(1, 32)
+        concurrent_spin.setValue(self.scheduler.max_concurrent)
+        concurrent_spin.valueChanged.connect(self.set_max_concurrent)
+        layout.addWidget(QLabel("Max Concurrent Requests (all conversations):"))
+        layout.addWidget(concurrent_spin)
+        
+        save_btn = QPushButton("保存設置")
+        save_btn.clicked.connect(dialog.accept)
+        layout.addWidget(save_btn)
+        
+        dialog.setLayout(layout)
+        if dialog.exec_() == QDialog.Accepted:
+            # Rebuilding the clients drops their pools, so only on save
+            if self.client_manager.configure(timeout=timeout_spin.value(), pool_size=pool_spin.value()):
+                self.initialize_client()
+                self.close_retired_clients()
+        self.schedule_save()
+
+    def close_retired_clients(self):
+        if not self.client_manager.retired:
+            return
+        in_use = [request['client'] for request in self.request_engine.requests.values()]
+        in_use += [job['client'] for queue in self.scheduler.queues.values() for job in queue]
+        if self.summarizer.running is not None:
+            in_use.append(self.summarizer.running_client)
+        self.client_manager.close_retired(in_use)
+
+    def set_summarize_history(self, enabled):
+        self.summarizer.enabled = enabled
+        self.summarizer.schedule(self.current_conversation)
+
+    def set_max_concurrent(self, value):
+        self.request_engine.pool.setMaxThreadCount(value)
+        self.scheduler.set_max_concurrent(value)
+
+    def show_usage_ledger(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Usage Ledger")
+        layout = QVBoxLayout()
+        tabs = QTabWidget()
+        headers = ["Requests", "Prompt", "Completion", "Reasoning", "Cache Hit", "Cache Miss", "Cost ($)"]
+        for group_by, title, first_header in (('conv_id', "By Conversation", "Conversation"),
+                                              ('day', "By Day", "Day"),
+                                              ('model', "By Model", "Model")):
+            try:
+                rows = self.usage_ledger.totals(group_by)
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"Can't read usage ledger: {str(e)}")
+                return
+            table = QTableWidget(len(rows), len(headers) + 1)
+            table.setHorizontalHeaderLabels([first_header] + headers)
+            table.setEditTriggers(QTableWidget.NoEditTriggers)
+            table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+            for row, values in enumerate(rows):
+                key = values[0]
+                if group_by == 'conv_id' and key in self.conversations:
+                    key = self.conversations[key].get('name', key)
+                cells = [str(key)] + [str(v or 0) for v in values[1:-1]] + [f"{values[-1] or 0:.4f}"]
+                for column, text in enumerate(cells):
+                    table.setItem(row, column, QTableWidgetItem(text))
+            tabs.addTab(table, title)
+        layout.addWidget(tabs)
+        dialog.setLayout(layout)
+        dialog.resize(900, 500)
+        dialog.exec_()
+
+    def show_conversation_details(self, item):
+        conv_id = item.data(Qt.UserRole)
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f"對話詳情 - {conv_id}")
+        layout = QVBoxLayout()
+        
+        text_edit = ConversationDetailView(self.get_history(self.conversations[conv_id]))
+        range_label = QLabel()
+        text_edit.range_changed.connect(
+            lambda start, end, total: range_label.setText(f"第 {start + 1 if total else 0}-{end} 筆，共 {total} 筆"))
+
+        layout.addWidget(text_edit)
+        layout.addWidget(range_label)
+        dialog.setLayout(layout)
+        dialog.resize(800, 600)
+        dialog.exec_()
+
+    def get_stylesheet(self):
+        return """
+            QMainWindow {
+                background-color: #f0f0f0;
+            }
+            QGroupBox {
+                border: 1px solid gray;
+                border-radius: 5px;
+                margin-top: 1ex;
+            }
+            QGroupBox::title {
+                subcontrol-origin: margin;
+                left: 10px;
+                padding: 0 3px;
+            }
+            QTextEdit {
+                border: 1px solid #cccccc;
+                border-radius: 4px;
+                padding: 5px;
+            }
+            QPushButton {
+                background-color: #4CAF50;
+                color: white;
+                border: none;
+                padding: 8px;
+                border-radius: 4px;
+            }
+            QPushButton:hover {
+                background-color: #45a049;
+            }
+            QListWidget::item {
+                padding: 5px;
+                border-bottom: 1px solid #ddd;
+            }
+            QListWidget::item:hover {
+                background-color: #e0e0e0;
+            }
+        """
+
+
+def run_gui(profile=None, log_level=None):
+    profile = profile or StartupProfile()
+    app = QApplication([])
+    profile.mark("QApplication")
+    window = DeepSeekUI(profile, log_level)
+    window.show()
+    profile.mark("window show")
+
+    def first_paint():
+        profile.mark("first paint")
+        profile.report()
+        window.start_warm_up()
+
+    QTimer.singleShot(0, first_paint)
+    return app.exec_()
\ No newline at end of file
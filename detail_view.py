@@ -0,0 +1,130 @@
+import time
+from collections import deque
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtWidgets import QTextEdit
+
+PAGE_SIZE = 50
+MAX_PAGES = 4
+SEPARATOR = "\n" + "-" * 50 + "\n"
+
+
+def format_entry(entry):
+    # One strftime per entry; prompt and response share the timestamp
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['timestamp']))
+    return (f"[用户 {stamp}]\n{entry['prompt']}\n\n"
+            f"[助理 {stamp}]\n{entry['response']}\n{SEPARATOR}\n")
+
+
+def qt_length(text):
+    # QTextDocument positions count UTF-16 code units
+    return len(text.encode("utf-16-le")) // 2
+
+
+class ConversationDetailView(QTextEdit):
+    # Read-only transcript that renders PAGE_SIZE entries at a time and keeps
+    # at most MAX_PAGES of them in the document. Pages are added as the user
+    # scrolls towards either end and dropped from the far end, so opening is
+    # instant and memory stays bounded however long the conversation is.
+    range_changed = pyqtSignal(int, int, int)
+
+    def __init__(self, history, parent=None, page_size=PAGE_SIZE, max_pages=MAX_PAGES):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.history = history
+        self.page_size = page_size
+        self.max_pages = max_pages
+        # (first entry, entry count, document length) of each rendered page
+        self.pages = deque()
+        self.adjusting = False
+        self.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        self.append_page()
+
+    def first_entry(self):
+        return self.pages[0][0] if self.pages else 0
+
+    def end_entry(self):
+        return self.pages[-1][0] + self.pages[-1][1] if self.pages else 0
+
+    def render_page(self, start):
+        end = min(start + self.page_size, len(self.history))
+        return "".join(format_entry(entry) for entry in self.history[start:end]), end - start
+
+    def append_page(self):
+        start = self.end_entry()
+        if start >= len(self.history):
+            return False
+        text, count = self.render_page(start)
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        self.pages.append((start, count, qt_length(text)))
+        if len(self.pages) > self.max_pages:
+            self.drop_page(top=True)
+        return True
+
+    def prepend_page(self):
+        end = self.first_entry()
+        if end <= 0:
+            return False
+        start = max(0, end - self.page_size)
+        text, count = self.render_page(start)
+        length = qt_length(text)
+        cursor = QTextCursor(self.document())
+        cursor.insertText(text)
+        self.pages.appendleft((start, count, length))
+        if len(self.pages) > self.max_pages:
+            self.drop_page(top=False)
+        # Keep the text under the viewport where it was
+        scroll_bar = self.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.value() + self.height_before(length))
+        return True
+
+    def height_before(self, position):
+        block = self.document().findBlock(position)
+        return int(self.document().documentLayout().blockBoundingRect(block).top())
+
+    def drop_page(self, top):
+        cursor = QTextCursor(self.document())
+        if top:
+            length = self.pages.popleft()[2]
+            removed = self.height_before(length)
+            cursor.setPosition(length, QTextCursor.KeepAnchor)
+        else:
+            length = self.pages.pop()[2]
+            cursor.movePosition(QTextCursor.End)
+            cursor.setPosition(cursor.position() - length, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        if top:
+            scroll_bar = self.verticalScrollBar()
+            scroll_bar.setValue(scroll_bar.value() - removed)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.fill_viewport()
+
+    def fill_viewport(self):
+        # Short pages may not fill the viewport, leaving nothing to scroll
+        while (self.verticalScrollBar().maximum() == 0 and len(self.pages) < self.max_pages
+               and self.append_page()):
+            pass
+        self.range_changed.emit(*self.visible_range())
+
+    def on_scroll(self, value):
+        # Our own scroll adjustments re-enter here
+        if self.adjusting:
+            return
+        scroll_bar = self.verticalScrollBar()
+        margin = self.viewport().height()
+        self.adjusting = True
+        try:
+            if value >= scroll_bar.maximum() - margin:
+                self.append_page()
+            elif value <= margin:
+                self.prepend_page()
+        finally:
+            self.adjusting = False
+        self.range_changed.emit(*self.visible_range())
+
+    def visible_range(self):
+        return self.first_entry(), self.end_entry(), len(self.history)
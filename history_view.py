@@ -0,0 +1,95 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QSize
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QStyledItemDelegate, QListView
+
+PREVIEW_LENGTH = 50
+# Row height, in lines, for histories read on demand
+FIXED_PREVIEW_LINES = 2
+USER_BACKGROUND = QColor(240, 240, 240)
+
+
+class HistoryListModel(QAbstractListModel):
+    # Two rows per entry: the prompt, then the response
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.history = []
+        self.row_count = 0
+
+    def set_history(self, history):
+        self.beginResetModel()
+        self.history = history if history is not None else []
+        self.row_count = 2 * len(self.history)
+        self.endResetModel()
+
+    def sync(self):
+        # The history list is appended to / popped from in place by the store;
+        # only the rows that changed at the tail are inserted or removed.
+        target = 2 * len(self.history)
+        if target > self.row_count:
+            self.beginInsertRows(QModelIndex(), self.row_count, target - 1)
+            self.row_count = target
+            self.endInsertRows()
+        elif target < self.row_count:
+            self.beginRemoveRows(QModelIndex(), target, self.row_count - 1)
+            self.row_count = target
+            self.endRemoveRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.row_count
+
+    def entry_at(self, row):
+        return self.history[row // 2]
+
+    def row_for_entry(self, entry_index, response=False):
+        return 2 * entry_index + (1 if response else 0)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.row_count:
+            return None
+        row = index.row()
+        entry = self.entry_at(row)
+        is_user = row % 2 == 0
+        if role == Qt.DisplayRole:
+            if is_user:
+                return f"👤 {entry['prompt'][:PREVIEW_LENGTH]}..."
+            return f"🤖 {entry['response'][:PREVIEW_LENGTH]}..."
+        if role == Qt.BackgroundRole and is_user:
+            return USER_BACKGROUND
+        if role == Qt.UserRole:
+            return entry
+        return None
+
+
+class HistoryItemDelegate(QStyledItemDelegate):
+    PADDING = 10
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cache_width = None
+        self.height_cache = {}
+        # Measuring a row means parsing its entry; for indexed logs the view
+        # uses uniform item sizes and every row gets this many lines
+        self.fixed_lines = 0
+
+    def sizeHint(self, option, index):
+        width = option.rect.width()
+        view = self.parent()
+        if isinstance(view, QListView):
+            width = view.viewport().width()
+        width = max(1, width - 20)
+        if width != self.cache_width:
+            self.cache_width = width
+            self.height_cache = {}
+        if self.fixed_lines:
+            return QSize(width, self.fixed_lines * option.fontMetrics.lineSpacing() + 2 * self.PADDING)
+        text = index.data(Qt.DisplayRole) or ""
+        height = self.height_cache.get(text)
+        if height is None:
+            metrics = option.fontMetrics
+            rect = metrics.boundingRect(0, 0, width, 0, Qt.TextWordWrap, text)
+            height = rect.height() + 2 * self.PADDING
+            self.height_cache[text] = height
+        return QSize(width, height)
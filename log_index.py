@@ -0,0 +1,286 @@
+import os
+import json
+import math
+import zlib
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from token_counter import count_tokens
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"DSIX"
+INDEX_VERSION = 2
+# magic, version, bytes of the log covered, crc32 of the covered tail,
+# entry records, tombstones
+HEADER = struct.Struct("<4sIQIII4x")
+# offset, length, timestamp (NaN if none), prompt tokens, response tokens, flags
+RECORD = struct.Struct("<QIdIIB3x")
+FLAG_DELETED = 1
+# Token counts not computed yet: building the index only records offsets,
+# counts are filled in the first time context building asks for them
+UNCOUNTED = 0xFFFFFFFF
+FINGERPRINT_BYTES = 64
+ENTRY_CACHE_SIZE = 512
+TOMBSTONE_KEY = "_tombstone"
+DEFAULT_ROLES = {'user': 'user', 'assistant': 'assistant'}
+
+
+def sidecar_path(file_path):
+    return file_path + INDEX_SUFFIX
+
+
+def parse_entry(raw):
+    entry = json.loads(raw.decode("utf-8-sig"))
+    if 'roles' not in entry:
+        entry['roles'] = dict(DEFAULT_ROLES)
+    return entry
+
+
+class IndexedLog:
+    # A conversation log read through its sidecar index (<log>.idx): one
+    # fixed-size record per entry line holding its byte offset, timestamp and
+    # token counts (counted on first use). Entries are parsed on demand and only a small LRU of them
+    # is kept, so memory stays flat however large the log grows.
+    #
+    # The log stays the source of truth. The index covers a prefix of it and
+    # is caught up from the end of that prefix on open and after every write;
+    # if the covered bytes changed (compaction, external edits) it is rebuilt.
+    # Supports len(), indexing, slicing and iteration like the history list.
+
+    def __init__(self, file_path, cache_size=ENTRY_CACHE_SIZE):
+        self.file_path = file_path
+        self.index_path = sidecar_path(file_path)
+        self.cache_size = cache_size
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()
+        self.indexed_size = 0
+        self.fingerprint = 0
+        self.records = 0
+        self.tombstones = 0
+        # Record numbers of live entries; None while nothing was deleted
+        self.live = None
+        self.index_file = None
+        self.log_file = None
+        self.closed = False
+        self.refresh()
+
+    def __len__(self):
+        return self.records if self.live is None else len(self.live)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.entry(i) for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("log entry index out of range")
+        return self.entry(item)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.entry(i)
+
+    def record_number(self, i):
+        return i if self.live is None else self.live[i]
+
+    def entry(self, i):
+        record_no = self.record_number(i)
+        with self.lock:
+            cached = self.entries.get(record_no)
+            if cached is not None:
+                self.entries.move_to_end(record_no)
+                return cached
+            if self.closed:
+                # The path may be stale (renamed, deleted); reopening would
+                # build an index next to it
+                raise ValueError("indexed log is closed")
+            offset, length = self.read_record(record_no)[:2]
+            self.log_file.seek(offset)
+            entry = parse_entry(self.log_file.read(length))
+            self.entries[record_no] = entry
+            while len(self.entries) > self.cache_size:
+                self.entries.popitem(last=False)
+            return entry
+
+    def read_record(self, record_no):
+        with self.lock:
+            self.index_file.seek(HEADER.size + record_no * RECORD.size)
+            return RECORD.unpack(self.index_file.read(RECORD.size))
+
+    def timestamp(self, i):
+        value = self.read_record(self.record_number(i))[2]
+        return None if math.isnan(value) else value
+
+    def token_counts(self, i):
+        record_no = self.record_number(i)
+        with self.lock:
+            record = self.read_record(record_no)
+            if record[3] == UNCOUNTED:
+                entry = self.entry(i)
+                record = record[:3] + (count_tokens(entry.get('prompt', '')),
+                                       count_tokens(entry.get('response', ''))) + record[5:]
+                self._write_record(record_no, record)
+            return record[3], record[4]
+
+    def find_timestamp(self, timestamp):
+        for i in range(len(self) - 1, -1, -1):
+            if self.timestamp(i) == timestamp:
+                return i
+        return -1
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            for handle in (self.index_file, self.log_file):
+                if handle is not None:
+                    handle.close()
+            self.index_file = None
+            self.log_file = None
+            self.entries.clear()
+
+    def _log_fingerprint(self, log, size):
+        start = max(0, size - FINGERPRINT_BYTES)
+        log.seek(start)
+        return zlib.crc32(log.read(size - start))
+
+    def _open_index(self, log_size):
+        if self.index_file is None and os.path.exists(self.index_path):
+            self.index_file = open(self.index_path, 'r+b')
+            header = self.index_file.read(HEADER.size)
+            valid = len(header) == HEADER.size
+            if valid:
+                magic, version, size, fingerprint, records, tombstones = HEADER.unpack(header)
+                valid = magic == INDEX_MAGIC and version == INDEX_VERSION
+            if valid and (self.index_file.seek(0, os.SEEK_END) == HEADER.size + records * RECORD.size):
+                self.indexed_size, self.fingerprint = size, fingerprint
+                self.records, self.tombstones = records, tombstones
+                self.live = None
+                if tombstones:
+                    self._load_live()
+            else:
+                self.index_file.close()
+                self.index_file = None
+        if self.index_file is None:
+            self._reset_index()
+
+    def _reset_index(self):
+        if self.index_file is not None:
+            self.index_file.close()
+        self.index_file = open(self.index_path, 'w+b')
+        self.indexed_size = self.fingerprint = self.records = self.tombstones = 0
+        self.live = None
+        self.entries.clear()
+        self._write_header()
+
+    def _write_header(self):
+        self.index_file.seek(0)
+        self.index_file.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.indexed_size, self.fingerprint,
+                                          self.records, self.tombstones))
+
+    def _load_live(self):
+        self.live = array('Q')
+        self.index_file.seek(HEADER.size)
+        for record_no in range(self.records):
+            if not RECORD.unpack(self.index_file.read(RECORD.size))[5] & FLAG_DELETED:
+                self.live.append(record_no)
+
+    def refresh(self):
+        # Bring the index up to date with the log; cheap when nothing changed
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                stat = os.stat(self.file_path)
+                log_size = stat.st_size
+            except OSError:
+                stat = None
+                log_size = 0
+            if self.log_file is not None and (stat is None or os.fstat(self.log_file.fileno()).st_ino != stat.st_ino):
+                # Replaced underneath us (rewrite, rename): read the new file
+                self.log_file.close()
+                self.log_file = None
+                self.entries.clear()
+            if self.log_file is None and log_size:
+                self.log_file = open(self.file_path, 'rb')
+            self._open_index(log_size)
+            if self.log_file is None:
+                if self.records:
+                    self._reset_index()
+                return
+            if log_size < self.indexed_size or (
+                    self.indexed_size and self._log_fingerprint(self.log_file, self.indexed_size) != self.fingerprint):
+                self._reset_index()
+            if log_size > self.indexed_size:
+                self._index_from(self.indexed_size, log_size)
+
+    def _index_from(self, start, end):
+        self.log_file.seek(start)
+        offset = start
+        new_records = []
+        deleted = []
+        for line in self.log_file:
+            if offset + len(line) > end or not line.endswith(b"\n"):
+                # A line still being written; picked up by the next refresh
+                break
+            stripped = line.strip()
+            if stripped:
+                entry = json.loads(stripped.decode("utf-8-sig"))
+                if TOMBSTONE_KEY in entry:
+                    deleted.append(entry[TOMBSTONE_KEY])
+                else:
+                    timestamp = entry.get('timestamp')
+                    new_records.append(RECORD.pack(
+                        offset, len(line), float('nan') if timestamp is None else float(timestamp),
+                        UNCOUNTED, UNCOUNTED, 0))
+            offset += len(line)
+        if offset == start:
+            return
+        self.index_file.seek(HEADER.size + self.records * RECORD.size)
+        self.index_file.write(b"".join(new_records))
+        first_new = self.records
+        self.records += len(new_records)
+        for record_no in deleted:
+            if 0 <= record_no < self.records:
+                self._mark_deleted(record_no)
+        if self.live is not None:
+            self.live.extend(range(first_new, self.records))
+            if deleted:
+                dead = set(deleted)
+                self.live = array('Q', (n for n in self.live if n not in dead))
+        elif deleted:
+            self._load_live()
+        self.tombstones += len(deleted)
+        self.indexed_size = offset
+        self.fingerprint = self._log_fingerprint(self.log_file, offset)
+        self._write_header()
+        self.index_file.flush()
+
+    def _write_record(self, record_no, record):
+        self.index_file.seek(HEADER.size + record_no * RECORD.size)
+        self.index_file.write(RECORD.pack(*record))
+
+    def _mark_deleted(self, record_no):
+        record = self.read_record(record_no)
+        self._write_record(record_no, record[:5] + (record[5] | FLAG_DELETED,))
+        self.entries.pop(record_no, None)
+
+    def compact(self):
+        # Copy live entry lines to a new log without parsing them, then
+        # replace the log and rebuild the index against it
+        with self.lock:
+            self.refresh()
+            temp_path = self.file_path + ".tmp"
+            with open(temp_path, 'wb') as out:
+                for i in range(len(self)):
+                    offset, length = self.read_record(self.record_number(i))[:2]
+                    self.log_file.seek(offset)
+                    out.write(self.log_file.read(length))
+                out.flush()
+                os.fsync(out.fileno())
+            self.log_file.close()
+            self.log_file = None
+            os.replace(temp_path, self.file_path)
+            self._reset_index()
+            self.refresh()
+            return len(self)
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+from block_log import BLOCK_LOG_SUFFIX, is_block_log
+from config_store import ConfigManager
+from conversation_store import LOG_SUFFIX, iter_log_entries, scan_log_file, write_log_atomic
+from log_index import sidecar_path
+from summarizer import summary_path, load_checkpoints
+from log_setup import setup_logging
+
+def converted_path(file_path, compact):
+    if compact:
+        return file_path + BLOCK_LOG_SUFFIX
+    if file_path.endswith(BLOCK_LOG_SUFFIX):
+        return file_path[:-len(BLOCK_LOG_SUFFIX)]
+    return file_path + LOG_SUFFIX
+
+
+def count_entries(entries, counter):
+    for entry in entries:
+        counter[0] += 1
+        yield entry
+
+
+def write_jsonl(dest_path, entries):
+    # Plain UTF-8 without the BOM the app's own logs carry, for other tools
+    temp_path = dest_path + ".tmp"
+    with open(temp_path, 'w', encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(temp_path, dest_path)
+
+
+def convert_log(file_path, dest_path, compact, export=False):
+    # Streams the live entries into dest_path; returns how many were written
+    if os.path.exists(dest_path):
+        raise ValueError(f"{dest_path} already exists")
+    expected = scan_log_file(file_path)[0]
+    written = [0]
+    try:
+        entries = count_entries(iter_log_entries(file_path), written)
+        if export:
+            write_jsonl(dest_path, entries)
+        else:
+            write_log_atomic(dest_path, entries, compact=compact)
+        converted = scan_log_file(dest_path)[0]
+        if not expected == written[0] == converted:
+            raise ValueError(f"entry count mismatch ({expected} in source, {written[0]} read, {converted} written)")
+    except Exception:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return converted
+
+
+def migrate_conversation(conv, compact):
+    # Returns the number of entries converted, or None if already in format
+    file_path = conv['file']
+    if not os.path.exists(file_path) or is_block_log(file_path) == compact:
+        return None
+    dest_path = converted_path(file_path, compact)
+    count = convert_log(file_path, dest_path, compact)
+    # Rolling summaries count entries, which conversion preserves
+    if os.path.exists(summary_path(file_path)):
+        os.replace(summary_path(file_path), summary_path(dest_path))
+    for path in (file_path, sidecar_path(file_path)):
+        if os.path.exists(path):
+            os.remove(path)
+    conv['file'] = dest_path
+    conv['entry_count'] = count
+    conv['records'] = count
+    conv['tombstones'] = 0
+    conv.pop('small_blocks', None)
+    # Forces a rescan of the new file on the next start
+    conv.pop('size', None)
+    conv.pop('mtime', None)
+    return count
+
+
+def run_migration_cli(log_format, log_level=None):
+    # Converts every conversation in config.json; run with the app closed
+    config_manager = ConfigManager()
+    config = config_manager.load_config()
+    setup_logging(log_level or config.get('log_level', "INFO"))
+    if config_manager.load_error:
+        sys.stderr.write(f"Can't Read Config: {config_manager.load_error}\n")
+        return 1
+    if config.get('conversation_storage') == "sqlite":
+        sys.stderr.write("Conversations are stored in SQLite; there are no log files to convert.\n")
+        return 1
+    compact = log_format == "compact"
+    failures = 0
+    before = after = 0
+    for conv in config.get('conversations', []):
+        old_file = conv.get('file', "")
+        old_size = os.path.getsize(old_file) if os.path.exists(old_file) else 0
+        try:
+            count = migrate_conversation(conv, compact)
+        except (OSError, ValueError) as e:
+            failures += 1
+            sys.stderr.write(f"{old_file}: {e}\n")
+            continue
+        if count is None:
+            continue
+        new_size = os.path.getsize(conv['file'])
+        before += old_size
+        after += new_size
+        print(f"{old_file} -> {conv['file']}: {count} entries, {old_size / 1024:.1f} KB -> {new_size / 1024:.1f} KB")
+    # New conversations follow the migrated format
+    config['log_format'] = log_format
+    config_manager.save_config(config)
+    if before:
+        print(f"Total: {before / 1024 / 1024:.2f} MB -> {after / 1024 / 1024:.2f} MB")
+    return 1 if failures else 0
+
+
+def run_export_cli(source, dest):
+    # Writes a log of either format as plain JSONL with deletions applied
+    try:
+        count = convert_log(source, dest, compact=False, export=True)
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+    print(f"Exported {count} entries to {dest}")
+    return 0
+
+
+def run_import_cli(log_level=None):
+    # Moves the conversations listed in config.json into the SQLite store.
+    # The log files are left in place; config.json switches over only once
+    # every conversation was imported, and re-running skips finished ones.
+    from sqlite_store import SqliteConversationStore
+    config_manager = ConfigManager()
+    config = config_manager.load_config()
+    setup_logging(log_level or config.get('log_level', "INFO"))
+    if config_manager.load_error:
+        sys.stderr.write(f"Can't Read Config: {config_manager.load_error}\n")
+        return 1
+    store = SqliteConversationStore()
+    failures = 0
+    for conv in config.get('conversations', []):
+        file_path = conv.get('file', f"log/{conv['id']}.txt")
+        if store.has_conversation(conv['id']):
+            print(f"{file_path}: already imported")
+            continue
+        if not os.path.exists(file_path):
+            print(f"{file_path}: missing, skipped")
+            continue
+        try:
+            expected = scan_log_file(file_path)[0]
+            count = store.import_conversation(conv, iter_log_entries(file_path), load_checkpoints(file_path))
+            if count != expected:
+                store.delete_conversation(conv['id'])
+                raise ValueError(f"entry count mismatch ({expected} in log, {count} imported)")
+        except Exception as e:
+            failures += 1
+            sys.stderr.write(f"{file_path}: {e}\n")
+            continue
+        print(f"{file_path}: {count} entries")
+    store.close()
+    if failures:
+        sys.stderr.write(f"{failures} conversation(s) failed; config.json is unchanged. Fix them and re-run.\n")
+        return 1
+    config['conversations'] = []
+    config['conversation_storage'] = "sqlite"
+    config_manager.save_config(config)
+    print(f"Conversations now load from {store.path}; the log files were kept.")
+    return 0
@@ -0,0 +1,65 @@
+import os
+import time
+import logging
+import threading
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+
+class RateLimitFilter(logging.Filter):
+    # Lets through at most `burst` records per message template every
+    # `interval` seconds; the next record after a quiet period reports how
+    # many were dropped. A failing index update on every keystroke then
+    # costs a few lines instead of thousands.
+
+    def __init__(self, interval=10.0, burst=5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        # Shared by all handlers: decide once per record
+        decision = getattr(record, 'rate_limit_passed', None)
+        if decision is None:
+            decision = record.rate_limit_passed = self._check(record)
+        return decision
+
+    def _check(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            start, count, dropped = self.windows.get(key, (now, 0, 0))
+            if now - start >= self.interval:
+                if dropped:
+                    record.msg = f"{record.msg} [{dropped} similar messages suppressed]"
+                start, count, dropped = now, 0, 0
+            if count >= self.burst:
+                self.windows[key] = (start, count, dropped + 1)
+                return False
+            self.windows[key] = (start, count + 1, dropped)
+        return True
+
+
+def setup_logging(level="INFO", log_file=None):
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    limiter = RateLimitFilter()
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        directory = os.path.dirname(log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler.addFilter(limiter)
+        root.addHandler(handler)
+    # Third-party request logs are noise at INFO
+    for name in ("httpx", "httpcore", "openai"):
+        logging.getLogger(name).setLevel(max(root.level, logging.WARNING))
+    return root
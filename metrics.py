@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+METRICS_FILE = os.path.join("log", "metrics.jsonl")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Metrics:
+    # Rolling window of the last `window` samples per span name; cheap enough
+    # to leave on in normal use.
+
+    def __init__(self, window=500):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self, name):
+        with self.lock:
+            values = sorted(self.samples.get(name, ()))
+            count = self.counts.get(name, 0)
+            last = self.samples[name][-1] if values else 0.0
+        return {
+            'count': count,
+            'last_ms': last * 1000,
+            'p50_ms': percentile(values, 0.5) * 1000,
+            'p90_ms': percentile(values, 0.9) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'max_ms': (values[-1] if values else 0.0) * 1000
+        }
+
+    def snapshot(self):
+        with self.lock:
+            names = sorted(self.samples)
+        return {name: self.summary(name) for name in names}
+
+    def export(self, path=METRICS_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        record = {'timestamp': time.time(), 'spans': self.snapshot()}
+        with open(path, 'a', encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def clear(self):
+        with self.lock:
+            self.samples = {}
+            self.counts = {}
+
+
+METRICS = Metrics()
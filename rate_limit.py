@@ -0,0 +1,198 @@
+import time
+import random
+import email.utils
+from context_builder import MESSAGE_OVERHEAD
+from token_counter import count_tokens
+
+# Worth another attempt: throttling, timeouts and server-side trouble
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+MAX_RETRY_AFTER = 600.0
+# Buckets hold this many seconds' worth, so a quiet client can't burst a
+# whole minute's allowance at once
+BURST_SECONDS = 10.0
+
+
+def estimate_tokens(messages):
+    # For messages not built by ContextBuilder, which reports its own count
+    return sum(count_tokens(message['content']) + MESSAGE_OVERHEAD for message in messages)
+
+
+def parse_retry_after(headers):
+    # Seconds the server asked us to wait, or None
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return min(max(0.0, float(value) / 1000), MAX_RETRY_AFTER)
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        # An HTTP date
+        try:
+            seconds = email.utils.mktime_tz(email.utils.parsedate_tz(value)) - time.time()
+        except (TypeError, ValueError, OverflowError):
+            return None
+    return min(max(0.0, seconds), MAX_RETRY_AFTER)
+
+
+def classify_error(error):
+    # (retryable, retry_after) for an exception raised by the OpenAI SDK
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+        return status in RETRYABLE_STATUS, parse_retry_after(headers)
+    # No response at all: connection failures and timeouts (the SDK is
+    # already loaded if it raised this)
+    import openai
+    return isinstance(error, openai.APIConnectionError), None
+
+
+class TokenBucket:
+    # Refills continuously at per_minute. Taking more than is left leaves a
+    # debt the next takers wait out, which is how usage reported above the
+    # estimate is charged. per_minute=0 means unlimited.
+
+    def __init__(self, per_minute=0, clock=time.monotonic):
+        self.clock = clock
+        self.per_minute = 0
+        self.set_rate(per_minute)
+
+    def set_rate(self, per_minute):
+        self.per_minute = max(0, per_minute)
+        self.capacity = max(1.0, self.per_minute * BURST_SECONDS / 60.0)
+        self.level = self.capacity
+        self.updated = self.clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount=1):
+        if not self.per_minute:
+            return 0.0
+        self._refill()
+        # Anything bigger than the bucket only needs it full
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing * 60.0 / self.per_minute)
+
+    def take(self, amount=1):
+        if self.per_minute:
+            self._refill()
+            self.level -= amount
+
+
+class CircuitBreaker:
+    # After `threshold` failed attempts in a row, holds every request for
+    # `cooldown` seconds, then lets a single probe through. Its success
+    # closes the circuit; another failure reopens it for twice as long.
+
+    def __init__(self, threshold=5, cooldown=30.0, max_cooldown=300.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.failures = 0
+        self.open_cooldown = cooldown
+        self.open_until = 0.0
+        self.probing = False
+
+    @property
+    def state(self):
+        if not self.threshold or self.failures < self.threshold:
+            return "closed"
+        return "open" if self.clock() < self.open_until else "half-open"
+
+    def wait_time(self):
+        state = self.state
+        if state == "open":
+            return self.open_until - self.clock()
+        if state == "half-open" and self.probing:
+            # Until the probe's outcome is known
+            return 1.0
+        return 0.0
+
+    def attempt(self):
+        if self.state == "half-open":
+            self.probing = True
+
+    def success(self):
+        self.failures = 0
+        self.open_cooldown = self.cooldown
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        if self.probing:
+            self.open_cooldown = min(self.max_cooldown, self.open_cooldown * 2)
+        if self.threshold and (self.probing or self.failures == self.threshold):
+            self.open_until = self.clock() + self.open_cooldown
+        self.probing = False
+
+    def abandon(self):
+        # A cancelled probe tells nothing; let the next request probe
+        self.probing = False
+
+
+class RetryPolicy:
+    # Exponential backoff with jitter; a server-sent Retry-After wins
+
+    def __init__(self, max_retries=2, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class RequestGate:
+    # Client-side limits shared by every request to the provider: request
+    # and token buckets, a pause the server asked for (Retry-After on a 429
+    # applies to the whole account) and the circuit breaker. Used from one
+    # thread only: the GUI thread or the batch runner's event loop.
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, breaker_threshold=5, breaker_cooldown=30.0,
+                 clock=time.monotonic):
+        self.clock = clock
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown, clock=clock)
+        self.paused_until = 0.0
+
+    def wait_time(self, tokens=0):
+        # (seconds, reason) until a request of about `tokens` may start
+        seconds, reason = max(
+            (self.paused_until - self.clock(), "rate limited by the server"),
+            (self.breaker.wait_time(), "service failing, paused"),
+            (self.requests.wait_time(1), "requests/min limit"),
+            (self.tokens.wait_time(tokens), "tokens/min limit"))
+        return (seconds, reason) if seconds > 0 else (0.0, "")
+
+    def acquire(self, tokens=0):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.breaker.attempt()
+
+    def responded(self, tokens=0, used=None):
+        # The provider answered (possibly with a non-retryable error)
+        self.breaker.success()
+        if used:
+            self.tokens.take(used - tokens)
+
+    def throttled(self, retry_after=None):
+        self.breaker.failure()
+        if retry_after:
+            self.paused_until = max(self.paused_until, self.clock() + retry_after)
+
+    def abandoned(self):
+        self.breaker.abandon()
@@ -0,0 +1,274 @@
+import threading
+from collections import OrderedDict
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from api_client import parse_completion, usage_details
+from rate_limit import RequestGate, RetryPolicy, classify_error, estimate_tokens
+
+
+class RequestSignals(QObject):
+    chunk = pyqtSignal(int, str, str)
+    completed = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+    # A failure worth retrying: request id, Retry-After (or None), message
+    throttled = pyqtSignal(int, object, str)
+
+
+class RequestWorker(QRunnable):
+    def __init__(self, request_id, client, model, messages, temperature, stream=False):
+        super().__init__()
+        self.request_id = request_id
+        self.client = client
+        self.model = model
+        self.messages = messages
+        self.temperature = temperature
+        self.stream = stream
+        self.cancel_event = threading.Event()
+        self.streamed = False
+        # Created on the GUI thread, so emits from run() are queued back to it
+        self.signals = RequestSignals()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        if self.cancel_event.is_set():
+            self.signals.cancelled.emit(self.request_id)
+            return
+        try:
+            if self.stream:
+                result = self.run_streaming()
+            else:
+                result = self.run_blocking()
+        except Exception as e:
+            if self.cancel_event.is_set():
+                self.signals.cancelled.emit(self.request_id)
+                return
+            # Once part of the reply is on screen a retry would start over
+            retryable, retry_after = classify_error(e)
+            if retryable and not self.streamed:
+                self.signals.throttled.emit(self.request_id, retry_after, f"API Error: {str(e)}")
+            else:
+                self.signals.failed.emit(self.request_id, f"API Error: {str(e)}")
+            return
+
+        if self.cancel_event.is_set():
+            self.signals.cancelled.emit(self.request_id)
+        elif result is None:
+            self.signals.failed.emit(self.request_id, "Error: Invalid API response")
+        else:
+            self.signals.completed.emit(self.request_id, result)
+
+    def run_blocking(self):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self.messages,
+            stream=False,
+            temperature=self.temperature
+        )
+        return parse_completion(response)
+
+    def run_streaming(self):
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self.messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            temperature=self.temperature
+        )
+        content_parts = []
+        reasoning_parts = []
+        usage = 0
+        details = {}
+        try:
+            for chunk in stream:
+                if self.cancel_event.is_set():
+                    return None
+                if chunk.usage:
+                    usage = chunk.usage.total_tokens
+                    details = usage_details(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                content = delta.content or ""
+                reasoning = getattr(delta, 'reasoning_content', None) or ""
+                if content or reasoning:
+                    content_parts.append(content)
+                    reasoning_parts.append(reasoning)
+                    self.streamed = True
+                    self.signals.chunk.emit(self.request_id, content, reasoning)
+        finally:
+            # Closing the stream drops the connection, which is what actually
+            # aborts a cancelled generation server-side.
+            stream.close()
+        return {
+            'content': "".join(content_parts),
+            'reasoning_content': "".join(reasoning_parts),
+            'usage': usage,
+            'usage_details': details
+        }
+
+
+class RequestEngine(QObject):
+    request_chunk = pyqtSignal(int, str, str)
+    request_completed = pyqtSignal(int, object)
+    request_failed = pyqtSignal(int, str)
+    request_cancelled = pyqtSignal(int)
+    # Seconds until a held request may start and why; (id, 0, "") once it does
+    request_waiting = pyqtSignal(int, float, str)
+
+    def __init__(self, parent=None, max_workers=4, gate=None, retry_policy=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        self.gate = gate or RequestGate()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.workers = {}
+        # Everything submitted and not finished, running or not
+        self.requests = {}
+        # Held by the rate limits or a retry backoff, in submit order
+        self.waiting = OrderedDict()
+        self.wait_timer = QTimer(self)
+        self.wait_timer.setSingleShot(True)
+        self.wait_timer.timeout.connect(self._release_waiting)
+        self.next_id = 1
+
+    def submit(self, client, model, messages, temperature, stream=False, tokens=None):
+        # tokens: the prompt size if the caller already counted it
+        request_id = self.next_id
+        self.next_id += 1
+        self.requests[request_id] = {
+            'client': client,
+            'model': model,
+            'messages': messages,
+            'temperature': temperature,
+            'stream': stream,
+            'tokens': estimate_tokens(messages) if tokens is None else tokens,
+            'attempt': 0,
+            'not_before': 0.0,
+            'reason': "",
+            'waited': False
+        }
+        if not self.waiting and not self._wait_time(request_id)[0]:
+            self._start(request_id)
+        else:
+            self.waiting[request_id] = True
+            # Deferred so the caller has the id before hearing it waits
+            self.wait_timer.start(0)
+        return request_id
+
+    def cancel(self, request_id):
+        if self.waiting.pop(request_id, None) is not None:
+            self.requests.pop(request_id, None)
+            self.request_cancelled.emit(request_id)
+            return True
+        worker = self.workers.get(request_id)
+        if worker is None:
+            return False
+        worker.cancel()
+        # A blocking HTTP call can't be interrupted, so report the cancel now
+        # and drop whatever the worker produces later.
+        self.workers.pop(request_id, None)
+        self.requests.pop(request_id, None)
+        self.gate.abandoned()
+        self.request_cancelled.emit(request_id)
+        return True
+
+    def cancel_all(self):
+        for request_id in list(self.requests):
+            self.cancel(request_id)
+
+    def is_running(self, request_id):
+        return request_id in self.requests
+
+    def in_flight(self):
+        return len(self.requests)
+
+    def shutdown(self, wait_ms=2000):
+        self.wait_timer.stop()
+        self.cancel_all()
+        self.pool.clear()
+        self.pool.waitForDone(wait_ms)
+
+    def _wait_time(self, request_id):
+        request = self.requests[request_id]
+        seconds, reason = self.gate.wait_time(request['tokens'])
+        backoff = request['not_before'] - self.gate.clock()
+        if backoff > seconds:
+            return backoff, request['reason']
+        return seconds, reason
+
+    def _release_waiting(self):
+        next_check = None
+        for request_id in list(self.waiting):
+            seconds, reason = self._wait_time(request_id)
+            if seconds > 0:
+                self.requests[request_id]['waited'] = True
+                self.request_waiting.emit(request_id, seconds, reason)
+                next_check = seconds if next_check is None else min(next_check, seconds)
+                continue
+            del self.waiting[request_id]
+            self._start(request_id)
+        if next_check is not None:
+            self.wait_timer.start(max(10, int(next_check * 1000)))
+
+    def _start(self, request_id):
+        request = self.requests[request_id]
+        self.gate.acquire(request['tokens'])
+        if request['waited']:
+            request['waited'] = False
+            self.request_waiting.emit(request_id, 0.0, "")
+        worker = RequestWorker(request_id, request['client'], request['model'], request['messages'],
+                               request['temperature'], request['stream'])
+        worker.signals.chunk.connect(self._on_chunk)
+        worker.signals.completed.connect(self._on_completed)
+        worker.signals.failed.connect(self._on_failed)
+        worker.signals.cancelled.connect(self._on_cancelled)
+        worker.signals.throttled.connect(self._on_throttled)
+        self.workers[request_id] = worker
+        self.pool.start(worker)
+
+    def _finish(self, request_id):
+        # The request if it was still ours to report
+        if self.workers.pop(request_id, None) is None:
+            return None
+        return self.requests.pop(request_id)
+
+    def _on_chunk(self, request_id, content, reasoning):
+        if request_id in self.workers:
+            self.request_chunk.emit(request_id, content, reasoning)
+
+    def _on_completed(self, request_id, result):
+        request = self._finish(request_id)
+        if request is not None:
+            self.gate.responded(request['tokens'], result.get('usage'))
+            self.request_completed.emit(request_id, result)
+
+    def _on_failed(self, request_id, message):
+        request = self._finish(request_id)
+        if request is not None:
+            self.gate.responded(request['tokens'])
+            self.request_failed.emit(request_id, message)
+
+    def _on_cancelled(self, request_id):
+        if self._finish(request_id) is not None:
+            self.gate.abandoned()
+            self.request_cancelled.emit(request_id)
+
+    def _on_throttled(self, request_id, retry_after, message):
+        if self.workers.pop(request_id, None) is None:
+            return
+        self.gate.throttled(retry_after)
+        request = self.requests[request_id]
+        if request['attempt'] >= self.retry_policy.max_retries:
+            del self.requests[request_id]
+            self.request_failed.emit(request_id, message)
+            self._release_waiting()
+            return
+        # Same id, so the caller just sees the request waiting again
+        delay = self.retry_policy.delay(request['attempt'], retry_after)
+        request['attempt'] += 1
+        request['not_before'] = self.gate.clock() + delay
+        request['reason'] = f"retry {request['attempt']}/{self.retry_policy.max_retries}"
+        self.waiting[request_id] = True
+        self._release_waiting()
@@ -0,0 +1,87 @@
+from collections import deque
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class ConversationScheduler(QObject):
+    # One request in flight per conversation (its next prompt needs the
+    # previous reply as context), a FIFO of waiting prompts behind it, and a
+    # global cap on requests in flight across all conversations.
+    status_changed = pyqtSignal(object)
+
+    def __init__(self, start_job, parent=None, max_concurrent=4):
+        super().__init__(parent)
+        # start_job(conv_id, job) returns a request id, or None when the job
+        # finished (or failed) without a request
+        self.start_job = start_job
+        self.max_concurrent = max_concurrent
+        self.queues = {}
+        self.active = {}
+        self.requests = {}
+        # Conversations in the order their queues became non-empty, so one
+        # conversation with a long queue can't starve the others
+        self.ready = deque()
+        self.pumping = False
+
+    def enqueue(self, conv_id, job):
+        queue = self.queues.setdefault(conv_id, deque())
+        queue.append(job)
+        if len(queue) == 1 and conv_id not in self.active:
+            self.ready.append(conv_id)
+        self.status_changed.emit(conv_id)
+        self.pump()
+
+    def pump(self):
+        if self.pumping:
+            return
+        self.pumping = True
+        try:
+            while self.ready and len(self.active) < self.max_concurrent:
+                conv_id = self.ready.popleft()
+                queue = self.queues.get(conv_id)
+                if not queue or conv_id in self.active:
+                    continue
+                job = queue.popleft()
+                if not queue:
+                    del self.queues[conv_id]
+                request_id = self.start_job(conv_id, job)
+                if request_id is None:
+                    if conv_id in self.queues:
+                        self.ready.append(conv_id)
+                else:
+                    self.active[conv_id] = request_id
+                    self.requests[request_id] = conv_id
+                self.status_changed.emit(conv_id)
+        finally:
+            self.pumping = False
+
+    def finished(self, request_id):
+        conv_id = self.requests.pop(request_id, None)
+        if conv_id is None or self.active.get(conv_id) != request_id:
+            return
+        del self.active[conv_id]
+        if conv_id in self.queues:
+            self.ready.append(conv_id)
+        self.status_changed.emit(conv_id)
+        self.pump()
+
+    def clear_queue(self, conv_id):
+        dropped = len(self.queues.pop(conv_id, ()))
+        if dropped:
+            # Its turn goes too; a prompt queued later waits at the back
+            if conv_id in self.ready:
+                self.ready.remove(conv_id)
+            self.status_changed.emit(conv_id)
+        return dropped
+
+    def active_request(self, conv_id):
+        return self.active.get(conv_id)
+
+    def queued(self, conv_id):
+        return len(self.queues.get(conv_id, ()))
+
+    def is_busy(self, conv_id):
+        return conv_id in self.active or conv_id in self.queues
+
+    def set_max_concurrent(self, value):
+        self.max_concurrent = max(1, value)
+        self.pump()
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_FILE = os.path.join("cache", "responses.db")
+
+
+def cache_key(model, temperature, messages):
+    payload = json.dumps({'model': model, 'temperature': round(float(temperature), 4), 'messages': messages},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_FILE, memory_entries=256, max_bytes=100 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.conn = None
+
+    def connection(self):
+        if self.conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, "
+                              "size INTEGER, created REAL, accessed REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+            # Bytes stored, kept up to date by every write so a put needn't
+            # sum the whole table
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+            self.conn.execute("INSERT OR IGNORE INTO meta (name, value) "
+                              "SELECT 'bytes', COALESCE(SUM(size), 0) FROM responses")
+            self.conn.commit()
+        return self.conn
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            cached = self.memory.get(key)
+            if cached is not None and now - cached[0] <= self.ttl:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return dict(cached[1])
+            conn = self.connection()
+            row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._delete(conn, "key = ?", (key,))
+                    conn.commit()
+                self.memory.pop(key, None)
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            self.hits += 1
+            return dict(value)
+
+    def put(self, key, value):
+        now = time.time()
+        text = json.dumps(value, ensure_ascii=False)
+        with self.lock:
+            self._remember(key, now, value)
+            conn = self.connection()
+            size = len(text.encode("utf-8"))
+            conn.execute("UPDATE meta SET value = value + ? - COALESCE((SELECT size FROM responses WHERE key = ?), 0) "
+                         "WHERE name = 'bytes'", (size, key))
+            conn.execute("INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                         (key, text, size, now, now))
+            self._evict(conn, now)
+            conn.commit()
+
+    def _remember(self, key, created, value):
+        self.memory[key] = (created, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _delete(self, conn, condition, params):
+        conn.execute(f"UPDATE meta SET value = value - (SELECT COALESCE(SUM(size), 0) FROM responses WHERE {condition}) "
+                     "WHERE name = 'bytes'", params)
+        conn.execute(f"DELETE FROM responses WHERE {condition}", params)
+
+    def stored_bytes(self):
+        with self.lock:
+            return self.connection().execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def _evict(self, conn, now):
+        self._delete(conn, "created < ?", (now - self.ttl,))
+        total = conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        # Drop least recently used rows until back under the size budget
+        while total > self.max_bytes:
+            rows = conn.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 32").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._delete(conn, "key = ?", (key,))
+                self.memory.pop(key, None)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            conn = self.connection()
+            conn.execute("DELETE FROM responses")
+            conn.execute("UPDATE meta SET value = 0 WHERE name = 'bytes'")
+            conn.commit()
+
+    def stats(self):
+        return {'hits': self.hits, 'memory_hits': self.memory_hits, 'misses': self.misses}
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
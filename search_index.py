@@ -0,0 +1,196 @@
+import os
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = os.path.join("log", "search_index.db")
+
+
+def _phrase(query):
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _gram_token(gram):
+    # Hex, so unicode61 keeps every gram (punctuation, CJK) as one token
+    return gram.encode("utf-8").hex()
+
+
+def _grams(prompt, response):
+    # The distinct characters and character pairs of an entry, for queries
+    # too short for trigrams. Must be deterministic: deleting from the
+    # contentless side table takes the same text again.
+    text = f"{prompt or ''}\n{response or ''}".lower()
+    grams = set()
+    for i, char in enumerate(text):
+        if char.isspace():
+            continue
+        grams.add(char)
+        if i + 1 < len(text) and not text[i + 1].isspace():
+            grams.add(char + text[i + 1])
+    return " ".join(sorted(_gram_token(gram) for gram in grams))
+
+
+class SearchIndex:
+    # Entries are keyed by (conv_id, timestamp): unlike line positions,
+    # timestamps survive compaction and renames.
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self.local = threading.local()
+        self.tokenizer = None
+        # Trigram indexes keep a side table for 1-2 character queries
+        self.short_terms = False
+        self.ensure_schema()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def ensure_schema(self):
+        conn = self.connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS files (conv_id TEXT PRIMARY KEY, file TEXT, size INTEGER, mtime REAL)")
+        exists = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'entries'").fetchone()
+        if exists:
+            self.tokenizer = 'trigram' if 'trigram' in exists[0] else 'unicode61'
+        else:
+            # The trigram tokenizer (SQLite 3.34+) also matches CJK text,
+            # which has no spaces for unicode61 to split on.
+            for tokenizer in ('trigram', 'unicode61'):
+                try:
+                    conn.execute(
+                        "CREATE VIRTUAL TABLE entries USING fts5("
+                        "prompt, response, conv_id UNINDEXED, timestamp UNINDEXED, "
+                        f"tokenize='{tokenizer}')")
+                    self.tokenizer = tokenizer
+                    break
+                except sqlite3.OperationalError:
+                    continue
+        if self.tokenizer == 'trigram':
+            has_short_terms = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'short_terms'").fetchone()
+            if not has_short_terms:
+                # Rows share the entry's rowid; nothing but the postings is stored
+                conn.execute("CREATE VIRTUAL TABLE short_terms USING fts5("
+                             "grams, content='', detail=none, tokenize='unicode61')")
+                # Entries indexed before the table existed have no grams to
+                # delete later, so everything is reindexed by the next sync
+                conn.execute("DELETE FROM entries")
+                conn.execute("DELETE FROM files")
+            self.short_terms = True
+        conn.commit()
+
+    def _insert(self, conn, conv_id, entry):
+        prompt, response = entry.get('prompt', ''), entry.get('response', '')
+        row_id = conn.execute("INSERT INTO entries (prompt, response, conv_id, timestamp) VALUES (?, ?, ?, ?)",
+                              (prompt, response, conv_id, entry.get('timestamp'))).lastrowid
+        if self.short_terms:
+            conn.execute("INSERT INTO short_terms (rowid, grams) VALUES (?, ?)", (row_id, _grams(prompt, response)))
+
+    def _delete(self, conn, where, args):
+        if self.short_terms:
+            rows = conn.execute(f"SELECT rowid, prompt, response FROM entries WHERE {where}", args).fetchall()
+            conn.executemany("INSERT INTO short_terms (short_terms, rowid, grams) VALUES ('delete', ?, ?)",
+                             ((row_id, _grams(prompt, response)) for row_id, prompt, response in rows))
+        conn.execute(f"DELETE FROM entries WHERE {where}", args)
+
+    def add_entry(self, conv_id, entry):
+        conn = self.connection()
+        with conn:
+            self._insert(conn, conv_id, entry)
+
+    def remove_entry(self, conv_id, entry):
+        conn = self.connection()
+        with conn:
+            self._delete(conn, "conv_id = ? AND timestamp = ?", (conv_id, entry.get('timestamp')))
+
+    def remove_conversation(self, conv_id):
+        conn = self.connection()
+        with conn:
+            self._delete(conn, "conv_id = ?", (conv_id,))
+            conn.execute("DELETE FROM files WHERE conv_id = ?", (conv_id,))
+
+    def note_file_state(self, conv_id, location, old_state, new_state):
+        # Advance the recorded file state only if the index was in sync
+        # before this change; otherwise leave it stale for the next sync().
+        conn = self.connection()
+        with conn:
+            conn.execute("UPDATE files SET file = ?, size = ?, mtime = ? WHERE conv_id = ? AND size = ? AND mtime = ?",
+                         (location, new_state[0], new_state[1], conv_id, old_state[0], old_state[1]))
+
+    def rebuild_conversation(self, conv_id, location, state, entries):
+        conn = self.connection()
+        try:
+            with conn:
+                self._delete(conn, "conv_id = ?", (conv_id,))
+                # Streamed, so a huge log is never held in memory at once
+                for entry in entries:
+                    self._insert(conn, conv_id, entry)
+                conn.execute("INSERT OR REPLACE INTO files (conv_id, file, size, mtime) VALUES (?, ?, ?, ?)",
+                             (conv_id, location, state[0], state[1]))
+        except (OSError, ValueError):
+            self.remove_conversation(conv_id)
+
+    def sync(self, conversations):
+        # conversations: iterable of (conv_id, location, state, entries), where
+        # state is a (size, mtime)-like pair that changes with every write
+        # (None if the conversation is gone) and entries is read only if
+        # the state changed
+        conn = self.connection()
+        indexed = {row[0]: row[1:] for row in conn.execute("SELECT conv_id, file, size, mtime FROM files")}
+        live = set()
+        for conv_id, location, state, entries in conversations:
+            live.add(conv_id)
+            if state is None:
+                continue
+            if indexed.get(conv_id) != (location,) + tuple(state):
+                self.rebuild_conversation(conv_id, location, state, entries)
+        for conv_id in set(indexed) - live:
+            self.remove_conversation(conv_id)
+
+    def sync_in_background(self, conversations):
+        conversations = list(conversations)
+        thread = threading.Thread(target=self._sync_quietly, args=(conversations,), daemon=True)
+        thread.start()
+        return thread
+
+    def _sync_quietly(self, conversations):
+        try:
+            self.sync(conversations)
+        except Exception as e:
+            logger.warning("Search index sync failed: %s", e)
+
+    def search(self, query, limit=100):
+        query = query.strip()
+        if not query:
+            return []
+        conn = self.connection()
+        if self.tokenizer == 'trigram' and len(query) < 3:
+            # Trigram MATCH needs 3+ characters: look the gram up in the side
+            # table instead, newest rows first so a common character stops
+            # at `limit` instead of touching every entry
+            rows = conn.execute(
+                "SELECT conv_id, timestamp, substr(CASE WHEN instr(lower(prompt), ?) THEN prompt ELSE response END, 1, 80) "
+                "FROM entries WHERE rowid IN (SELECT rowid FROM short_terms WHERE short_terms MATCH ? "
+                "ORDER BY rowid DESC LIMIT ?) ORDER BY timestamp DESC",
+                (query.lower(), _phrase(_gram_token(query.lower())), limit))
+        else:
+            rows = conn.execute(
+                "SELECT conv_id, timestamp, snippet(entries, -1, '[', ']', '...', 12) "
+                "FROM entries WHERE entries MATCH ? ORDER BY rank LIMIT ?",
+                (_phrase(query), limit))
+        return rows.fetchall()
+
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
@@ -0,0 +1,388 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from conversation_store import DEFAULT_ROLES, HistoryCache, LAZY_LOG_THRESHOLD, LAZY_LOG_COST
+
+logger = logging.getLogger(__name__)
+
+DATABASE_FILE = os.path.join("log", "conversations.db")
+# Rows per query when streaming a conversation, so other threads get the
+# connection in between
+FETCH_BATCH = 500
+ENTRY_CACHE_SIZE = 512
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS conversations (id TEXT PRIMARY KEY, name TEXT NOT NULL, created REAL, "
+    "updated REAL, entry_count INTEGER NOT NULL DEFAULT 0, last_timestamp REAL, bytes INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, "
+    "conv_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE, timestamp REAL, data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS entries_conv ON entries (conv_id, id)",
+    "CREATE INDEX IF NOT EXISTS entries_timestamp ON entries (conv_id, timestamp)",
+    "CREATE TABLE IF NOT EXISTS summaries (conv_id TEXT PRIMARY KEY "
+    "REFERENCES conversations (id) ON DELETE CASCADE, data TEXT NOT NULL)",
+)
+
+
+def encode_entry(entry):
+    return json.dumps(entry, ensure_ascii=False)
+
+
+def decode_entry(data):
+    entry = json.loads(data)
+    if 'roles' not in entry:
+        entry['roles'] = dict(DEFAULT_ROLES)
+    return entry
+
+
+def entry_size(data):
+    # What the entry would take as a log line
+    return len(data.encode("utf-8")) + 1
+
+
+class SqliteLog:
+    # A conversation read from the database on demand, for histories too
+    # large to load: only row ids and timestamps are held, plus a small LRU
+    # of parsed entries. Same sequence interface as IndexedLog.
+
+    def __init__(self, store, conv_id, cache_size=ENTRY_CACHE_SIZE):
+        self.store = store
+        self.conv_id = conv_id
+        self.cache_size = cache_size
+        self.entries = OrderedDict()
+        self.ids = array('q')
+        self.timestamps = array('d')
+        for row_id, timestamp in store.entry_index(conv_id):
+            self.append_row(row_id, timestamp)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.entry(i) for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("log entry index out of range")
+        return self.entry(item)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.entry(i)
+
+    def entry(self, i):
+        row_id = self.ids[i]
+        cached = self.entries.get(row_id)
+        if cached is not None:
+            self.entries.move_to_end(row_id)
+            return cached
+        entry = self.store.fetch_entry(row_id)
+        self.entries[row_id] = entry
+        while len(self.entries) > self.cache_size:
+            self.entries.popitem(last=False)
+        return entry
+
+    def timestamp(self, i):
+        value = self.timestamps[i]
+        return None if math.isnan(value) else value
+
+    def find_timestamp(self, timestamp):
+        row_id = self.store.find_row(self.conv_id, timestamp)
+        i = bisect_left(self.ids, row_id) if row_id is not None else len(self.ids)
+        return i if i < len(self.ids) and self.ids[i] == row_id else -1
+
+    def append_row(self, row_id, timestamp):
+        self.ids.append(row_id)
+        self.timestamps.append(float('nan') if timestamp is None else float(timestamp))
+
+    def pop(self):
+        row_id = self.ids.pop()
+        self.timestamps.pop()
+        self.entries.pop(row_id, None)
+
+    def close(self):
+        self.entries.clear()
+
+
+class SqliteConversationStore(HistoryCache):
+    # Conversations and their entries in one SQLite database (WAL mode),
+    # replacing the config.json conversation list and a log file per
+    # conversation. Each change is a single transaction, renames touch no
+    # files, and entries are keyed by conversation id, so names may repeat.
+    # Same interface as ConversationStore plus the metadata operations;
+    # rows are deleted in place, so there are no tombstones to compact.
+
+    def __init__(self, path=DATABASE_FILE, cache_budget_bytes=64 * 1024 * 1024,
+                 lazy_threshold_bytes=LAZY_LOG_THRESHOLD):
+        # Row ids are looked up when needed, so loaded histories keep no
+        # ordinals
+        super().__init__(cache_budget_bytes)
+        self.path = path
+        self.lazy_threshold_bytes = lazy_threshold_bytes
+        self.lock = threading.RLock()
+        self.conn = None
+
+    def connection(self):
+        if self.conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("PRAGMA foreign_keys=ON")
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+            self.conn.commit()
+        return self.conn
+
+    def close(self):
+        with self.lock:
+            super().close()
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def location(self, conv):
+        return self.path
+
+    def _metadata(self, conv, row):
+        entry_count, last_timestamp, size, updated = row
+        conv['entry_count'] = entry_count
+        conv['last_timestamp'] = last_timestamp
+        conv['records'] = entry_count
+        conv['tombstones'] = 0
+        # Stand-ins for the log file's size and mtime: they change with
+        # every write, which is all the search index compares
+        conv['size'] = size
+        conv['mtime'] = updated
+
+    def list_conversations(self):
+        with self.lock:
+            rows = self.connection().execute(
+                "SELECT id, name, entry_count, last_timestamp, bytes, updated FROM conversations "
+                "ORDER BY rowid").fetchall()
+        conversations = []
+        for row in rows:
+            conv = {'id': row[0], 'name': row[1]}
+            self._metadata(conv, row[2:])
+            conversations.append(conv)
+        return conversations
+
+    def refresh_metadata(self, conv):
+        with self.lock:
+            row = self.connection().execute(
+                "SELECT entry_count, last_timestamp, bytes, updated FROM conversations WHERE id = ?",
+                (conv['id'],)).fetchone()
+        if row is None:
+            return False
+        self._metadata(conv, row)
+        return True
+
+    def source_state(self, conv):
+        return (conv.get('size'), conv.get('mtime')) if self.refresh_metadata(conv) else None
+
+    def has_conversation(self, conv_id):
+        with self.lock:
+            return self.connection().execute("SELECT 1 FROM conversations WHERE id = ?", (conv_id,)).fetchone() is not None
+
+    def create_conversation(self, conv):
+        # Ids are creation times in seconds; a clash moves to the next free one
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            while self.has_conversation(conv['id']):
+                conv['id'] = str(int(conv['id']) + 1) if conv['id'].isdigit() else conv['id'] + "-1"
+            with conn:
+                conn.execute("INSERT INTO conversations (id, name, created, updated) VALUES (?, ?, ?, ?)",
+                             (conv['id'], conv['name'], now, now))
+        self._metadata(conv, (0, None, 0, now))
+        return conv
+
+    def rename_conversation(self, conv, name):
+        with self.lock:
+            conn = self.connection()
+            with conn:
+                conn.execute("UPDATE conversations SET name = ? WHERE id = ?", (name, conv['id']))
+        conv['name'] = name
+
+    def delete_conversation(self, conv_id):
+        self.forget(conv_id)
+        with self.lock:
+            conn = self.connection()
+            with conn:
+                # Entries and the summary go with it
+                conn.execute("DELETE FROM conversations WHERE id = ?", (conv_id,))
+
+    def import_conversation(self, conv, entries, checkpoints=None):
+        # One transaction per conversation; returns the number of entries
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            if self.has_conversation(conv['id']):
+                raise ValueError(f"conversation {conv['id']} is already in {self.path}")
+            count = 0
+            size = 0
+            last_timestamp = None
+            with conn:
+                conn.execute("INSERT INTO conversations (id, name, created, updated) VALUES (?, ?, ?, ?)",
+                             (conv['id'], conv.get('name', f"Conversation {conv['id']}"), now, now))
+                for entry in entries:
+                    data = encode_entry(entry)
+                    conn.execute("INSERT INTO entries (conv_id, timestamp, data) VALUES (?, ?, ?)",
+                                 (conv['id'], entry.get('timestamp'), data))
+                    count += 1
+                    size += entry_size(data)
+                    last_timestamp = entry.get('timestamp')
+                conn.execute("UPDATE conversations SET entry_count = ?, last_timestamp = ?, bytes = ? WHERE id = ?",
+                             (count, last_timestamp, size, conv['id']))
+                if checkpoints:
+                    conn.execute("INSERT INTO summaries VALUES (?, ?)",
+                                 (conv['id'], json.dumps(checkpoints, ensure_ascii=False)))
+        return count
+
+    # Summary failures surface as OSError, as with the sidecar files, so the
+    # summarizer doesn't need to know which store it writes to
+    def load_summary(self, conv):
+        try:
+            with self.lock:
+                row = self.connection().execute("SELECT data FROM summaries WHERE conv_id = ?",
+                                                (conv['id'],)).fetchone()
+        except sqlite3.Error as e:
+            raise OSError(f"can't read summary: {e}") from e
+        return json.loads(row[0]) if row else []
+
+    def save_summary(self, conv, checkpoints):
+        try:
+            with self.lock:
+                conn = self.connection()
+                with conn:
+                    if checkpoints:
+                        conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?)",
+                                     (conv['id'], json.dumps(checkpoints, ensure_ascii=False)))
+                    else:
+                        conn.execute("DELETE FROM summaries WHERE conv_id = ?", (conv['id'],))
+        except sqlite3.Error as e:
+            raise OSError(f"can't save summary: {e}") from e
+
+    def iter_entries(self, conv):
+        # Streamed in batches, so a huge conversation is never held at once
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.connection().execute(
+                    "SELECT id, data FROM entries WHERE conv_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (conv['id'], last_id, FETCH_BATCH)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield decode_entry(row[1])
+            last_id = rows[-1][0]
+
+    def entry_index(self, conv_id):
+        with self.lock:
+            return self.connection().execute(
+                "SELECT id, timestamp FROM entries WHERE conv_id = ? ORDER BY id", (conv_id,)).fetchall()
+
+    def fetch_entry(self, row_id):
+        with self.lock:
+            row = self.connection().execute("SELECT data FROM entries WHERE id = ?", (row_id,)).fetchone()
+        if row is None:
+            raise IndexError("log entry was deleted")
+        return decode_entry(row[0])
+
+    def find_row(self, conv_id, timestamp):
+        with self.lock:
+            row = self.connection().execute(
+                "SELECT MAX(id) FROM entries WHERE conv_id = ? AND timestamp = ?", (conv_id, timestamp)).fetchone()
+        return row[0]
+
+    def get_history(self, conv):
+        conv_id = conv['id']
+        history = self.cached_history(conv_id)
+        if history is not None:
+            return history
+        with self.lock:
+            if not self.refresh_metadata(conv):
+                raise ValueError(f"conversation {conv_id} is not in {self.path}")
+            size = conv['size']
+            if size >= self.lazy_threshold_bytes:
+                history = SqliteLog(self, conv_id)
+                ordinals = None
+                size = LAZY_LOG_COST
+            else:
+                history = [decode_entry(row[0]) for row in self.connection().execute(
+                    "SELECT data FROM entries WHERE conv_id = ? ORDER BY id", (conv_id,))]
+                ordinals = []
+        return self._cache(conv_id, history, ordinals, size)
+
+    def put_history(self, conv_id, history, size=0):
+        self.forget(conv_id)
+        return self._cache(conv_id, history, [], size)
+
+    def append_entry(self, conv, entry):
+        data = encode_entry(entry)
+        size = entry_size(data)
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            with conn:
+                row_id = conn.execute("INSERT INTO entries (conv_id, timestamp, data) VALUES (?, ?, ?)",
+                                      (conv['id'], entry.get('timestamp'), data)).lastrowid
+                conn.execute("UPDATE conversations SET entry_count = entry_count + 1, last_timestamp = ?, "
+                             "bytes = bytes + ?, updated = ? WHERE id = ?",
+                             (entry.get('timestamp'), size, now, conv['id']))
+            cached = self.cache.get(conv['id'])
+            if cached is not None and cached.indexed:
+                cached.history.append_row(row_id, entry.get('timestamp'))
+            elif cached is not None:
+                cached.history.append(entry)
+                self._resize(conv['id'], size)
+            conv['entry_count'] = conv['records'] = conv.get('entry_count', 0) + 1
+            conv['last_timestamp'] = entry.get('timestamp')
+            conv['size'] = conv.get('size', 0) + size
+            conv['mtime'] = now
+        self.evict()
+
+    def drop_last(self, conv):
+        history = self.get_history(conv)
+        if not history:
+            return None
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            row_id, data = conn.execute("SELECT id, data FROM entries WHERE conv_id = ? ORDER BY id DESC LIMIT 1",
+                                        (conv['id'],)).fetchone()
+            size = entry_size(data)
+            with conn:
+                conn.execute("DELETE FROM entries WHERE id = ?", (row_id,))
+                conn.execute("UPDATE conversations SET entry_count = entry_count - 1, bytes = bytes - ?, updated = ?, "
+                             "last_timestamp = (SELECT timestamp FROM entries WHERE conv_id = ? ORDER BY id DESC LIMIT 1) "
+                             "WHERE id = ?", (size, now, conv['id'], conv['id']))
+            cached = self.cache[conv['id']]
+            if cached.indexed:
+                entry = history[-1]
+                history.pop()
+            else:
+                entry = history.pop()
+                self._resize(conv['id'], -size)
+            conv['entry_count'] = conv['records'] = len(history)
+            conv['last_timestamp'] = history[-1].get('timestamp') if len(history) else None
+            conv['size'] = conv.get('size', 0) - size
+            conv['mtime'] = now
+        return entry
+
+    def garbage_ratio(self, conv):
+        return 0.0
+
+    def needs_compaction(self, conv):
+        return False
+
+    def compact(self, conv):
+        pass
@@ -0,0 +1,31 @@
+import sys
+import time
+
+
+class StartupProfile:
+    def __init__(self, enabled=False, out=sys.stderr):
+        self.enabled = enabled
+        self.out = out
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.marks = []
+
+    def mark(self, label):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.marks.append((label, now - self.last))
+        self.last = now
+
+    def report(self, title="Startup"):
+        if not self.enabled:
+            return
+        total = sum(elapsed for _, elapsed in self.marks)
+        width = max([len(label) for label, _ in self.marks] + [5])
+        lines = [f"{title} profile:"]
+        for label, elapsed in self.marks:
+            lines.append(f"  {label:<{width}}  {elapsed * 1000:8.1f} ms")
+        lines.append(f"  {'total':<{width}}  {total * 1000:8.1f} ms")
+        self.out.write("\n".join(lines) + "\n")
+        self.out.flush()
+        self.marks = []
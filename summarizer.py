@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import logging
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from api_client import parse_completion
+from rate_limit import RequestGate, classify_error, estimate_tokens
+from token_counter import truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SUFFIX = ".summary.json"
+SUMMARY_VERSION = 1
+# Summaries after each of the last few updates; dropping summarized turns
+# rolls back to one of these instead of starting over
+MAX_CHECKPOINTS = 8
+# Turns summarized per call, and how much of each side of a turn is sent
+MAX_BATCH_TURNS = 20
+TURN_TOKEN_LIMIT = 1500
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Merge the new turns into the current summary. Keep facts, decisions, names, numbers, "
+    "open questions and the user's preferences; drop pleasantries and repetition. "
+    "Reply with the updated summary only, in the conversation's language, under {words} words."
+)
+
+
+def summary_path(file_path):
+    return file_path + SUMMARY_SUFFIX
+
+
+def load_checkpoints(file_path):
+    try:
+        with open(summary_path(file_path), 'r', encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable summary for %s: %s", file_path, e)
+        return []
+    if data.get('version') != SUMMARY_VERSION:
+        return []
+    return data.get('checkpoints', [])
+
+
+def save_checkpoints(file_path, checkpoints):
+    path = summary_path(file_path)
+    if not checkpoints:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding="utf-8") as f:
+        json.dump({'version': SUMMARY_VERSION, 'checkpoints': checkpoints}, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def entry_timestamp(history, index):
+    timestamp = getattr(history, 'timestamp', None)
+    if timestamp is not None:
+        # Indexed logs answer from the index without parsing the entry
+        return timestamp(index)
+    return history[index].get('timestamp')
+
+
+def summary_messages(previous, entries, max_tokens):
+    turns = []
+    for entry in entries:
+        turns.append(f"User: {truncate_to_tokens(entry.get('prompt', ''), TURN_TOKEN_LIMIT)}\n"
+                     f"Assistant: {truncate_to_tokens(entry.get('response', ''), TURN_TOKEN_LIMIT)}")
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(words=max(50, int(max_tokens * 0.6)))},
+        {"role": "user", "content": f"Current summary:\n{previous or '(none)'}\n\nNew turns:\n\n" + "\n\n".join(turns)}
+    ]
+
+
+class SummarySignals(QObject):
+    finished = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+    # A failure worth retrying: conv id, Retry-After (or None), message
+    throttled = pyqtSignal(str, object, str)
+
+
+class SummaryTask(QRunnable):
+    def __init__(self, client, model, conv_id, messages, max_tokens, signals):
+        super().__init__()
+        self.client = client
+        self.model = model
+        self.conv_id = conv_id
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.signals = signals
+
+    def run(self):
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=self.messages,
+                stream=False,
+                temperature=0.2,
+                max_tokens=self.max_tokens
+            )
+            result = parse_completion(response)
+        except Exception as e:
+            retryable, retry_after = classify_error(e)
+            if retryable:
+                self.signals.throttled.emit(self.conv_id, retry_after, str(e))
+            else:
+                self.signals.failed.emit(self.conv_id, str(e))
+            return
+        if result is None or not result['content'].strip():
+            self.signals.failed.emit(self.conv_id, "empty summary")
+        else:
+            self.signals.finished.emit(self.conv_id, result)
+
+
+class ConversationSummarizer(QObject):
+    # Folds turns that have aged out of the context window into a rolling
+    # summary stored next to the log (<log>.summary.json). Each update sends
+    # only the previous summary plus the newly aged-out turns, and runs on a
+    # one-thread pool once no requests have been in flight for a while.
+    # Each stored checkpoint records how many leading entries it covers and
+    # the timestamp of the last one, so a summary that includes dropped
+    # turns is detected and rolled back. Calls go through the same
+    # RequestGate as the user's requests, so they count against the rate
+    # limits and the circuit breaker.
+    summary_updated = pyqtSignal(str, object)
+
+    def __init__(self, get_client, get_history, is_busy, parent=None, model="deepseek-chat", enabled=False,
+                 keep_turns=10, batch_turns=4, max_tokens=600, idle_delay_ms=5000, load_summary=None, save_summary=None,
+                 gate=None):
+        super().__init__(parent)
+        self.gate = gate or RequestGate()
+        # Where checkpoints live; the <log>.summary.json sidecar by default
+        self.load_summary = load_summary or (lambda conv: load_checkpoints(conv['file']))
+        self.save_summary = save_summary or (lambda conv, checkpoints: save_checkpoints(conv['file'], checkpoints))
+        self.get_client = get_client
+        self.get_history = get_history
+        self.is_busy = is_busy
+        self.model = model
+        self.enabled = enabled
+        self.keep_turns = keep_turns
+        self.batch_turns = batch_turns
+        self.max_tokens = max_tokens
+        # conv_id -> checkpoints, oldest first
+        self.checkpoints = {}
+        self.waiting = {}
+        self.running = None
+        self.running_client = None
+        # The gate's token estimate for the running call
+        self.running_tokens = 0
+        self.stopped = False
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.signals = SummarySignals()
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+        self.signals.throttled.connect(self._on_throttled)
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(idle_delay_ms)
+        self.idle_timer.timeout.connect(self._on_idle)
+        # Set to however long the gate holds the next call
+        self.gate_timer = QTimer(self)
+        self.gate_timer.setSingleShot(True)
+        self.gate_timer.timeout.connect(self._on_idle)
+
+    def checkpoints_for(self, conv):
+        checkpoints = self.checkpoints.get(conv['id'])
+        if checkpoints is None:
+            try:
+                checkpoints = self.checkpoints[conv['id']] = self.load_summary(conv)
+            except (OSError, ValueError) as e:
+                # Not cached, so the next call tries again
+                logger.warning("Can't load summary for %s: %s", conv['id'], e)
+                return []
+        return checkpoints
+
+    def current(self, conv, history):
+        # Newest checkpoint whose covered turns are all still in the history
+        checkpoints = self.checkpoints_for(conv)
+        valid = len(checkpoints)
+        while valid and not self._matches(checkpoints[valid - 1], history):
+            valid -= 1
+        if valid < len(checkpoints):
+            del checkpoints[valid:]
+            try:
+                self.save_summary(conv, checkpoints)
+            except OSError as e:
+                logger.warning("Summary update failed for %s: %s", conv['id'], e)
+        return checkpoints[-1] if checkpoints else None
+
+    def _matches(self, checkpoint, history):
+        covered = checkpoint['covered']
+        return 0 < covered <= len(history) and entry_timestamp(history, covered - 1) == checkpoint['last_timestamp']
+
+    def summary_for(self, conv, history):
+        # (entries covered, summary text) to stand in for the oldest turns
+        if not self.enabled:
+            return None
+        self.current(conv, history)
+        # After drops, an older checkpoint leaves the recent turns verbatim
+        limit = len(history) - self.keep_turns
+        for checkpoint in reversed(self.checkpoints_for(conv)):
+            if checkpoint['covered'] <= limit:
+                return checkpoint['covered'], checkpoint['summary']
+        return None
+
+    def schedule(self, conv):
+        if not self.enabled or self.stopped or conv is None:
+            return
+        self.waiting[conv['id']] = conv
+        if self.running is None:
+            self.idle_timer.start()
+
+    def forget(self, conv_id):
+        self.waiting.pop(conv_id, None)
+        self.checkpoints.pop(conv_id, None)
+        if self.running is not None and self.running[0] is not None and self.running[0]['id'] == conv_id:
+            # Its result is dropped when it arrives
+            self.running = (None, 0, None)
+
+    def shutdown(self):
+        self.stopped = True
+        self.idle_timer.stop()
+        self.gate_timer.stop()
+        self.pool.clear()
+
+    def _on_idle(self):
+        if self.running is not None or not self.enabled or self.stopped:
+            return
+        if self.is_busy():
+            self.idle_timer.start()
+            return
+        client = self.get_client()
+        if client is None:
+            return
+        while self.waiting:
+            conv_id = next(iter(self.waiting))
+            conv = self.waiting.pop(conv_id)
+            if self._start(client, conv):
+                return
+
+    def _start(self, client, conv):
+        history = self.get_history(conv)
+        checkpoint = self.current(conv, history)
+        covered = checkpoint['covered'] if checkpoint else 0
+        target = len(history) - self.keep_turns
+        if target - covered < self.batch_turns:
+            return False
+        end = min(target, covered + MAX_BATCH_TURNS)
+        entries = history[covered:end]
+        messages = summary_messages(checkpoint['summary'] if checkpoint else "", entries, self.max_tokens)
+        tokens = estimate_tokens(messages)
+        seconds = self.gate.wait_time(tokens)[0]
+        if seconds > 0:
+            # Held like any other request; nothing else starts meanwhile
+            self.waiting[conv['id']] = conv
+            self.gate_timer.start(int(seconds * 1000) + 1)
+            return True
+        self.gate.acquire(tokens)
+        self.running_tokens = tokens
+        self.running = (conv, covered, {'covered': end, 'last_timestamp': entries[-1].get('timestamp')})
+        self.running_client = client
+        self.pool.start(SummaryTask(client, self.model, conv['id'], messages, self.max_tokens, self.signals))
+        return True
+
+    def _on_finished(self, conv_id, result):
+        conv, base, checkpoint = self.running
+        self.running = None
+        self.gate.responded(self.running_tokens, result.get('usage'))
+        self.summary_updated.emit(conv_id, dict(result, model=self.model))
+        if conv is not None:
+            checkpoints = self.checkpoints_for(conv)
+            current = checkpoints[-1]['covered'] if checkpoints else 0
+            # Unless the summary was rolled back while the call ran
+            if current == base:
+                checkpoint['summary'] = result['content'].strip()
+                checkpoint['updated'] = time.time()
+                checkpoints.append(checkpoint)
+                del checkpoints[:-MAX_CHECKPOINTS]
+                try:
+                    self.save_summary(conv, checkpoints)
+                except OSError as e:
+                    logger.warning("Summary update failed for %s: %s", conv['id'], e)
+            # Long histories take several batches
+            self.waiting[conv['id']] = conv
+        if self.waiting:
+            self.idle_timer.start()
+
+    def _on_failed(self, conv_id, message):
+        self.running = None
+        self.gate.responded(self.running_tokens)
+        logger.warning("Summary update failed for %s: %s", conv_id, message)
+        # Retried when the conversation next changes
+        if self.waiting:
+            self.idle_timer.start()
+
+    def _on_throttled(self, conv_id, retry_after, message):
+        conv = self.running[0]
+        self.running = None
+        self.gate.throttled(retry_after)
+        logger.warning("Summary update for %s will be retried: %s", conv_id, message)
+        # The gate holds the retry for Retry-After or the breaker's cooldown
+        if conv is not None:
+            self.waiting.setdefault(conv['id'], conv)
+        self.idle_timer.start()
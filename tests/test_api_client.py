@@ -0,0 +1,48 @@
+from api_client import ClientManager
+
+
+class FakeClient:
+    def __init__(self, api_key, base_url):
+        self.api_key = api_key
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def manager():
+    manager = ClientManager()
+    manager._build_client = FakeClient
+    return manager
+
+
+def test_clients_are_shared_per_key():
+    clients = manager()
+    assert clients.get_client("k") is clients.get_client("k", "https://api.deepseek.com/")
+    assert clients.get_client("k") is not clients.get_client("other")
+    assert clients.get_client("") is None
+
+
+def test_configure_retires_clients_until_idle():
+    clients = manager()
+    busy = clients.get_client("k")
+    idle = clients.get_client("other")
+    assert not clients.configure(timeout=clients.timeout)
+    assert clients.get_client("k") is busy
+    assert clients.configure(timeout=30.0, pool_size=2)
+    fresh = clients.get_client("k")
+    assert fresh is not busy and not busy.closed
+    clients.close_retired([busy])
+    assert idle.closed and not busy.closed
+    clients.close_retired()
+    assert busy.closed and not fresh.closed
+    assert clients.retired == []
+
+
+def test_close_includes_retired_clients():
+    clients = manager()
+    old = clients.get_client("k")
+    clients.configure(pool_size=3)
+    new = clients.get_client("k")
+    clients.close()
+    assert old.closed and new.closed
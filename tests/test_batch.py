@@ -0,0 +1,82 @@
+import json
+import asyncio
+from types import SimpleNamespace
+import pytest
+from batch import BatchRunner, load_history, load_done_indices
+from context_builder import ContextBuilder
+from conversation_store import read_log_entries
+
+
+class FakeClient:
+    # Later prompts answer sooner, so results finish out of order
+    def __init__(self, count, fail=()):
+        self.count = count
+        self.fail = fail
+        self.asked = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, stream, temperature):
+        prompt = messages[-1]['content']
+        self.asked.append(prompt)
+        index = int(prompt.split()[-1])
+        await asyncio.sleep(0.002 * (self.count - index))
+        if index in self.fail:
+            raise ValueError("bad request")
+        message = SimpleNamespace(content=f"answer {index}", reasoning_content=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def run(runner, prompts, resume=True):
+    return asyncio.run(runner.run(prompts, resume=resume))
+
+
+def prompts(count):
+    return [{'prompt': f"question {i}"} for i in range(count)]
+
+
+def runner(client, path, **options):
+    return BatchRunner(client, path, ContextBuilder(), concurrency=4, log=None, **options)
+
+
+def test_output_is_in_input_order(tmp_path):
+    path = str(tmp_path / "out.txt")
+    client = FakeClient(8, fail=(5,))
+    stats = run(runner(client, path), prompts(8))
+    assert client.asked[0] == "question 0"
+    assert (stats['completed'], stats['failed'], stats['skipped']) == (7, 1, 0)
+    entries = read_log_entries(path)
+    assert [e['batch_index'] for e in entries] == [0, 1, 2, 3, 4, 6, 7]
+    assert [e['response'] for e in entries][:2] == ["answer 0", "answer 1"]
+    with open(path + ".errors.jsonl", encoding="utf-8") as f:
+        assert [json.loads(line)['batch_index'] for line in f] == [5]
+
+
+def test_resume_skips_finished_items(tmp_path):
+    path = str(tmp_path / "out.txt")
+    run(runner(FakeClient(6, fail=(1, 4)), path), prompts(6))
+    assert load_done_indices(path) == {0, 2, 3, 5}
+    client = FakeClient(6)
+    stats = run(runner(client, path), prompts(6))
+    assert sorted(client.asked) == ["question 1", "question 4"]
+    assert (stats['completed'], stats['skipped']) == (2, 4)
+    # Resumed items are appended after the earlier run's
+    assert [e['batch_index'] for e in read_log_entries(path)] == [0, 2, 3, 5, 1, 4]
+    client = FakeClient(6)
+    assert run(runner(client, path), prompts(6))['skipped'] == 6 and not client.asked
+    stats = run(runner(client, path), prompts(6), resume=False)
+    assert stats['completed'] == 6
+
+
+def test_history_from_a_conversation_without_a_file_key(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "log").mkdir()
+    entry = {'prompt': "earlier", 'response': "reply", 'timestamp': 1.0}
+    (tmp_path / "log" / "123.txt").write_text(json.dumps(entry) + "\n", encoding="utf-8")
+    config = {'conversations': [{'id': "123", 'name': "Chat"}]}
+    args = SimpleNamespace(history=None, conversation="Chat")
+    assert [e['prompt'] for e in load_history(args, config)] == ["earlier"]
+    args.conversation = "nope"
+    with pytest.raises(ValueError):
+        load_history(args, config)
+    args.conversation = None
+    assert load_history(args, config) == []
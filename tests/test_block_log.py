@@ -0,0 +1,130 @@
+import os
+import json
+import pytest
+from block_log import (SMALL_BLOCK_BYTES, BlockLog, append_block, count_small_blocks, encode_block,
+                       iter_block_lines, scan_block_log, scan_blocks, write_block_log)
+from conversation_store import COMPACT_SMALL_BLOCK_RATIO, COMPACT_SMALL_BLOCKS, ConversationStore
+
+
+def line(i, size=0):
+    record = {'prompt': f"prompt {i} 問題", 'response': "x" * size, 'timestamp': 1000.0 + i}
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def tombstone(n):
+    return (json.dumps({'_tombstone': n}) + "\n").encode("utf-8")
+
+
+def blocks_of(path):
+    with open(path, 'rb') as f:
+        return scan_blocks(f)[0]
+
+
+def timestamps(log):
+    return [e['timestamp'] for e in log]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "c.txt.gz")
+    lines = [line(i, 40 * 1024) for i in range(10)]
+    write_block_log(path, lines)
+    # Blocks are cut at MAX_BLOCK_BYTES of raw lines
+    assert len(blocks_of(path)) == 2
+    assert list(iter_block_lines(path)) == lines
+    records, tombstones, last_line = scan_block_log(path)
+    assert (records, tombstones, last_line) == (10, 0, lines[-1])
+    log = BlockLog(path)
+    assert len(log) == 10
+    assert log[3]['prompt'] == "prompt 3 問題"
+    assert timestamps(log) == [1000.0 + i for i in range(10)]
+
+
+def test_tombstones(tmp_path):
+    path = str(tmp_path / "c.txt.gz")
+    write_block_log(path, [line(i) for i in range(4)] + [tombstone(1), tombstone(3)])
+    assert scan_block_log(path) == (4, 2, line(3))
+    assert list(iter_block_lines(path, tombstone_blocks_only=True))[-2:] == [tombstone(1), tombstone(3)]
+    assert timestamps(BlockLog(path)) == [1000.0, 1002.0]
+
+
+def test_torn_tail_is_skipped(tmp_path):
+    path = str(tmp_path / "c.txt.gz")
+    write_block_log(path, [line(i) for i in range(3)])
+    with open(path, 'ab') as f:
+        f.write(encode_block([line(3)])[:-5])
+    assert len(blocks_of(path)) == 1
+    assert timestamps(BlockLog(path)) == [1000.0, 1001.0, 1002.0]
+    # The next append lands after the torn bytes and is still found
+    append_block(path, [line(4)])
+    assert timestamps(BlockLog(path)) == [1000.0, 1001.0, 1002.0, 1004.0]
+
+
+def test_garbage_between_blocks_is_resynced(tmp_path):
+    path = str(tmp_path / "c.txt.gz")
+    with open(path, 'wb') as f:
+        f.write(encode_block([line(0)]))
+        f.write(b"\x1f\x8b\x08\x04garbage")
+        f.write(encode_block([line(1)]))
+    assert len(blocks_of(path)) == 2
+    assert timestamps(BlockLog(path)) == [1000.0, 1001.0]
+
+
+def test_corrupt_block_raises(tmp_path):
+    path = str(tmp_path / "c.txt.gz")
+    write_block_log(path, [line(0, 100)])
+    with open(path, 'r+b') as f:
+        f.seek(-8, os.SEEK_END)
+        f.write(b"\0\0\0\0")
+    with pytest.raises(ValueError):
+        list(iter_block_lines(path))
+
+
+def test_appends_never_rewrite_written_blocks(tmp_path):
+    path = str(tmp_path / "c.txt.gz")
+    write_block_log(path, [line(i) for i in range(3)])
+    with open(path, 'rb') as f:
+        written = f.read()
+    log = BlockLog(path)
+    assert append_block(path, [line(3)])
+    assert not append_block(path, [line(4, SMALL_BLOCK_BYTES)])
+    assert append_block(path, [tombstone(0)])
+    with open(path, 'rb') as f:
+        assert f.read(len(written)) == written
+    assert len(blocks_of(path)) == 4
+    log.refresh()
+    assert (log.records, log.tombstones) == (5, 1)
+    assert timestamps(log) == [1001.0, 1002.0, 1003.0, 1004.0]
+    # The migrated block and the two one-line appends
+    assert count_small_blocks(path) == 3
+
+
+def test_compaction_threshold(tmp_path):
+    path = str(tmp_path / "c.txt.gz")
+    conv = {'id': "c", 'file': path}
+    store = ConversationStore()
+    # Appends run the check themselves; call it by hand below instead
+    store.compact_in_background = lambda conv: None
+    for i in range(COMPACT_SMALL_BLOCKS - 1):
+        store.append_entry(conv, json.loads(line(i)))
+    assert conv['small_blocks'] == COMPACT_SMALL_BLOCKS - 1
+    assert not store.needs_compaction(conv)
+    store.append_entry(conv, json.loads(line(COMPACT_SMALL_BLOCKS)))
+    assert store.needs_compaction(conv)
+    store.compact(conv)
+    assert len(blocks_of(path)) == 1
+    store.refresh_metadata(conv)
+    assert conv['small_blocks'] == 1 and not store.needs_compaction(conv)
+    assert scan_block_log(path)[:2] == (COMPACT_SMALL_BLOCKS, 0)
+
+
+def test_long_logs_compact_after_a_share_of_their_entries(tmp_path):
+    path = str(tmp_path / "c.txt.gz")
+    write_block_log(path, [line(i, 1000) for i in range(1000)])
+    conv = {'id': "c", 'file': path}
+    store = ConversationStore()
+    store.refresh_metadata(conv)
+    assert conv['small_blocks'] == 0
+    conv['small_blocks'] = COMPACT_SMALL_BLOCKS
+    assert not store.needs_compaction(conv)
+    conv['small_blocks'] = int(1000 * COMPACT_SMALL_BLOCK_RATIO)
+    assert store.needs_compaction(conv)
@@ -0,0 +1,44 @@
+import os
+import json
+import pytest
+from config_store import ConfigManager
+
+
+def test_save_and_load(tmp_path):
+    manager = ConfigManager(str(tmp_path / "config.json"))
+    config = manager.load_config()
+    assert config['conversations'] == [] and manager.load_error is None
+    config['history_limit'] = 3
+    manager.mark_dirty()
+    assert manager.save_config(config)
+    assert not manager.dirty
+    # Unchanged text isn't rewritten
+    manager.mark_dirty()
+    assert not manager.save_config(config) and not manager.dirty
+    assert ConfigManager(manager.path).load_config()['history_limit'] == 3
+
+
+def test_failed_save_stays_dirty(tmp_path, monkeypatch):
+    manager = ConfigManager(str(tmp_path / "config.json"))
+    config = manager.load_config()
+    manager.mark_dirty()
+
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, 'replace', fail)
+    with pytest.raises(OSError):
+        manager.save_config(config)
+    assert manager.dirty
+    monkeypatch.undo()
+    assert manager.save_config(config) and not manager.dirty
+
+
+def test_old_conversation_lists_are_upgraded(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({'conversations': ["1", "2"]}))
+    config = ConfigManager(str(path)).load_config()
+    assert config['conversations'][1] == {'id': "2", 'name': "Conversation 2", 'file': "log/2.txt"}
+    assert config['history_limit'] == 10
+    path.write_text("{broken")
+    manager = ConfigManager(str(path))
+    assert manager.load_config()['conversations'] == [] and manager.load_error
@@ -0,0 +1,139 @@
+from context_builder import MESSAGE_OVERHEAD, SUMMARY_HEADER, TRUNCATION_MARK, ContextBuilder
+from token_counter import count_tokens
+
+
+def entry(i, response="reply"):
+    return {'prompt': f"question {i}", 'response': f"{response} {i}", 'timestamp': 1000.0 + i}
+
+
+def prompts(messages):
+    return [m['content'] for m in messages if m['role'] == "user"]
+
+
+def system(messages):
+    return [m['content'] for m in messages if m['role'] == "system"]
+
+
+def cost(builder, history, indices):
+    return sum(builder.turn_cost(*builder.entry_tokens(history[i])) for i in indices)
+
+
+def budget_for(builder, history, indices, new_prompt="next"):
+    # Exactly enough for the given turns, the new prompt and a placeholder
+    return cost(builder, history, indices) + count_tokens(new_prompt) + MESSAGE_OVERHEAD + 16
+
+
+def test_newest_turns_fill_the_budget():
+    history = [entry(i) for i in range(10)]
+    builder = ContextBuilder()
+    builder.token_budget = budget_for(builder, history, range(7, 10))
+    messages = builder.build(history, "next")
+    assert prompts(messages) == ["question 7", "question 8", "question 9", "next"]
+    assert builder.last_stats['turns'] == 3 and builder.last_stats['dropped'] == 7
+    assert builder.last_stats['tokens'] <= builder.token_budget
+    # One token short drops the oldest of them
+    builder.token_budget -= 1
+    assert prompts(builder.build(history, "next")) == ["question 8", "question 9", "next"]
+
+
+def test_kept_turns_stay_contiguous():
+    history = [entry(i) for i in range(6)]
+    history[3] = entry(3, "long " * 200)
+    builder = ContextBuilder(truncate_oversized=False)
+    builder.token_budget = budget_for(builder, history, [0, 1, 2, 4, 5])
+    # Turn 3 doesn't fit, so nothing older than it is sent either
+    assert prompts(builder.build(history, "next")) == ["question 4", "question 5", "next"]
+
+
+def test_max_turns_and_everything_fitting():
+    history = [entry(i) for i in range(5)]
+    builder = ContextBuilder(max_turns=2)
+    messages = builder.build(history, "next", leading_messages=[{"role": "system", "content": "be brief"}])
+    assert messages[0] == {"role": "system", "content": "be brief"}
+    assert prompts(messages) == ["question 3", "question 4", "next"]
+    builder.max_turns = None
+    messages = builder.build(history, "next")
+    assert len(messages) == 11 and system(messages) == []
+    assert builder.last_stats['dropped'] == 0
+
+
+def test_keep_first_turn():
+    history = [entry(i) for i in range(10)]
+    builder = ContextBuilder(keep_first_turn=True)
+    builder.token_budget = budget_for(builder, history, [0, 8, 9])
+    messages = builder.build(history, "next")
+    assert prompts(messages) == ["question 0", "question 8", "question 9", "next"]
+    # The placeholder sits between the first turn and the recent ones
+    assert messages[2] == {"role": "system", "content": "[7 earlier turns omitted]"}
+    assert builder.last_stats['turns'] == 3 and builder.last_stats['dropped'] == 7
+    # The first turn goes in before any recent one
+    builder.token_budget = budget_for(builder, history, [0])
+    assert prompts(builder.build(history, "next")) == ["question 0", "next"]
+    assert builder.last_stats['dropped'] == 9
+
+
+def test_omitted_turns_placeholder():
+    history = [entry(i) for i in range(4)]
+    builder = ContextBuilder(max_turns=1)
+    assert system(builder.build(history, "next")) == ["[3 earlier turns omitted]"]
+    builder.summary_placeholder = False
+    messages = builder.build(history, "next")
+    assert system(messages) == [] and prompts(messages) == ["question 3", "next"]
+    builder.summary_placeholder = True
+    builder.max_turns = None
+    assert system(builder.build(history, "next")) == []
+
+
+def test_summary_replaces_covered_turns():
+    history = [entry(i) for i in range(8)]
+    builder = ContextBuilder(keep_first_turn=True)
+    messages = builder.build(history, "next", summary=(5, "they talked about 0 to 4"))
+    assert messages[0] == {"role": "system", "content": SUMMARY_HEADER + "they talked about 0 to 4"}
+    # The summary includes the first turn, so it isn't repeated
+    assert prompts(messages) == ["question 5", "question 6", "question 7", "next"]
+    assert builder.last_stats['summarized'] == 5 and builder.last_stats['dropped'] == 0
+    # Turns after the summary that don't fit still get the placeholder
+    builder.token_budget = budget_for(builder, history, [7]) + count_tokens(messages[0]['content']) + MESSAGE_OVERHEAD
+    messages = builder.build(history, "next", summary=(5, "they talked about 0 to 4"))
+    assert system(messages)[1:] == ["[2 earlier turns omitted]"]
+    assert prompts(messages) == ["question 7", "next"]
+
+
+def test_oversized_responses_are_truncated():
+    history = [entry(0, "word " * 2000)]
+    builder = ContextBuilder(token_budget=1000, oversized_ratio=0.1)
+    response = builder.build(history, "next")[1]['content']
+    assert response.endswith(TRUNCATION_MARK)
+    assert count_tokens(response[:-len(TRUNCATION_MARK)]) <= 100
+
+
+def test_stable_prefix_moves_in_steps():
+    history = [entry(i) for i in range(4)]
+    builder = ContextBuilder(max_turns=4, stable_prefix=True)
+    first_sent = {}
+    for n in range(5, 11):
+        history.append(entry(n - 1))
+        messages = builder.build(history, "next", anchor_key="conv")
+        first_sent[n] = int(prompts(messages)[0].split()[1])
+        assert prompts(messages)[-2] == f"question {n - 1}"
+    # Re-anchoring keeps 3 of the 4 turns, so the next send reuses the prefix
+    assert first_sent == {5: 2, 6: 2, 7: 4, 8: 4, 9: 6, 10: 6}
+    # Other conversations have their own anchor
+    assert prompts(builder.build(history[:5], "next", anchor_key="other"))[0] == "question 2"
+
+
+def test_stable_prefix_reanchors_when_over_budget():
+    history = [entry(i) for i in range(6)]
+    builder = ContextBuilder(stable_prefix=True, truncate_oversized=False)
+    builder.build(history, "next", anchor_key="conv")
+    assert builder.anchors["conv"] == 2
+    history.append(entry(6, "long " * 50))
+    builder.token_budget = budget_for(builder, history, range(4, 7))
+    messages = builder.build(history, "next", anchor_key="conv")
+    assert builder.anchors["conv"] >= 4
+    assert prompts(messages)[-2] == "question 6"
+    assert builder.last_stats['tokens'] <= builder.token_budget
+    # A newest turn bigger than the slack is still sent when it fits
+    history.append(entry(7, "long " * 60))
+    builder.token_budget = budget_for(builder, history, [7])
+    assert prompts(builder.build(history, "next", anchor_key="conv")) == ["question 7", "next"]
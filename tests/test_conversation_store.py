@@ -0,0 +1,159 @@
+import os
+import time
+import json
+import pytest
+from conversation_store import (ConversationStore, TOMBSTONE_KEY, iter_log_entries, read_log, scan_log_file,
+                                write_log_atomic)
+
+
+def entry(i):
+    return {'prompt': f"prompt {i} 問題", 'response': f"response {i}", 'timestamp': 1000.0 + i}
+
+
+def make_conv(tmp_path, count=0):
+    conv = {'id': "c", 'file': str(tmp_path / "c.txt")}
+    store = ConversationStore(compact_ratio=2.0)
+    for i in range(count):
+        store.append_entry(conv, entry(i))
+    return store, conv
+
+
+def timestamps(entries):
+    return [e['timestamp'] for e in entries]
+
+
+def test_append_round_trip(tmp_path):
+    store, conv = make_conv(tmp_path, 5)
+    with open(conv['file'], 'rb') as f:
+        assert f.read(3) == b"\xef\xbb\xbf"
+    history, ordinals, records, tombstones = read_log(conv['file'])
+    assert timestamps(history) == [1000.0 + i for i in range(5)]
+    assert ordinals == list(range(5))
+    assert (records, tombstones) == (5, 0)
+    assert history[0]['roles'] == {'user': 'user', 'assistant': 'assistant'}
+    assert timestamps(iter_log_entries(conv['file'])) == timestamps(history)
+    assert scan_log_file(conv['file']) == (5, 1004.0, 5, 0)
+
+
+def test_tombstones_replay(tmp_path):
+    store, conv = make_conv(tmp_path, 4)
+    assert store.drop_last(conv)['timestamp'] == 1003.0
+    store.append_entry(conv, entry(10))
+    store.drop_last(conv)
+    store.drop_last(conv)
+    with open(conv['file'], encoding="utf-8-sig") as f:
+        lines = [json.loads(line) for line in f]
+    # Entries are never rewritten, only marked deleted by their ordinal
+    assert [line[TOMBSTONE_KEY] for line in lines if TOMBSTONE_KEY in line] == [3, 4, 2]
+    history, ordinals, records, tombstones = read_log(conv['file'])
+    assert timestamps(history) == [1000.0, 1001.0]
+    assert ordinals == [0, 1]
+    assert (records, tombstones) == (5, 3)
+    assert timestamps(iter_log_entries(conv['file'])) == [1000.0, 1001.0]
+    assert scan_log_file(conv['file']) == (2, 1001.0, 5, 3)
+    assert timestamps(ConversationStore().get_history(dict(conv))) == [1000.0, 1001.0]
+
+
+def test_torn_tail_is_skipped_and_trimmed(tmp_path):
+    store, conv = make_conv(tmp_path, 3)
+    with open(conv['file'], 'ab') as f:
+        f.write(json.dumps(entry(3), ensure_ascii=False).encode("utf-8")[:-7])
+    assert timestamps(read_log(conv['file'])[0]) == [1000.0, 1001.0, 1002.0]
+    assert timestamps(iter_log_entries(conv['file'])) == [1000.0, 1001.0, 1002.0]
+    assert scan_log_file(conv['file'])[:3] == (3, 1002.0, 3)
+    # The next append starts on a clean line
+    store.append_entry(conv, entry(4))
+    assert timestamps(read_log(conv['file'])[0]) == [1000.0, 1001.0, 1002.0, 1004.0]
+
+
+def test_torn_tail_mid_character(tmp_path):
+    store, conv = make_conv(tmp_path, 1)
+    with open(conv['file'], 'ab') as f:
+        f.write(json.dumps(entry(1), ensure_ascii=False).encode("utf-8").split("問".encode("utf-8"))[0] + b"\xe5")
+    assert timestamps(read_log(conv['file'])[0]) == [1000.0]
+    store.append_entry(conv, entry(2))
+    assert timestamps(read_log(conv['file'])[0]) == [1000.0, 1002.0]
+
+
+def test_unterminated_complete_line_is_kept(tmp_path):
+    store, conv = make_conv(tmp_path, 1)
+    with open(conv['file'], 'ab') as f:
+        f.write(json.dumps(entry(1)).encode("utf-8"))
+    assert timestamps(read_log(conv['file'])[0]) == [1000.0, 1001.0]
+    store.append_entry(conv, entry(2))
+    assert timestamps(read_log(conv['file'])[0]) == [1000.0, 1001.0, 1002.0]
+
+
+def test_corrupt_line_mid_file_raises(tmp_path):
+    store, conv = make_conv(tmp_path, 1)
+    with open(conv['file'], 'a', encoding="utf-8") as f:
+        f.write("{not json\n")
+    store.append_entry(conv, entry(2))
+    with pytest.raises(ValueError):
+        read_log(conv['file'])
+
+
+def test_compaction_threshold(tmp_path):
+    # make_conv's compact_ratio keeps drop_last from compacting on its own
+    store, conv = make_conv(tmp_path, 10)
+    assert not store.needs_compaction(conv)
+    store.drop_last(conv)
+    # A tombstone makes two lines dead: itself and the entry
+    assert store.garbage_ratio(conv) == pytest.approx(2 / 11)
+    store.compact_ratio = 0.3
+    assert not store.needs_compaction(conv)
+    store.compact_ratio = 2.0
+    store.drop_last(conv)
+    assert store.garbage_ratio(conv) == pytest.approx(4 / 12)
+    store.compact_ratio = 0.3
+    assert store.needs_compaction(conv)
+    store.compact(conv)
+    assert (conv['records'], conv['tombstones']) == (8, 0)
+    assert not store.needs_compaction(conv)
+    assert scan_log_file(conv['file']) == (8, 1007.0, 8, 0)
+    assert timestamps(store.get_history(conv)) == [1000.0 + i for i in range(8)]
+
+
+def test_write_log_atomic_replaces_whole_log(tmp_path):
+    store, conv = make_conv(tmp_path, 3)
+    store.drop_last(conv)
+    write_log_atomic(conv['file'], [entry(7)])
+    assert read_log(conv['file'])[1:] == ([0], 1, 0)
+    assert not (tmp_path / "c.txt.tmp").exists()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    store = ConversationStore(cache_budget_bytes=250)
+    for name in "abc":
+        store.put_history(name, [entry(0)], size=100)
+    # Over budget: the oldest goes first
+    assert [store.is_loaded(name) for name in "abc"] == [False, True, True]
+    store.pin("b")
+    store.get_history({'id': "c", 'file': str(tmp_path / "c.txt")})
+    store.put_history("d", [], size=100)
+    assert [store.is_loaded(name) for name in "bcd"] == [True, False, True]
+    assert store.cached_bytes == 200
+    store.close()
+    assert store.cached_bytes == 0 and not store.cache
+
+
+def test_compaction_waiting_on_the_lock_skips_a_deleted_or_renamed_log(tmp_path):
+    for renamed in (False, True):
+        store, conv = make_conv(tmp_path, 4)
+        store.drop_last(conv)
+        store.compact_ratio = 0.1
+        lock = store.file_lock(conv['file'])
+        with lock:
+            store.compact_in_background(conv)
+            old_file = conv['file']
+            if renamed:
+                conv['file'] = str(tmp_path / "renamed.txt")
+                os.rename(old_file, conv['file'])
+            else:
+                os.remove(old_file)
+        while store.compacting:
+            time.sleep(0.01)
+        assert not os.path.exists(old_file)
+        if renamed:
+            assert read_log(conv['file'])[2:] == (4, 1)
+            os.remove(conv['file'])
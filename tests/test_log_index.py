@@ -0,0 +1,143 @@
+import os
+import json
+import pytest
+from log_index import HEADER, INDEX_MAGIC, RECORD, UNCOUNTED, IndexedLog, sidecar_path
+from token_counter import count_tokens
+
+
+def entry(i):
+    return {'prompt': f"prompt {i}", 'response': f"response {i} " * (i + 1), 'timestamp': 1000.0 + i}
+
+
+def write_lines(path, records, mode='ab'):
+    with open(path, mode) as f:
+        for record in records:
+            f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = str(tmp_path / "c.txt")
+    write_lines(path, [entry(i) for i in range(5)], mode='wb')
+    return path
+
+
+def count_resets(monkeypatch):
+    resets = []
+    original = IndexedLog._reset_index
+    monkeypatch.setattr(IndexedLog, '_reset_index', lambda self: (resets.append(1), original(self)))
+    return resets
+
+
+def timestamps(log):
+    return [log.timestamp(i) for i in range(len(log))]
+
+
+def test_round_trip(log_path):
+    log = IndexedLog(log_path)
+    assert len(log) == 5
+    assert log[2]['prompt'] == "prompt 2"
+    assert log[-1]['timestamp'] == 1004.0
+    assert [e['timestamp'] for e in log[1:3]] == [1001.0, 1002.0]
+    assert timestamps(log) == [1000.0 + i for i in range(5)]
+    assert log.find_timestamp(1003.0) == 3
+    log.close()
+    with open(sidecar_path(log_path), 'rb') as f:
+        magic, _, size, _, records, tombstones = HEADER.unpack(f.read(HEADER.size))
+    assert (magic, size, records, tombstones) == (INDEX_MAGIC, os.path.getsize(log_path), 5, 0)
+    assert os.path.getsize(sidecar_path(log_path)) == HEADER.size + 5 * RECORD.size
+
+
+def test_token_counts_are_filled_in_lazily(log_path):
+    log = IndexedLog(log_path)
+    assert log.read_record(4)[3:5] == (UNCOUNTED, UNCOUNTED)
+    expected = (count_tokens("prompt 4"), count_tokens("response 4 " * 5))
+    assert log.token_counts(4) == expected
+    log.close()
+    reopened = IndexedLog(log_path)
+    assert reopened.read_record(4)[3:5] == expected
+    assert reopened.read_record(0)[3] == UNCOUNTED
+
+
+def test_reopen_reuses_index(log_path, monkeypatch):
+    IndexedLog(log_path).close()
+    resets = count_resets(monkeypatch)
+    log = IndexedLog(log_path)
+    assert len(log) == 5 and not resets
+
+
+def test_appends_and_tombstones_are_caught_up(log_path):
+    log = IndexedLog(log_path)
+    write_lines(log_path, [entry(5), {'_tombstone': 1}, entry(6), {'_tombstone': 5}])
+    log.refresh()
+    live = timestamps(log)
+    assert live == [1000.0, 1002.0, 1003.0, 1004.0, 1006.0]
+    assert (log.records, log.tombstones) == (7, 2)
+    assert log[1]['prompt'] == "prompt 2"
+    log.close()
+    reopened = IndexedLog(log_path)
+    assert timestamps(reopened) == live
+
+
+def test_torn_tail_waits_for_the_rest_of_the_line(log_path):
+    log = IndexedLog(log_path)
+    line = (json.dumps(entry(5)) + "\n").encode("utf-8")
+    with open(log_path, 'ab') as f:
+        f.write(line[:10])
+    log.refresh()
+    assert len(log) == 5
+    with open(log_path, 'ab') as f:
+        f.write(line[10:])
+    log.refresh()
+    assert len(log) == 6 and log[5]['timestamp'] == 1005.0
+
+
+def test_truncated_log_rebuilds_index(log_path, monkeypatch):
+    IndexedLog(log_path).close()
+    write_lines(log_path, [entry(7), entry(8)], mode='wb')
+    resets = count_resets(monkeypatch)
+    log = IndexedLog(log_path)
+    assert resets
+    assert timestamps(log) == [1007.0, 1008.0]
+
+
+def test_fingerprint_mismatch_rebuilds_index(log_path, monkeypatch):
+    IndexedLog(log_path).close()
+    # Same size, different bytes in the covered tail
+    with open(log_path, 'r+b') as f:
+        data = f.read()
+        f.seek(0)
+        f.write(data.replace(b"1004.0", b"1009.0"))
+    resets = count_resets(monkeypatch)
+    log = IndexedLog(log_path)
+    assert resets
+    assert log.timestamp(4) == 1009.0
+
+
+def test_damaged_index_is_rebuilt(log_path):
+    IndexedLog(log_path).close()
+    with open(sidecar_path(log_path), 'r+b') as f:
+        f.truncate(HEADER.size + 2 * RECORD.size + 5)
+    log = IndexedLog(log_path)
+    assert timestamps(log) == [1000.0 + i for i in range(5)]
+
+
+def test_compact_drops_deleted_entries(log_path):
+    write_lines(log_path, [{'_tombstone': 0}, {'_tombstone': 3}])
+    log = IndexedLog(log_path)
+    assert log.compact() == 3
+    assert (log.records, log.tombstones) == (3, 0)
+    assert timestamps(log) == [1001.0, 1002.0, 1004.0]
+    with open(log_path, 'rb') as f:
+        assert b"_tombstone" not in f.read()
+
+
+def test_closed_log_is_not_reopened(log_path):
+    log = IndexedLog(log_path)
+    log.close()
+    os.remove(log_path)
+    os.remove(sidecar_path(log_path))
+    with pytest.raises(ValueError):
+        log.entry(0)
+    log.refresh()
+    assert not os.path.exists(sidecar_path(log_path))
@@ -0,0 +1,163 @@
+import time
+import email.utils
+from types import SimpleNamespace
+import pytest
+from rate_limit import (MAX_RETRY_AFTER, CircuitBreaker, RequestGate, RetryPolicy, TokenBucket,
+                        parse_retry_after)
+from request_engine import RequestWorker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(60, clock)
+    # Ten seconds' worth at one per second
+    assert bucket.capacity == 10
+    for _ in range(10):
+        assert bucket.wait_time() == 0
+        bucket.take()
+    assert bucket.wait_time() == pytest.approx(1.0)
+    clock.advance(0.25)
+    assert bucket.wait_time() == pytest.approx(0.75)
+    clock.advance(100)
+    # Never more than a full bucket
+    assert bucket.wait_time(10) == 0 and bucket.level == bucket.capacity
+
+
+def test_bucket_debt_and_oversized_takes(clock):
+    bucket = TokenBucket(600, clock)
+    # More than the bucket holds only needs it full
+    assert bucket.wait_time(1000) == 0
+    bucket.take(1000)
+    assert bucket.wait_time(1) == pytest.approx((1 + 1000 - 100) / 10)
+    assert TokenBucket(0, clock).wait_time(10 ** 9) == 0
+
+
+def test_breaker_opens_probes_and_closes(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=30.0, max_cooldown=100.0, clock=clock)
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open" and breaker.wait_time() == 30.0
+    clock.advance(30)
+    assert breaker.state == "half-open" and breaker.wait_time() == 0
+    breaker.attempt()
+    # Only the probe goes through
+    assert breaker.wait_time() > 0
+    breaker.failure()
+    assert breaker.state == "open" and breaker.wait_time() == 60.0
+    clock.advance(60)
+    breaker.attempt()
+    breaker.failure()
+    assert breaker.wait_time() == 100.0
+    clock.advance(100)
+    breaker.attempt()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.wait_time() == 0
+    assert breaker.open_cooldown == 30.0
+
+
+def test_abandoned_probe_lets_the_next_one_through(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=5.0, clock=clock)
+    breaker.failure()
+    clock.advance(5)
+    breaker.attempt()
+    breaker.abandon()
+    assert breaker.state == "half-open" and breaker.wait_time() == 0
+
+
+def test_retry_delay_jitter_bounds(monkeypatch):
+    policy = RetryPolicy(base_delay=1.0, max_delay=8.0)
+    monkeypatch.setattr("random.uniform", lambda low, high: low)
+    assert [policy.delay(n) for n in range(5)] == [0.5, 1.0, 2.0, 4.0, 4.0]
+    monkeypatch.setattr("random.uniform", lambda low, high: high)
+    assert [policy.delay(n) for n in range(5)] == [1.0, 2.0, 4.0, 8.0, 8.0]
+    monkeypatch.undo()
+    for _ in range(100):
+        assert 2.0 <= policy.delay(2) <= 4.0
+    assert policy.delay(2, retry_after=17.0) == 17.0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after({}) is None
+    assert parse_retry_after({'retry-after': "7"}) == 7.0
+    assert parse_retry_after({'retry-after-ms': "1500", 'retry-after': "7"}) == 1.5
+    assert parse_retry_after({'retry-after': "-3"}) == 0.0
+    assert parse_retry_after({'retry-after': "99999"}) == MAX_RETRY_AFTER
+    assert parse_retry_after({'retry-after': "soon"}) is None
+    date = email.utils.formatdate(time.time() + 120, usegmt=True)
+    assert parse_retry_after({'retry-after': date}) == pytest.approx(120, abs=2)
+
+
+def test_gate_waits_for_the_longest_limit(clock):
+    gate = RequestGate(requests_per_minute=60, tokens_per_minute=600, clock=clock)
+    assert gate.wait_time(100) == (0.0, "")
+    gate.acquire(100)
+    assert gate.wait_time(100) == (pytest.approx(10.0), "tokens/min limit")
+    gate.responded(100, used=160)
+    assert gate.wait_time(100)[0] == pytest.approx(16.0)
+    gate.throttled(retry_after=30.0)
+    assert gate.wait_time(0) == (30.0, "rate limited by the server")
+
+
+class ServerError(Exception):
+    status_code = 503
+    response = None
+
+
+def chunk(content):
+    delta = SimpleNamespace(content=content, reasoning_content=None)
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        for item in self.chunks:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        pass
+
+
+def run_worker(chunks, stream=True):
+    def create(**kwargs):
+        if not stream:
+            raise chunks[0]
+        return FakeStream(chunks)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    worker = RequestWorker(1, client, "model", [], 1.0, stream)
+    events = []
+    worker.signals.throttled.connect(lambda *args: events.append("throttled"))
+    worker.signals.failed.connect(lambda *args: events.append("failed"))
+    worker.signals.chunk.connect(lambda *args: events.append("chunk"))
+    worker.run()
+    return events
+
+
+def test_errors_before_any_reply_are_retried():
+    assert run_worker([ServerError("busy")], stream=False) == ["throttled"]
+    assert run_worker([ServerError("busy")]) == ["throttled"]
+
+
+def test_no_retry_after_a_partial_streamed_reply():
+    assert run_worker([chunk("Hel"), ServerError("dropped")]) == ["chunk", "failed"]
@@ -0,0 +1,161 @@
+import time
+from types import SimpleNamespace
+import pytest
+from PyQt5.QtCore import QCoreApplication
+from rate_limit import RequestGate
+from request_engine import RequestEngine
+from request_scheduler import ConversationScheduler
+
+
+@pytest.fixture(scope="module")
+def qapp():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+class Jobs:
+    # start_job for the scheduler: records what started, hands out ids
+    def __init__(self):
+        self.started = []
+        self.ids = {}
+
+    def __call__(self, conv_id, job):
+        self.started.append(job)
+        request_id = len(self.started)
+        self.ids[job] = request_id
+        return request_id
+
+
+def scheduler(max_concurrent=4):
+    jobs = Jobs()
+    return ConversationScheduler(jobs, max_concurrent=max_concurrent), jobs
+
+
+def test_prompts_run_in_order_per_conversation():
+    sched, jobs = scheduler()
+    for job in ["a1", "a2", "b1", "a3"]:
+        sched.enqueue(job[0], job)
+    assert jobs.started == ["a1", "b1"]
+    assert sched.queued("a") == 2 and sched.is_busy("b")
+    sched.finished(jobs.ids["a1"])
+    assert jobs.started[-1] == "a2"
+    # A stale or repeated finish changes nothing
+    sched.finished(jobs.ids["a1"])
+    sched.finished(jobs.ids["a2"])
+    assert jobs.started[-1] == "a3"
+    sched.finished(jobs.ids["a3"])
+    sched.finished(jobs.ids["b1"])
+    assert not sched.is_busy("a") and not sched.is_busy("b")
+
+
+def test_global_cap():
+    sched, jobs = scheduler(max_concurrent=2)
+    for job in ["a1", "b1", "c1", "a2", "d1"]:
+        sched.enqueue(job[0], job)
+    assert jobs.started == ["a1", "b1"]
+    sched.finished(jobs.ids["b1"])
+    assert jobs.started == ["a1", "b1", "c1"]
+    # a2 waited behind a1, but conversations take turns in arrival order
+    sched.finished(jobs.ids["a1"])
+    assert jobs.started[-1] == "d1"
+    sched.finished(jobs.ids["c1"])
+    assert jobs.started[-1] == "a2"
+    sched.set_max_concurrent(4)
+    sched.enqueue("e", "e1")
+    assert len(sched.active) == 3
+
+
+def test_queue_order_after_a_cancel_while_queued():
+    sched, jobs = scheduler(max_concurrent=1)
+    for job in ["a1", "a2", "a3", "b1", "b2", "c1"]:
+        sched.enqueue(job[0], job)
+    assert sched.clear_queue("a") == 2
+    assert sched.clear_queue("b") == 2
+    assert sched.queued("a") == 0 and sched.is_busy("a") and not sched.is_busy("b")
+    # A prompt queued after the cancel waits behind the ones still queued
+    sched.enqueue("b", "b3")
+    sched.enqueue("a", "a4")
+    sched.finished(jobs.ids["a1"])
+    assert jobs.started == ["a1", "c1"]
+    sched.finished(jobs.ids["c1"])
+    sched.finished(jobs.ids["b3"])
+    assert jobs.started == ["a1", "c1", "b3", "a4"]
+
+
+def test_jobs_that_finish_without_a_request():
+    started = []
+    sched = ConversationScheduler(lambda conv_id, job: started.append(job), max_concurrent=1)
+    for job in ["a1", "a2", "b1"]:
+        sched.enqueue(job[0], job)
+    assert started == ["a1", "a2", "b1"]
+    assert not sched.active and not sched.queues
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_client(replies):
+    def create(**kwargs):
+        replies.append(kwargs['messages'][0]['content'])
+        message = SimpleNamespace(content="ok " + replies[-1], reasoning_content=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def messages(text):
+    return [{"role": "user", "content": text}]
+
+
+def wait_for(qapp, condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        qapp.processEvents()
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_engine_runs_held_requests_in_submit_order(qapp):
+    clock = FakeClock()
+    # One request per ten seconds
+    engine = RequestEngine(max_workers=1, gate=RequestGate(requests_per_minute=6, clock=clock))
+    replies = []
+    completed = {}
+    engine.request_completed.connect(lambda request_id, result: completed.update({request_id: result}))
+    client = fake_client(replies)
+    ids = [engine.submit(client, "model", messages(f"m{i}"), 1.0) for i in range(4)]
+    assert list(engine.workers) == [ids[0]]
+    assert list(engine.waiting) == ids[1:]
+    assert engine.cancel(ids[1])
+    assert list(engine.waiting) == [ids[2], ids[3]] and engine.in_flight() == 3
+    clock.now += 10
+    engine._release_waiting()
+    assert list(engine.waiting) == [ids[3]]
+    clock.now += 10
+    engine._release_waiting()
+    wait_for(qapp, lambda: len(completed) == 3)
+    assert replies == ["m0", "m2", "m3"]
+    assert completed[ids[3]]['content'] == "ok m3"
+    assert engine.in_flight() == 0
+    engine.shutdown()
+
+
+def test_new_requests_queue_behind_held_ones(qapp):
+    clock = FakeClock()
+    engine = RequestEngine(max_workers=1, gate=RequestGate(requests_per_minute=6, clock=clock))
+    client = fake_client([])
+    first = engine.submit(client, "model", messages("a"), 1.0)
+    held = engine.submit(client, "model", messages("b"), 1.0)
+    clock.now += 10
+    # The bucket has room again, but the held request goes first
+    late = engine.submit(client, "model", messages("c"), 1.0)
+    assert list(engine.waiting) == [held, late]
+    engine._release_waiting()
+    assert list(engine.waiting) == [late] and held in engine.workers
+    engine.cancel_all()
+    assert engine.in_flight() == 0 and not engine.waiting
+    wait_for(qapp, lambda: first not in engine.workers)
+    engine.shutdown()
@@ -0,0 +1,100 @@
+import sqlite3
+import pytest
+import response_cache
+from response_cache import ResponseCache, cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache.time, 'time', clock)
+    return clock
+
+
+def reply(text):
+    return {'content': text, 'reasoning_content': "", 'usage': 10}
+
+
+def table_bytes(cache):
+    return cache.connection().execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+def test_key_normalisation():
+    messages = [{"role": "user", "content": "你好"}]
+    key = cache_key("deepseek-chat", 0.7, messages)
+    assert key == cache_key("deepseek-chat", "0.70000001", [{"content": "你好", "role": "user"}])
+    assert key != cache_key("deepseek-chat", 0.71, messages)
+    assert key != cache_key("deepseek-reasoner", 0.7, messages)
+    assert key != cache_key("deepseek-chat", 0.7, messages + [{"role": "user", "content": ""}])
+
+
+def test_round_trip_through_the_database(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "r.db"), memory_entries=1)
+    cache.put("a", reply("A"))
+    cache.put("b", reply("B"))
+    # "a" fell out of memory but is still on disk
+    assert cache.get("a") == reply("A")
+    assert cache.get("missing") is None
+    assert cache.stats() == {'hits': 1, 'memory_hits': 0, 'misses': 1}
+    cache.close()
+    assert ResponseCache(str(tmp_path / "r.db")).get("b") == reply("B")
+
+
+def test_ttl_expiry(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "r.db"), ttl=60)
+    cache.put("a", reply("A"))
+    clock.now += 30
+    cache.put("b", reply("B"))
+    clock.now += 31
+    assert cache.get("a") is None
+    assert cache.get("b") == reply("B")
+    assert cache.stored_bytes() == table_bytes(cache)
+    clock.now += 60
+    # Expired rows are swept by the next put
+    cache.put("c", reply("C"))
+    assert [row[0] for row in cache.connection().execute("SELECT key FROM responses")] == ["c"]
+    assert cache.stored_bytes() == table_bytes(cache)
+
+
+def test_lru_eviction(tmp_path, clock):
+    size = len(response_cache.json.dumps(reply("x"), ensure_ascii=False))
+    cache = ResponseCache(str(tmp_path / "r.db"), memory_entries=0, max_bytes=3 * size)
+    for key in "abc":
+        clock.now += 1
+        cache.put(key, reply("x"))
+    clock.now += 1
+    assert cache.get("a") == reply("x")
+    clock.now += 1
+    cache.put("d", reply("x"))
+    # "b" was the least recently used
+    assert cache.get("b") is None
+    assert all(cache.get(key) for key in "acd")
+    assert cache.stored_bytes() == table_bytes(cache) == 3 * size
+
+
+def test_running_total(tmp_path, clock):
+    path = str(tmp_path / "r.db")
+    cache = ResponseCache(path)
+    cache.put("a", reply("short"))
+    cache.put("a", reply("a longer reply"))
+    cache.put("b", reply("中文"))
+    assert cache.stored_bytes() == table_bytes(cache)
+    cache.clear()
+    assert cache.stored_bytes() == 0
+    cache.put("c", reply("again"))
+    cache.close()
+    # A database from before the total was kept gets it computed once
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE meta")
+    conn.commit()
+    conn.close()
+    cache = ResponseCache(path)
+    assert cache.stored_bytes() == table_bytes(cache) > 0
@@ -0,0 +1,78 @@
+import pytest
+from search_index import SearchIndex
+
+
+def entry(i, prompt, response=""):
+    return {'prompt': prompt, 'response': response, 'timestamp': 1000.0 + i}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+    if index.tokenizer != 'trigram':
+        pytest.skip("SQLite without the trigram tokenizer")
+    yield index
+    index.close()
+
+
+def found(index, query):
+    return sorted((conv_id, timestamp) for conv_id, timestamp, _ in index.search(query))
+
+
+def check_integrity(index):
+    conn = index.connection()
+    # Raises if a 'delete' didn't match what was inserted
+    conn.execute("INSERT INTO short_terms (short_terms, rank) VALUES ('integrity-check', 1)")
+
+
+def test_short_queries_use_the_side_index(index):
+    index.add_entry("a", entry(0, "這是中文測試", "plain reply"))
+    index.add_entry("a", entry(1, "Go or C#?", "中 alone"))
+    index.add_entry("b", entry(2, "nothing here"))
+    assert found(index, "中文") == [("a", 1000.0)]
+    assert found(index, "中") == [("a", 1000.0), ("a", 1001.0)]
+    assert found(index, "GO") == [("a", 1001.0)]
+    assert found(index, "c#") == [("a", 1001.0)]
+    # Pairs don't span whitespace
+    assert found(index, "ea") == []
+    assert found(index, "中文測試") == [("a", 1000.0)]
+    snippet = index.search("中文")[0][2]
+    assert snippet == "這是中文測試"
+
+
+def test_removals_keep_the_side_index_consistent(index):
+    for i in range(3):
+        index.add_entry("a", entry(i, f"問題 {i}", "回答"))
+    index.add_entry("b", entry(3, "問題 b"))
+    index.remove_entry("a", entry(1, ""))
+    assert found(index, "問題") == [("a", 1000.0), ("a", 1002.0), ("b", 1003.0)]
+    index.remove_conversation("b")
+    assert found(index, "問題") == [("a", 1000.0), ("a", 1002.0)]
+    index.rebuild_conversation("a", "a.txt", (1, 1.0), [entry(5, "回答 only")])
+    assert found(index, "問題") == []
+    assert found(index, "回答") == [("a", 1005.0)]
+    check_integrity(index)
+
+
+def test_older_index_gets_the_side_table(tmp_path):
+    path = str(tmp_path / "search.db")
+    index = SearchIndex(path)
+    if index.tokenizer != 'trigram':
+        pytest.skip("SQLite without the trigram tokenizer")
+    index.sync([("a", "a.txt", (1, 1.0), [entry(0, "中文")])])
+    index.connection().execute("DROP TABLE short_terms")
+    index.connection().commit()
+    index.close()
+    index = SearchIndex(path)
+    # Everything is reindexed by the next sync
+    assert index.connection().execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+    assert found(index, "中文") == []
+    index.sync([("a", "a.txt", (1, 1.0), [entry(0, "中文")])])
+    assert found(index, "中文") == [("a", 1000.0)]
+    check_integrity(index)
+    index.close()
+
+
+def test_side_index_is_contentless(index):
+    index.add_entry("a", entry(0, "secret text"))
+    assert index.connection().execute("SELECT grams FROM short_terms").fetchall() == [(None,)]
@@ -0,0 +1,89 @@
+import time
+import pytest
+from usage_ledger import MODEL_PRICES, UsageLedger, entry_cost, merge_prices, usage_breakdown
+
+
+def entry(timestamp, model="deepseek-chat", hit=0, miss=1000, completion=100, **extra):
+    details = {'prompt_tokens': hit + miss, 'completion_tokens': completion, 'total_tokens': hit + miss + completion,
+               'prompt_cache_hit_tokens': hit, 'prompt_cache_miss_tokens': miss}
+    return dict({'prompt': "q", 'response': "a", 'model': model, 'timestamp': timestamp,
+                 'usage': details['total_tokens'], 'usage_details': details}, **extra)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = UsageLedger(str(tmp_path / "ledger.db"))
+    yield ledger
+    ledger.close()
+
+
+def test_costs_use_the_price_table():
+    prices = MODEL_PRICES["deepseek-chat"]
+    expected = (400 * prices['input_cache_hit'] + 600 * prices['input_cache_miss'] + 100 * prices['output']) / 1e6
+    assert entry_cost(entry(0, hit=400, miss=600)) == pytest.approx(expected)
+    assert entry_cost(entry(0, cache_hit=True)) == 0.0
+    # Unknown models and old total-only entries use the fallback price
+    assert entry_cost(entry(0, model="other", hit=400, miss=600), fallback_price_per_1k=1.0,
+                      cache_hit_price_ratio=0.5) == pytest.approx(0.9)
+    assert entry_cost({'usage': 2000}, fallback_price_per_1k=0.5) == 1.0
+    assert usage_breakdown({'usage': 7})['total_tokens'] == 7
+    prices = merge_prices({"deepseek-chat": {'output': 9.0}})
+    assert prices["deepseek-chat"]['output'] == 9.0 and MODEL_PRICES["deepseek-chat"]['output'] != 9.0
+
+
+def test_record_and_totals(ledger):
+    day = time.mktime((2026, 3, 1, 12, 0, 0, 0, 0, -1))
+    ledger.record("a", entry(day, hit=300, miss=700), 0.5)
+    ledger.record("a", entry(day + 60, model="deepseek-reasoner", hit=0, miss=1000), 0.25)
+    ledger.record("b", entry(day + 86400), 1.0)
+    ledger.record("b", entry(day, cache_hit=True), 9.0)
+    totals = ledger.conversation_totals("a")
+    assert (totals['hit_tokens'], totals['miss_tokens'], totals['cost']) == (300, 1700, 0.75)
+    assert totals['hit_ratio'] == pytest.approx(300 / 2000)
+    assert ledger.conversation_totals("missing")['cost'] == 0
+    rows = ledger.totals('day')
+    assert [(row[0], row[1]) for row in rows] == [("2026-03-02", 1), ("2026-03-01", 2)]
+    assert [(row[0], row[1]) for row in ledger.totals('model')] == [("deepseek-reasoner", 1), ("deepseek-chat", 2)]
+    with pytest.raises(ValueError):
+        ledger.totals('prompt')
+
+
+def test_backfill_only_runs_on_a_new_ledger(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    ledger = UsageLedger(path)
+    ledger.backfill_in_background([("a", [entry(1.0)])], lambda e: 1.0).join()
+    assert ledger.conversation_totals("a")['cost'] == 1.0
+    assert ledger.backfill_in_background([("a", [entry(1.0)])], lambda e: 1.0) is None
+    ledger.close()
+    ledger = UsageLedger(path)
+    assert ledger.backfill_in_background([("a", [entry(1.0)])], lambda e: 1.0) is None
+    assert ledger.conversation_totals("a")['cost'] == 1.0
+    ledger.close()
+
+
+def test_entries_saved_during_the_backfill_count_once(ledger):
+    saved = []
+
+    def log():
+        # The log is read lazily; a reply is saved and recorded midway
+        yield entry(time.time() - 10)
+        late = entry(time.time() + 1)
+        ledger.record("a", late, 1.0)
+        saved.append(late)
+        yield late
+
+    ledger.backfill_in_background([("a", log()), ("b", [entry(5.0, cache_hit=True)])], lambda e: 1.0).join()
+    assert saved
+    totals = ledger.conversation_totals("a")
+    assert totals['cost'] == 2.0 and totals['miss_tokens'] == 2000
+    assert ledger.conversation_totals("b")['cost'] == 0
+
+
+def test_unreadable_logs_are_skipped(ledger):
+    def broken():
+        yield entry(1.0)
+        raise OSError("gone")
+
+    ledger.backfill([("a", broken()), ("b", [entry(1.0)])], lambda e: 1.0)
+    assert ledger.conversation_totals("a")['cost'] == 0
+    assert ledger.conversation_totals("b")['cost'] == 1.0
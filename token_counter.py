@@ -0,0 +1,89 @@
+import os
+import re
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+ENCODING_NAME = "cl100k_base"
+# tiktoken downloads the BPE file on first use; keeping it here instead of
+# the system temp dir means later starts (and offline starts) read it locally.
+BPE_CACHE_DIR = os.path.join("cache", "tiktoken")
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+# Runs of newlines stay attached to the line before them, so pieces split
+# where the BPE pre-tokenizer would split anyway.
+_PIECE_RE = re.compile(r'[^\n]*\n+|[^\n]+')
+
+
+def get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed:
+        return _encoding
+    with _encoding_lock:
+        if _encoding is None and not _encoding_failed:
+            try:
+                if "TIKTOKEN_CACHE_DIR" not in os.environ and "DATA_GYM_CACHE_DIR" not in os.environ:
+                    os.environ["TIKTOKEN_CACHE_DIR"] = os.path.abspath(BPE_CACHE_DIR)
+                import tiktoken
+                _encoding = tiktoken.get_encoding(ENCODING_NAME)
+            except Exception as e:
+                # Don't retry (and re-download) on every keystroke
+                logger.warning("tiktoken unavailable, estimating tokens as len/4: %s", e)
+                _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class IncrementalTokenCounter:
+    MAX_CACHED_PIECES = 50000
+
+    def __init__(self):
+        self.piece_counts = {}
+        self.lock = threading.Lock()
+
+    def count(self, text):
+        if not text:
+            return 0
+        with self.lock:
+            total = 0
+            pieces = _PIECE_RE.findall(text)
+            # Unchanged lines hit the cache, so an edit only re-encodes the
+            # lines it touched.
+            for piece in pieces:
+                n = self.piece_counts.get(piece)
+                if n is None:
+                    n = count_tokens(piece)
+                    self.piece_counts[piece] = n
+                total += n
+            if len(self.piece_counts) > self.MAX_CACHED_PIECES:
+                live = set(pieces)
+                self.piece_counts = {p: n for p, n in self.piece_counts.items() if p in live}
+            return total
+
+    def clear(self):
+        with self.lock:
+            self.piece_counts.clear()
+
+
+def truncate_to_tokens(text, max_tokens):
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
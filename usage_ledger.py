@@ -0,0 +1,177 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FILE = os.path.join("log", "usage_ledger.db")
+
+# USD per 1M tokens. Override or extend with config.json's 'model_prices'.
+MODEL_PRICES = {
+    "deepseek-chat": {'input_cache_hit': 0.07, 'input_cache_miss': 0.27, 'output': 1.10},
+    "deepseek-reasoner": {'input_cache_hit': 0.14, 'input_cache_miss': 0.55, 'output': 2.19},
+}
+
+LEDGER_GROUPS = ('conv_id', 'day', 'model')
+
+
+def merge_prices(overrides=None):
+    prices = {model: dict(table) for model, table in MODEL_PRICES.items()}
+    for model, table in (overrides or {}).items():
+        prices.setdefault(model, {}).update(table)
+    return prices
+
+
+def usage_breakdown(entry):
+    details = entry.get('usage_details') or {}
+    prompt = details.get('prompt_tokens', 0)
+    hit = details.get('prompt_cache_hit_tokens', 0)
+    return {
+        'prompt_tokens': prompt,
+        'completion_tokens': details.get('completion_tokens', 0),
+        'reasoning_tokens': details.get('reasoning_tokens', 0),
+        'cache_hit_tokens': hit,
+        'cache_miss_tokens': details.get('prompt_cache_miss_tokens', prompt - hit),
+        'total_tokens': details.get('total_tokens', entry.get('usage', 0))
+    }
+
+
+def entry_cost(entry, prices=None, fallback_price_per_1k=0.0, cache_hit_price_ratio=0.25):
+    if entry.get('cache_hit'):
+        return 0.0
+    table = (prices or MODEL_PRICES).get(entry.get('model'))
+    if not entry.get('usage_details'):
+        # Old entries only recorded a total
+        return entry.get('usage', 0) / 1000 * fallback_price_per_1k
+    usage = usage_breakdown(entry)
+    if table is None:
+        billable = (usage['cache_miss_tokens'] + usage['completion_tokens']
+                    + usage['cache_hit_tokens'] * cache_hit_price_ratio)
+        return billable / 1000 * fallback_price_per_1k
+    # Reasoning tokens are part of completion_tokens and billed as output
+    return (usage['cache_hit_tokens'] * table.get('input_cache_hit', 0)
+            + usage['cache_miss_tokens'] * table.get('input_cache_miss', 0)
+            + usage['completion_tokens'] * table.get('output', 0)) / 1000000
+
+
+class UsageLedger:
+    # Running totals keyed by (conversation, day, model). Each request adds
+    # one row update, so reports never rescan the conversation logs. Spend is
+    # kept when entries are later dropped from a conversation.
+
+    def __init__(self, path=LEDGER_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+        self.created = False
+
+    def connection(self):
+        if self.conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.created = not os.path.exists(self.path)
+            self.conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage (conv_id TEXT, day TEXT, model TEXT, requests INTEGER, "
+                "prompt_tokens INTEGER, completion_tokens INTEGER, reasoning_tokens INTEGER, "
+                "cache_hit_tokens INTEGER, cache_miss_tokens INTEGER, cost REAL, "
+                "PRIMARY KEY (conv_id, day, model))")
+            self.conn.commit()
+        return self.conn
+
+    def _row(self, conv_id, entry, cost):
+        usage = usage_breakdown(entry)
+        day = time.strftime('%Y-%m-%d', time.localtime(entry.get('timestamp') or time.time()))
+        return (conv_id, day, entry.get('model') or "unknown", usage['prompt_tokens'], usage['completion_tokens'],
+                usage['reasoning_tokens'], usage['cache_hit_tokens'], usage['cache_miss_tokens'], cost)
+
+    def _add(self, conn, rows):
+        conn.executemany(
+            "INSERT INTO usage VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (conv_id, day, model) DO UPDATE SET requests = requests + 1, "
+            "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+            "completion_tokens = completion_tokens + excluded.completion_tokens, "
+            "reasoning_tokens = reasoning_tokens + excluded.reasoning_tokens, "
+            "cache_hit_tokens = cache_hit_tokens + excluded.cache_hit_tokens, "
+            "cache_miss_tokens = cache_miss_tokens + excluded.cache_miss_tokens, "
+            "cost = cost + excluded.cost",
+            rows)
+
+    def record(self, conv_id, entry, cost):
+        if entry.get('cache_hit'):
+            return
+        with self.lock:
+            conn = self.connection()
+            self._add(conn, [self._row(conv_id, entry, cost)])
+            conn.commit()
+
+    def backfill(self, conversations, cost_fn, until=None):
+        # conversations: iterable of (conv_id, entries). Only run on a
+        # freshly created ledger, otherwise entries would be counted twice.
+        # Entries stamped after `until` were recorded as they were saved.
+        for conv_id, entries in conversations:
+            # Read without the lock, so record() isn't held up by a long log
+            try:
+                rows = [self._row(conv_id, entry, cost_fn(entry)) for entry in entries
+                        if not entry.get('cache_hit')
+                        and (until is None or (entry.get('timestamp') or 0) <= until)]
+            except (OSError, ValueError):
+                continue
+            with self.lock:
+                conn = self.connection()
+                self._add(conn, rows)
+                conn.commit()
+
+    def backfill_in_background(self, conversations, cost_fn):
+        with self.lock:
+            self.connection()
+            if not self.created:
+                return None
+            self.created = False
+        # Logs are read lazily while new entries are saved (and recorded).
+        # Compaction can renumber and resize a log meanwhile, so the mark
+        # is a time rather than an ordinal or offset.
+        until = time.time()
+        conversations = list(conversations)
+        thread = threading.Thread(target=self._backfill_quietly, args=(conversations, cost_fn, until), daemon=True)
+        thread.start()
+        return thread
+
+    def _backfill_quietly(self, conversations, cost_fn, until):
+        try:
+            self.backfill(conversations, cost_fn, until)
+        except Exception as e:
+            logger.warning("Usage ledger backfill failed: %s", e)
+
+    def totals(self, group_by):
+        if group_by not in LEDGER_GROUPS:
+            raise ValueError(f"Unknown ledger grouping: {group_by}")
+        with self.lock:
+            rows = self.connection().execute(
+                f"SELECT {group_by}, SUM(requests), SUM(prompt_tokens), SUM(completion_tokens), "
+                f"SUM(reasoning_tokens), SUM(cache_hit_tokens), SUM(cache_miss_tokens), SUM(cost) "
+                f"FROM usage GROUP BY {group_by} ORDER BY {group_by} DESC").fetchall()
+        return rows
+
+    def conversation_totals(self, conv_id):
+        with self.lock:
+            row = self.connection().execute(
+                "SELECT SUM(cache_hit_tokens), SUM(cache_miss_tokens), SUM(cost) FROM usage WHERE conv_id = ?",
+                (conv_id,)).fetchone()
+        hit, miss, cost = (value or 0 for value in row)
+        return {
+            'hit_tokens': hit,
+            'miss_tokens': miss,
+            'hit_ratio': hit / (hit + miss) if hit + miss else 0.0,
+            'cost': cost
+        }
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None